@@ -1,7 +1,12 @@
+import asyncio
 import json
-from typing import List, Optional
+import time
+from typing import Callable, Dict, List, Optional
 
+from agent.context_window import ContextWindow
 from agent.llm_client import ChatOpenAI
+from agent.model_tiers import ESCALATE_TOOL, ModelTiers
+from agent.tool_output import RETRIEVE_TOOL, ToolOutputManager
 from mcp_core.mcp_client import MCPClient
 from utils import log_title
 from utils.ui import BaseUI
@@ -23,51 +28,140 @@ class Agent:
         session_id: str = "default",
         max_history_turns: Optional[int] = None,
         ui: Optional[BaseUI] = None,
+        stream: bool = False,
+        tool_output: Optional[ToolOutputManager] = None,
+        context_window: Optional[ContextWindow] = None,
+        prompt_layout: str = "default",
+        prompt_cache_key: bool = False,
+        escalation_clients: Optional[Callable[[], List[MCPClient]]] = None,
     ) -> None:
         self.mcp_clients = mcp_clients
         self.system_prompt = system_prompt
         self.context = context
         self.model = model
+        # the large model; turns on a smaller tier escalate to it (agent/model_tiers.py)
+        self.base_model = model
+        self.base_context_window = context_window
+        # clients offered after an escalation (main.py: every registered server)
+        self.escalation_clients = escalation_clients
+        self.escalated: Optional[str] = None
         self.llm: Optional[ChatOpenAI] = None
         self.tracer = tracer
         self.session_store = session_store
         self.session_id = session_id
         self.max_history_turns = max_history_turns
         self.ui = ui or BaseUI()
+        self.stream = stream
+        # large tool results are spilled and served through the built-in retrieve tool
+        self.tool_output = tool_output
+        self.context_window = context_window
+        self.prompt_layout = prompt_layout
+        self.prompt_cache_key = prompt_cache_key
+        # tool name -> client, built once in init(); rebuilt when a server's tool list changes
+        self._routes: Dict[str, MCPClient] = {}
+        self._route_versions: Dict[int, int] = {}
+        self._connecting: Optional[asyncio.Future] = None
+        # tool definitions offered to the LLM; kept across turns while the clients are the same
+        self._tools: Optional[List[dict]] = None
+        # history to hand to the LLM client at the next init(); None keeps its in-memory one
+        self._history: Optional[List[List[dict]]] = None
+
+    def begin_turn(
+        self,
+        mcp_clients: List[MCPClient],
+        session_id: str,
+        tracer=None,
+        model: Optional[str] = None,
+        context_window: Optional[ContextWindow] = None,
+    ) -> int:
+        """
+        Start the next turn of a session-scoped agent (main.py keeps one for the whole run).
+        The LLM client, its HTTP connections and history stay; tool routes are rebuilt only
+        when the selected clients changed. `model` runs this turn on another tier than the
+        agent's own model. Returns the number of stored history turns.
+        """
+        tiered = self._tiered
+        self.model = model or self.base_model
+        self.context_window = context_window or self.base_context_window
+        self.escalated = None
+        if [id(client) for client in mcp_clients] != [id(client) for client in self.mcp_clients]:
+            self.mcp_clients = list(mcp_clients)
+            self._tools = None
+        elif tiered != self._tiered:
+            # the escalate tool comes and goes with the tier
+            self._tools = None
+        self._connecting = None
+        self.tracer = tracer
+        self.session_id = session_id
+        if self.llm is None or self.llm.session_id != session_id:
+            # one store read per session; afterwards the history lives in the LLM client
+            self._history = (
+                self.session_store.load_turns(session_id, limit=self.max_history_turns or 0)
+                if self.session_store
+                else []
+            )
+            return len(self._history)
+        self._history = None
+        return len(self.llm.history)
+
+    def connect(self) -> asyncio.Future:
+        """
+        Start the MCP clients and build the tool routes (no LLM yet). main.py starts this
+        while RAG retrieval is still running; init() reuses the same future.
+        """
+        if self._connecting is None:
+            self._connecting = asyncio.ensure_future(self._connect())
+        return self._connecting
+
+    async def _connect(self) -> List[dict]:
+        # servers start in parallel; lazy clients with cached schemas do not spawn at all here
+        await asyncio.gather(*(client.init() for client in self.mcp_clients))
+        # 拿到所有工具, 顺便建立 tool name -> client 的路由表
+        if self._tools is None or self._routes_stale():
+            self._tools = await self._build_routes()
+        return self._tools
 
     async def init(self) -> None:
         if self.ui.enabled:
             self.ui.stage("Initialization", "in_progress")
         else:
             log_title("TOOLS")
-        for client in self.mcp_clients:
-            await client.init()
-
-        # 拿到所有工具
-        tools = []
-        for client in self.mcp_clients:
-            # the type of get_tools is a dict list
-            client_tools = await client.get_tools()
-            tools.extend(client_tools)
+        tools = await self.connect()
 
-        # 初始化 llm
-        self.llm = ChatOpenAI(
-            self.model,
-            self.system_prompt,
-            tools,
-            self.context,
-            tracer=self.tracer,
-            session_store=self.session_store,
-            session_id=self.session_id,
-            max_history_turns=self.max_history_turns,
-            ui=self.ui,
-        )
+        # 初始化 llm (once; later turns only swap in the new context and tools)
+        if self.llm is None:
+            self.llm = ChatOpenAI(
+                self.model,
+                self.system_prompt,
+                tools,
+                self.context,
+                tracer=self.tracer,
+                session_store=self.session_store,
+                session_id=self.session_id,
+                max_history_turns=self.max_history_turns,
+                ui=self.ui,
+                stream=self.stream,
+                context_window=self.context_window,
+                history=self._history,
+                prompt_layout=self.prompt_layout,
+                prompt_cache_key=self.prompt_cache_key,
+            )
+        else:
+            self.llm.model = self.model
+            self.llm.context_window = self.context_window
+            self.llm.start_turn(
+                context=self.context,
+                tools=tools,
+                tracer=self.tracer,
+                session_id=self.session_id,
+                history=self._history,
+            )
+        self._history = None
         if self.ui.enabled:
             self.ui.stage("Initialization", "completed")
 
     async def close(self) -> None:
-        for client in self.mcp_clients:
-            await client.close()
+        await asyncio.gather(*(client.close() for client in self.mcp_clients))
 
     async def invoke(self, prompt: str) -> str:
         if not self.llm:
@@ -76,21 +170,30 @@ class Agent:
         if self.ui.enabled:
             self.ui.stage("Agent Reasoning", "in_progress")
             self.ui.log("User", prompt)
+        if self.tool_output:
+            self.tool_output.reset()
 
         # 拿到的返回response里有 content 和 tool_calls
-        response = self.llm.chat(prompt)
+        # achat keeps the event loop free (MCP stdio readers, UI refresh) while the model runs
+        response = await self.llm.achat(prompt)
         while True:
             content = response.get("content", "")
             tool_calls = response.get("tool_calls", [])
+            # a smaller tier asked for more than it has: drop the reply, ask the full model
+            reason = self._escalation_reason(tool_calls)
+            if reason:
+                response = await self._escalate(reason)
+                continue
 
             # 如果有内容，先打印出来；若为空但有工具调用，打印占位
-            if content:
+            # (streamed content has already been rendered token by token)
+            if content and not response.get("streamed"):
                 if self.ui.enabled:
                     self.ui.log("Model", content)
                 else:
                     log_title("LLM OUTPUT")
                     print(f"[MODEL] {content}")
-            elif tool_calls:
+            elif tool_calls and not content:
                 if not self.ui.enabled:
                     print("[MODEL] (tool call, no content)")
             # 纯原生 Function Calling，不使用兜底策略
@@ -100,80 +203,207 @@ class Agent:
                     self.ui.stage("Tool Execution", "in_progress")
                 else:
                     print(f"[Native Function Calling] 检测到 {len(tool_calls)} 个工具调用")
-                for tool_call in tool_calls:
-                    tool_name = tool_call.name
-                    tool_args = tool_call.arguments
-                    tool_id = tool_call.id
-                    try:
-                        tool_args_dict = json.loads(tool_args) if tool_args else {}
-                    except json.JSONDecodeError:
-                        tool_args_dict = {}
-
-                    mcp = await self._find_client(tool_name)
-                    if not mcp:
-                        self.llm.append_tool_result(tool_id, "Tool not found")
-                        continue
-                    if self.ui.enabled:
-                        self.ui.tool(tool_name, tool_args_dict)
-                    else:
-                        log_title("TOOL USE")
-                        print(f"Calling tool: {tool_name}")
-                        print(f"Arguments: {self._preview(tool_args_dict)}")
-                    try:
-                        result = await mcp.call_tool(
-                            tool_name,
-                            tool_args_dict,
-                        )
-                        # Convert MCP content objects to serializable format
-                        if isinstance(result, list):
-                            serialized_result = []
-                            for item in result:
-                                if hasattr(item, 'text'):
-                                    serialized_result.append(item.text)
-                                elif hasattr(item, 'model_dump'):
-                                    serialized_result.append(item.model_dump())
-                                else:
-                                    serialized_result.append(str(item))
-                            result = serialized_result
-                    except Exception as exc:
-                        result = {"error": str(exc)}
-                    if self.ui.enabled:
-                        preview = self._preview(result)
-                        self.ui.detail(f"Result: {tool_name}", preview)
-                        self.ui.tool(tool_name, tool_args_dict, preview)
-                    else:
-                        print(f"Result (preview): {self._preview(result)}")
-                    if self.tracer:
-                        self.tracer.log_event(
-                            {
-                                "type": "tool_call",
-                                "tool": tool_name,
-                                "args": tool_args_dict,
-                                "result": result,
-                            }
-                        )
-                    self.llm.append_tool_result(tool_id, json.dumps(result))
+                # independent calls run concurrently (bounded per server by MCPClient);
+                # results are appended in the original tool_call order
+                started = time.perf_counter()
+                outcomes = await asyncio.gather(*(self._run_tool_call(tc) for tc in tool_calls))
+                for tool_call, (output, _) in zip(tool_calls, outcomes):
+                    self.llm.append_tool_result(tool_call.id, output)
+                if self.tracer and len(tool_calls) > 1:
+                    self.tracer.log_event(
+                        {
+                            "type": "tool_batch",
+                            "count": len(tool_calls),
+                            "wall_ms": round((time.perf_counter() - started) * 1000.0, 2),
+                            "sum_ms": round(sum(ms for _, ms in outcomes), 2),
+                        }
+                    )
+                self._offer_retrieve()
                 if self.ui.enabled:
                     self.ui.stage("Tool Execution", "completed")
                     self.ui.stage("Agent Reasoning", "in_progress")
-                response = self.llm.chat()
+                response = await self.llm.achat()
                 continue
             if self.ui.enabled:
                 self.ui.stage("Agent Reasoning", "completed")
                 self.ui.stage("Final Response", "completed")
             return content
 
+    async def _run_tool_call(self, tool_call):
+        """
+        Execute one tool call; returns (tool message content, duration in ms). Never raises,
+        so one failing call does not cancel its siblings in the batch.
+        """
+        tool_name = tool_call.name
+        tool_args = tool_call.arguments
+        try:
+            tool_args_dict = json.loads(tool_args) if tool_args else {}
+        except json.JSONDecodeError:
+            tool_args_dict = {}
+
+        builtin = self.tool_output is not None and tool_name == RETRIEVE_TOOL
+        mcp = None if builtin else await self._find_client(tool_name)
+        if not mcp and not builtin:
+            return "Tool not found", 0.0
+        if self.ui.enabled:
+            self.ui.tool(tool_name, tool_args_dict)
+        else:
+            log_title("TOOL USE")
+            print(f"Calling tool: {tool_name}")
+            print(f"Arguments: {self._preview(tool_args_dict)}")
+        started = time.perf_counter()
+        meta = {}
+        try:
+            if builtin:
+                result = self.tool_output.retrieve(
+                    str(tool_args_dict.get("handle", "")),
+                    str(tool_args_dict.get("query", "")),
+                    tool_args_dict.get("top_k"),
+                )
+            else:
+                result, meta = await mcp.call_tool_with_stats(
+                    tool_name,
+                    tool_args_dict,
+                )
+            # Convert MCP content objects to serializable format
+            if isinstance(result, list):
+                serialized_result = []
+                for item in result:
+                    if hasattr(item, 'text'):
+                        serialized_result.append(item.text)
+                    elif hasattr(item, 'model_dump'):
+                        serialized_result.append(item.model_dump())
+                    else:
+                        serialized_result.append(str(item))
+                result = serialized_result
+        except Exception as exc:
+            result = {"error": str(exc)}
+        # keep large results out of the prompt: the model gets a handle + preview instead
+        spilled = None
+        if self.tool_output and not builtin and not (isinstance(result, dict) and "error" in result):
+            spilled = self.tool_output.maybe_spill(tool_name, tool_args_dict, result)
+        duration_ms = (time.perf_counter() - started) * 1000.0
+        if self.ui.enabled:
+            preview = self._preview(result)
+            self.ui.detail(f"Result: {tool_name}", preview)
+            self.ui.tool(tool_name, tool_args_dict, preview)
+        else:
+            print(f"Result ({tool_name}, preview): {self._preview(result)}")
+        if self.tracer:
+            self.tracer.log_event(
+                {
+                    "type": "tool_call",
+                    "tool": tool_name,
+                    "args": tool_args_dict,
+                    "result": result,
+                    "duration_ms": round(duration_ms, 2),
+                    "cache": meta.get("cache"),
+                    "queue_ms": meta.get("queue_ms"),
+                    "session": meta.get("session"),
+                    "spilled": spilled["handle"] if spilled else None,
+                }
+            )
+        return json.dumps(spilled or result), duration_ms
+
+    @property
+    def _tiered(self) -> bool:
+        return self.model != self.base_model
+
+    def _escalation_reason(self, tool_calls) -> Optional[str]:
+        """
+        Why a smaller tier cannot go on with these tool calls (None when it can).
+        """
+        if not tool_calls or not self._tiered:
+            return None
+        for tool_call in tool_calls:
+            if tool_call.name == ESCALATE_TOOL:
+                return "requested"
+            builtin = self.tool_output is not None and tool_call.name == RETRIEVE_TOOL
+            if not builtin and tool_call.name not in self._routes:
+                return f"unknown_tool:{tool_call.name}"
+            try:
+                json.loads(tool_call.arguments or "{}")
+            except json.JSONDecodeError:
+                return f"bad_arguments:{tool_call.name}"
+        return None
+
+    async def _escalate(self, reason: str) -> dict:
+        """
+        Drop the smaller tier's reply and ask again with the agent's own model and the
+        escalation clients.
+        """
+        previous = self.model
+        self.llm.retract_reply()
+        self.model = self.llm.model = self.base_model
+        self.context_window = self.llm.context_window = self.base_context_window
+        self.escalated = reason
+        if self.escalation_clients:
+            self.mcp_clients = list(self.escalation_clients())
+        self._tools = None
+        self._connecting = None
+        self.llm.tools = await self.connect()
+        self._offer_retrieve()
+        if self.tracer:
+            self.tracer.log_event(
+                {
+                    "type": "model_escalation",
+                    "from": previous,
+                    "to": self.model,
+                    "reason": reason,
+                    "tools": len(self.llm.tools),
+                }
+            )
+        if self.ui.enabled:
+            self.ui.log("System", f"Escalating to {self.model} ({reason})")
+        else:
+            print(f"[Model Tier] {previous} -> {self.model} ({reason})")
+        return await self.llm.achat()
+
+    def _offer_retrieve(self) -> None:
+        """
+        Offer the built-in retrieve tool once a result of this turn has been spilled; before
+        that it could only fail, and plain turns would carry its schema for nothing.
+        """
+        if not self.tool_output or not self.tool_output.spilled:
+            return
+        if any(tool["name"] == RETRIEVE_TOOL for tool in self.llm.tools):
+            return
+        self.llm.tools = self.llm.tools + [ToolOutputManager.tool_schema()]
+
     def flush_history(self) -> None:
         if self.llm and hasattr(self.llm, "flush_history"):
             self.llm.flush_history()
 
-    async def _find_client(self, tool_name: str) -> Optional[MCPClient]:
+    async def _build_routes(self) -> List[dict]:
+        """
+        Collect all tools and map each name to its client (first server wins on clashes).
+        """
+        tools: List[dict] = []
+        routes: Dict[str, MCPClient] = {}
         for client in self.mcp_clients:
-            tools = await client.get_tools()
-            for tool in tools:
-                if tool["name"] == tool_name:
-                    return client
-        return None
+            # the type of get_tools is a dict list (cached by the client)
+            client_tools = await client.get_tools()
+            self._route_versions[id(client)] = client.tools_version
+            for tool in client_tools:
+                routes.setdefault(tool["name"], client)
+            tools.extend(client_tools)
+        if self._tiered:
+            tools.append(ModelTiers.tool_schema())
+        self._routes = routes
+        return tools
+
+    def _routes_stale(self) -> bool:
+        return any(client.tools_version != self._route_versions.get(id(client)) for client in self.mcp_clients)
+
+    async def _find_client(self, tool_name: str) -> Optional[MCPClient]:
+        if self._routes_stale():
+            # a server announced tools/list_changed: refresh routes and the tools offered to the LLM
+            tools = self._tools = await self._build_routes()
+            if self.llm:
+                self.llm.tools = tools
+            if self.tracer:
+                self.tracer.log_event({"type": "tool_routes_rebuilt", "tools": len(tools)})
+        return self._routes.get(tool_name)
 
     @staticmethod
     def _preview(data: object, limit: int = 400) -> str:
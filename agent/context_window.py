@@ -0,0 +1,115 @@
+"""
+Keeps each request's messages within the model's context budget.
+
+budget = max_tokens - reserve_output - tokens of the tool definitions
+
+When the conversation is over budget, a trimmed copy is sent (the stored messages and the
+session history are left untouched):
+1. tool outputs, oldest first, are cut down to a head/tail excerpt of `tool_output_keep_tokens`;
+   the latest tool batch (results the model has not seen yet) is never trimmed here;
+2. then the oldest history turns are dropped, whole turns at a time so every tool message
+   keeps its assistant tool_calls message;
+3. the system prompt, RAG context and the current turn are always kept.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.tokens import context_window_for, count_message, count_text, tokenizer_name
+
+_REPLY_PRIMING = 3
+
+
+class ContextWindow:
+    def __init__(
+        self,
+        model: str,
+        max_tokens: Optional[int] = None,
+        reserve_output: int = 8192,
+        tool_output_keep_tokens: int = 256,
+    ) -> None:
+        self.model = model
+        self.max_tokens = max_tokens or context_window_for(model)
+        self.reserve_output = reserve_output
+        self.tool_output_keep_tokens = tool_output_keep_tokens
+
+    @classmethod
+    def from_config(cls, model: str, cfg: Optional[dict] = None) -> Optional["ContextWindow"]:
+        cfg = cfg or {}
+        if not cfg.get("enabled", True):
+            return None
+        # per-model budgets: {"max_tokens": {"gpt-5": 200000, "qwen2.5": 32768}}
+        max_tokens = cfg.get("max_tokens")
+        if isinstance(max_tokens, dict):
+            max_tokens = max_tokens.get(model)
+        return cls(
+            model,
+            max_tokens=max_tokens,
+            reserve_output=cfg.get("reserve_output", 8192),
+            tool_output_keep_tokens=cfg.get("tool_output_keep_tokens", 256),
+        )
+
+    def fit(
+        self,
+        messages: List[Dict[str, Any]],
+        history_spans: List[Tuple[int, int]],
+        extra_tokens: int = 0,
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Return (messages to send, report). `history_spans` are [start, end) index ranges of
+        the preloaded history turns, oldest first; `extra_tokens` covers the tool definitions.
+        """
+        budget = self.max_tokens - self.reserve_output - extra_tokens
+        counts = [count_message(message, self.model) for message in messages]
+        before = sum(counts) + _REPLY_PRIMING
+        total = before
+        view = list(messages)
+        trimmed = 0
+        dropped_turns = 0
+
+        if total > budget:
+            # results after the last assistant message are the ones the model is about to read
+            last_assistant = max(
+                (i for i, message in enumerate(messages) if message.get("role") == "assistant"), default=-1
+            )
+            for i, message in enumerate(messages):
+                if total <= budget:
+                    break
+                if i >= last_assistant or message.get("role") != "tool":
+                    continue
+                if counts[i] <= self.tool_output_keep_tokens * 2:
+                    continue
+                view[i] = {**message, "content": self._excerpt(str(message.get("content") or ""), counts[i])}
+                new_count = count_message(view[i], self.model)
+                total -= counts[i] - new_count
+                counts[i] = new_count
+                trimmed += 1
+
+        dropped = set()
+        for start, end in history_spans:
+            if total <= budget:
+                break
+            dropped.update(range(start, end))
+            total -= sum(counts[start:end])
+            dropped_turns += 1
+        if dropped:
+            view = [message for i, message in enumerate(view) if i not in dropped]
+
+        report = {
+            "tokenizer": tokenizer_name(self.model),
+            "budget": budget,
+            "max_tokens": self.max_tokens,
+            "tools_tokens": extra_tokens,
+            "tokens_before": before,
+            "tokens_after": total,
+            "trimmed_tool_outputs": trimmed,
+            "dropped_history_turns": dropped_turns,
+            "over_budget": total > budget,
+        }
+        return view, report
+
+    def _excerpt(self, text: str, tokens: int) -> str:
+        # keep_tokens worth of characters, split 2:1 between head and tail
+        keep_chars = max(1, int(len(text) * self.tool_output_keep_tokens / max(tokens, 1)))
+        head = keep_chars * 2 // 3
+        tail = keep_chars - head
+        omitted = count_text(text[head : len(text) - tail], self.model)
+        return f"{text[:head]}\n...[{omitted} tokens of earlier tool output trimmed to fit the context window]...\n{text[len(text) - tail:]}"
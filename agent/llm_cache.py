@@ -0,0 +1,203 @@
+"""
+Persistent cache of LLM responses (SQLite), shared by ChatOpenAI and SimpleLLMClient.
+
+Keyed by a SHA-256 of the request that actually goes out: model, messages, tools and
+response_format. Modes:
+
+- "cache":  serve fresh hits, call the API on a miss and store the answer (TTL + LRU bound)
+- "record": always call the API and store every answer (builds a recording of a run)
+- "replay": only serve stored answers, ignoring TTL; a miss raises LLMReplayMiss, so a
+            recorded scenario replays the whole agent loop offline and deterministically
+            (tool call ids are stored too, so every later request hashes the same again)
+
+Config (user config):
+
+    "llm": { "cache": { "mode": "cache", "path": "data/llm_cache.db", "ttl_s": 86400, "max_entries": 5000 } }
+
+or the environment: LLM_CACHE_MODE=replay LLM_CACHE_PATH=data/scenario.db.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from agent.resilience import LLMCallError
+
+MODES = ("cache", "record", "replay")
+
+
+class LLMReplayMiss(LLMCallError):
+    """
+    Replay mode got a request that was never recorded. An LLMCallError, so it is handled
+    like an upstream failure: the rewriter and router fall back, the turn is reported failed.
+    """
+
+    def __init__(self, message: str) -> None:
+        RuntimeError.__init__(self, message)
+        self.stage = "replay"
+        self.attempts = 0
+        self.cause = None
+
+
+def request_key(request_args: Dict[str, Any]) -> str:
+    material = {
+        "model": request_args.get("model"),
+        "messages": request_args.get("messages"),
+        "tools": request_args.get("tools"),
+        "response_format": request_args.get("response_format"),
+    }
+    raw = json.dumps(material, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(
+        self,
+        path: Path,
+        mode: str = "cache",
+        ttl_s: Optional[float] = None,
+        max_entries: int = 5000,
+    ) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unsupported LLM cache mode '{mode}' (use one of {', '.join(MODES)})")
+        self.path = Path(path)
+        self.mode = mode
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._init_db()
+
+    @classmethod
+    def from_config(cls, cfg: Optional[dict] = None) -> Optional["LLMCache"]:
+        cfg = dict(cfg or {})
+        mode = os.environ.get("LLM_CACHE_MODE") or cfg.get("mode")
+        if not mode or mode == "off":
+            return None
+        return cls(
+            Path(os.environ.get("LLM_CACHE_PATH") or cfg.get("path", "data/llm_cache.db")),
+            mode=mode,
+            ttl_s=cfg.get("ttl_s"),
+            max_entries=cfg.get("max_entries", 5000),
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _init_db(self) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    response_json TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache (last_access)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, request_args: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Stored response {"content", "tool_calls": [{"id", "name", "arguments"}], "usage"} or None.
+        Replay mode raises LLMReplayMiss instead of returning None.
+        """
+        if self.mode == "record":
+            return None
+        key = request_key(request_args)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT response_json, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                fresh = row is not None and (
+                    self.mode == "replay" or not self.ttl_s or now - row[1] <= self.ttl_s
+                )
+                if fresh:
+                    conn.execute("UPDATE llm_cache SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+                elif row is not None:
+                    conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                conn.commit()
+            finally:
+                conn.close()
+        if fresh:
+            self.hits += 1
+            return json.loads(row[0])
+        self.misses += 1
+        if self.mode == "replay":
+            raise LLMReplayMiss(
+                f"No recorded response for this {request_args.get('model')} request in {self.path} "
+                "(re-record the scenario with mode 'record')"
+            )
+        return None
+
+    def put(
+        self,
+        request_args: Dict[str, Any],
+        content: str,
+        tool_calls: Optional[List[Dict[str, str]]] = None,
+        usage: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        if self.mode == "replay":
+            return
+        key = request_key(request_args)
+        payload = json.dumps({"content": content, "tool_calls": tool_calls or [], "usage": usage}, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    """
+                    INSERT OR REPLACE INTO llm_cache (key, model, response_json, created_at, last_access, hits)
+                    VALUES (?, ?, ?, ?, ?, 0)
+                    """,
+                    (key, request_args.get("model"), payload, now, now),
+                )
+                if self.max_entries and self.mode == "cache":
+                    # least recently used entries beyond the bound
+                    conn.execute(
+                        """
+                        DELETE FROM llm_cache WHERE key IN (
+                            SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                        )
+                        """,
+                        (self.max_entries,),
+                    )
+                conn.commit()
+            finally:
+                conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+# process-wide cache used by every LLM client that is not given one explicitly
+_default_cache: Optional[LLMCache] = None
+
+
+def set_llm_cache(cache: Optional[LLMCache]) -> None:
+    global _default_cache
+    _default_cache = cache
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    return _default_cache
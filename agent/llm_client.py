@@ -1,17 +1,215 @@
+import asyncio
+import hashlib
+import json
 import os
-from typing import Any, Dict, List, Optional
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, BadRequestError, OpenAI
 
+from agent import resilience
+from agent.context_window import ContextWindow
+from agent.llm_cache import LLMCache, get_llm_cache, request_key
 from utils import ToolCall, log_title
+from utils.tokens import count_messages, count_text, count_tools
+from utils.rate_limit import COALESCER, limiter_for
+from utils.usage import record_usage, usage_from
 from utils.ui import BaseUI
-from utils.tracer import RunTracer
+from utils.tracer import RunTracer, span
 from utils.session_store import SessionStore
 
 
+# default per-request timeout (seconds); override per client or with LLM_TIMEOUT
+DEFAULT_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "120"))
+
+# AsyncOpenAI clients keyed by (event loop, base_url, api_key, timeout) so every agent,
+# router and rewriter in a process shares one connection pool per endpoint.
+_async_clients: Dict[Tuple[int, Optional[str], str, float], AsyncOpenAI] = {}
+
+
+def _resolve_endpoint(base_url: Optional[str], api_key: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    # Support either cloud (OpenAI-compatible) or local (e.g., Ollama) endpoints.
+    resolved_base_url = (
+        base_url
+        or os.environ.get("OPENAI_BASE_URL")
+        or os.environ.get("OLLAMA_BASE_URL")
+    )
+    resolved_api_key = api_key or os.environ.get("OPENAI_API_KEY")
+    if not resolved_api_key and resolved_base_url:
+        resolved_api_key = "ollama"
+    return resolved_base_url, resolved_api_key
+
+
+def _timeout(timeout: float) -> httpx.Timeout:
+    # fail fast on connect; the read budget covers long generations
+    return httpx.Timeout(timeout, connect=min(10.0, timeout))
+
+
+def get_async_client(base_url: Optional[str], api_key: str, timeout: float = DEFAULT_TIMEOUT) -> AsyncOpenAI:
+    """
+    Shared AsyncOpenAI client for the running event loop. httpx connections are bound to
+    the loop that opened them, hence the loop in the key.
+    """
+    loop = asyncio.get_running_loop()
+    key = (id(loop), base_url, api_key, float(timeout))
+    client = _async_clients.get(key)
+    if client is None:
+        # drop clients of loops that have been closed (e.g. earlier asyncio.run calls)
+        for stale_key in [k for k, c in _async_clients.items() if k[0] != id(loop)]:
+            _async_clients.pop(stale_key, None)
+        client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=_timeout(timeout),
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                timeout=_timeout(timeout),
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=16),
+            ),
+        )
+        _async_clients[key] = client
+    return client
+
+
+async def close_async_clients() -> None:
+    """
+    Close the pooled clients of the running loop (call before the loop shuts down).
+    """
+    loop_id = id(asyncio.get_running_loop())
+    for key in [k for k in _async_clients if k[0] == loop_id]:
+        client = _async_clients.pop(key)
+        await client.close()
+
+
+def _request_tokens(request_args: Dict[str, Any]) -> int:
+    model = request_args.get("model", "")
+    return count_messages(request_args["messages"], model) + count_tools(request_args.get("tools"), model)
+
+
+def _total_tokens(response: Any) -> Optional[int]:
+    return getattr(getattr(response, "usage", None), "total_tokens", None)
+
+
+def _limited(base_url: Optional[str], request_args: Dict[str, Any], create):
+    """
+    create() through the endpoint's rate limiter (utils/rate_limit.py), if one is configured.
+    """
+    limiter = limiter_for(base_url, request_args.get("model"))
+    if limiter is None:
+        return create()
+    return limiter.call(_request_tokens(request_args), create, _total_tokens)
+
+
+async def _alimited(base_url: Optional[str], request_args: Dict[str, Any], create):
+    limiter = limiter_for(base_url, request_args.get("model"))
+    if limiter is None:
+        return await create()
+    return await limiter.acall(_request_tokens(request_args), create, _total_tokens)
+
+
+class _StreamAssembler:
+    """
+    Folds chat.completion.chunk deltas into (content, tool_calls) while rendering content
+    incrementally and timing the stream.
+    """
+
+    def __init__(self, ui: BaseUI) -> None:
+        self.ui = ui
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.content_parts: List[str] = []
+        self.calls: Dict[int, Dict[str, str]] = {}
+        self.usage = None
+        self.chunks = 0
+        self.started_output = False
+
+    def feed(self, chunk: Any) -> None:
+        if getattr(chunk, "usage", None):
+            self.usage = chunk.usage
+        if not chunk.choices:
+            return
+        delta = chunk.choices[0].delta
+        if delta is None:
+            return
+        if delta.content:
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            self.chunks += 1
+            self.content_parts.append(delta.content)
+            if not self.started_output:
+                self.started_output = True
+                if self.ui.enabled:
+                    self.ui.stream_start("Model")
+                else:
+                    log_title("LLM OUTPUT")
+                    print("[MODEL] ", end="", flush=True)
+            if self.ui.enabled:
+                self.ui.stream_delta(delta.content)
+            else:
+                print(delta.content, end="", flush=True)
+        for call_delta in delta.tool_calls or []:
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            self.chunks += 1
+            # arguments arrive as string fragments keyed by the call's index
+            entry = self.calls.setdefault(call_delta.index, {"id": "", "name": "", "arguments": ""})
+            if call_delta.id:
+                entry["id"] = call_delta.id
+            function = call_delta.function
+            if function is not None:
+                if function.name and not entry["name"]:
+                    entry["name"] = function.name
+                if function.arguments:
+                    entry["arguments"] += function.arguments
+
+    def close_output(self) -> None:
+        if self.started_output:
+            if self.ui.enabled:
+                self.ui.stream_end()
+            else:
+                print()
+
+    def result(self):
+        finished = time.perf_counter()
+        tool_calls = [
+            ToolCall(id=entry["id"], name=entry["name"], arguments=entry["arguments"])
+            for _, entry in sorted(self.calls.items())
+        ]
+        # without a usage chunk, count streamed deltas (about one token each)
+        completion_tokens = getattr(self.usage, "completion_tokens", None) or self.chunks
+        first = self.first_token_at
+        generation_s = finished - first if first is not None else 0.0
+        stats = {
+            "ttft_ms": round((first - self.started) * 1000.0, 2) if first is not None else None,
+            "duration_ms": round((finished - self.started) * 1000.0, 2),
+            "completion_tokens": completion_tokens,
+            "tokens_per_s": round(completion_tokens / generation_s, 2) if generation_s > 0 else None,
+            "usage_reported": self.usage is not None,
+        }
+        return "".join(self.content_parts), tool_calls, stats
+
+
+def _parse_completion(response: Any):
+    choice = response.choices[0].message
+    content = choice.content or ""
+    tool_calls = [
+        ToolCall(
+            id=tool_call.id or "",
+            name=tool_call.function.name,
+            arguments=tool_call.function.arguments,
+        )
+        for tool_call in choice.tool_calls or []
+    ]
+    return content, tool_calls
+
+
 class ChatOpenAI:
     """
     Minimal wrapper around the OpenAI Chat Completions API with tool support.
+
+    `chat()` is blocking; `achat()` is the same turn on a shared AsyncOpenAI pool, so the
+    agent loop does not stall the event loop (MCP stdio readers, UI refresh, other agents).
     """
 
     def __init__(
@@ -27,21 +225,27 @@ class ChatOpenAI:
         session_id: Optional[str] = None,
         max_history_turns: Optional[int] = None,
         ui: Optional[BaseUI] = None,
+        stream: bool = False,
+        timeout: float = DEFAULT_TIMEOUT,
+        context_window: Optional[ContextWindow] = None,
+        stage: str = "agent",
+        cache: Optional[LLMCache] = None,
+        history: Optional[List[List[Dict[str, Any]]]] = None,
+        prompt_layout: str = "default",
+        prompt_cache_key: bool = False,
     ) -> None:
-        # Support either cloud (OpenAI-compatible) or local (e.g., Ollama) endpoints.
-        resolved_base_url = (
-            base_url
-            or os.environ.get("OPENAI_BASE_URL")
-            or os.environ.get("OLLAMA_BASE_URL")
-        )
-        resolved_api_key = api_key or os.environ.get("OPENAI_API_KEY")
-        if not resolved_api_key and resolved_base_url:
-            resolved_api_key = "ollama"
+        resolved_base_url, resolved_api_key = _resolve_endpoint(base_url, api_key)
         if not resolved_api_key:
             raise RuntimeError("OPENAI_API_KEY must be set (or provide api_key manually)")
+        self.base_url = resolved_base_url
+        self.api_key = resolved_api_key
+        self.timeout = timeout
         self.client = OpenAI(
             api_key=resolved_api_key,
             base_url=resolved_base_url,
+            timeout=_timeout(timeout),
+            # retries are handled per stage by agent/resilience.py
+            max_retries=0,
         )
         self.model = model
         self.messages: List[Dict[str, Any]] = []
@@ -51,24 +255,149 @@ class ChatOpenAI:
         self.session_id = session_id or "default"
         self.max_history_turns = max_history_turns if max_history_turns and max_history_turns > 0 else None
         self.ui = ui or BaseUI()
+        # stream=True renders content as it arrives instead of after the whole completion
+        self.stream = stream
+        # some OpenAI-compatible servers reject stream_options; remembered after the first 400
+        self._stream_usage_supported = True
+        # usage of every call is recorded under this stage (see utils/usage.py)
+        self.stage = stage
+        self._last_usage: Any = None
+        self._last_request_messages: Optional[List[Dict[str, Any]]] = None
+        # response cache (agent/llm_cache.py); None falls back to the process-wide one
+        self.cache = cache
+        self._cache_status: Optional[str] = None
+        # token budget per request; None sends self.messages as is
+        self.context_window = context_window
+        self._window_report: Optional[Dict[str, Any]] = None
+        # [start, end) of each preloaded history turn in self.messages, oldest first
+        self._history_spans: List[Tuple[int, int]] = []
         # buffer for current turn
         self._pending_turn: List[Dict[str, Any]] = []
+        self.system_prompt = system_prompt
+        # provider prompt caching matches on the longest byte-identical request prefix
+        # (tools, system, history). "stable" also trims history in blocks so that prefix
+        # survives several turns; prompt_cache_key routes requests sharing it together.
+        self.prompt_layout = prompt_layout
+        self.prompt_cache_key = prompt_cache_key
+        self._tools_frozen: Optional[Tuple[Any, List[Dict[str, Any]], str]] = None
+        # completed turns of the session, oldest first; kept in memory and written through
+        # to the session store by flush_history()
+        self.history: List[List[Dict[str, Any]]] = []
+        if history is not None:
+            self.history = list(history)
+        elif self.session_store:
+            self.history = self.session_store.load_turns(self.session_id, limit=self.max_history_turns or 0)
+        self._build_messages(context)
+
+    def start_turn(
+        self,
+        context: str = "",
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tracer: Optional[RunTracer] = None,
+        session_id: Optional[str] = None,
+        history: Optional[List[List[Dict[str, Any]]]] = None,
+    ) -> None:
+        """
+        Reuse this client for the next turn of a long-lived agent: the HTTP client and the
+        in-memory history are kept, only the tools, the RAG context and the tracer change.
+        Switching session_id swaps in that session's `history` (loaded from the store if None).
+        """
+        if session_id is not None and session_id != self.session_id:
+            self.session_id = session_id
+            if history is None and self.session_store:
+                history = self.session_store.load_turns(session_id, limit=self.max_history_turns or 0)
+            self.history = list(history or [])
+        if tools is not None:
+            self.tools = tools
+        self.tracer = tracer
+        self._pending_turn.clear()
+        self._window_report = None
+        self._build_messages(context)
+
+    def _build_messages(self, context: str) -> None:
+        self.messages = []
+        self._history_spans = []
         # system prompt first
         # 消息最开始一定是 system prompt
-        if system_prompt:
-            self.messages.append({"role": "system", "content": system_prompt})
+        if self.system_prompt:
+            self.messages.append({"role": "system", "content": self.system_prompt})
         # preload history turns (after system, before new context); each turn is a list of messages
         # 给消息列表先加载历史对话
-        if self.session_store:
-            turns = self.session_store.load_turns(self.session_id, limit=self.max_history_turns or 0)
-            for turn in turns:
-                self.messages.extend(turn)
+        for turn in self.history:
+            self._history_spans.append((len(self.messages), len(self.messages) + len(turn)))
+            self.messages.extend(turn)
         # current run context (e.g., RAG)
         # 消息列表再加入rag的上下文
         if context:
             self.messages.append({"role": "user", "content": context})
 
     def chat(self, prompt: Optional[str] = None) -> Dict[str, Any]:
+        with span("llm.chat", model=self.model, stream=self.stream) as current:
+            self._begin_turn(prompt)
+            request_args = self._request_args()
+            cached = self._cache_get(request_args)
+            if cached is not None:
+                content, tool_calls = cached
+                stream_stats = None
+            elif self.stream:
+                content, tool_calls, stream_stats = self._complete_streaming(request_args)
+            else:
+                content, tool_calls = self._complete(request_args)
+                stream_stats = None
+            self._cache_put(request_args, content, tool_calls, current)
+            return self._finish_turn(content, tool_calls, stream_stats)
+
+    async def achat(self, prompt: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Async variant of chat(); cancelling the awaiting task aborts the HTTP request.
+        """
+        with span("llm.chat", model=self.model, stream=self.stream) as current:
+            self._begin_turn(prompt)
+            request_args = self._request_args()
+            cached = self._cache_get(request_args)
+            if cached is not None:
+                content, tool_calls = cached
+                stream_stats = None
+            elif self.stream:
+                content, tool_calls, stream_stats = await self._acomplete_streaming(request_args)
+            else:
+                content, tool_calls = await self._acomplete(request_args)
+                stream_stats = None
+            self._cache_put(request_args, content, tool_calls, current)
+            return self._finish_turn(content, tool_calls, stream_stats)
+
+    def _cache_get(self, request_args: Dict[str, Any]) -> Optional[Tuple[str, List[ToolCall]]]:
+        cache = self.cache or get_llm_cache()
+        self._cache_status = None
+        if cache is None:
+            return None
+        stored = cache.get(request_args)
+        if stored is None:
+            self._cache_status = "record" if cache.mode == "record" else "miss"
+            return None
+        self._cache_status = "hit"
+        tool_calls = [ToolCall(**call) for call in stored.get("tool_calls") or []]
+        return stored.get("content") or "", tool_calls
+
+    def _cache_put(self, request_args: Dict[str, Any], content: str, tool_calls: List[ToolCall], current: Any) -> None:
+        if current is not None and self._cache_status:
+            current.set(cache=self._cache_status)
+        if self._cache_status not in ("miss", "record"):
+            return
+        cache = self.cache or get_llm_cache()
+        cache.put(request_args, content, [call.__dict__ for call in tool_calls], usage_from(self._last_usage))
+
+    def retract_reply(self) -> None:
+        """
+        Forget the last assistant reply of the current turn, so the next achat() asks again
+        (e.g. with another model).
+        """
+        if self.messages and self.messages[-1].get("role") == "assistant":
+            self.messages.pop()
+        if self._pending_turn and self._pending_turn[-1].get("role") == "assistant":
+            self._pending_turn.pop()
+
+    def _begin_turn(self, prompt: Optional[str]) -> None:
         if prompt:
             user_msg = {"role": "user", "content": prompt}
             # 消息列表最后加入用户的 prompt
@@ -80,35 +409,27 @@ class ChatOpenAI:
             # 这里先加入用户query
             self._pending_turn.append(user_msg)
 
-        
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=self.messages,
-            # tools 是用来定义可用的工具, 
-            tools=self._get_tools_definition() or None,
-        )
-
-        choice = response.choices[0].message
-        content = choice.content or ""
-        tool_calls = [
-            ToolCall(
-                id=tool_call.id or "",
-                name=tool_call.function.name,
-                arguments=tool_call.function.arguments,
-            )
-            for tool_call in choice.tool_calls or []
-        ]
-
+    def _finish_turn(self, content: str, tool_calls: List[ToolCall], stream_stats: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        usage = self._record_usage(content, tool_calls, stream_stats)
         if self.tracer:
-            self.tracer.log_event(
-                {
-                    "type": "llm_call",
-                    "model": self.model,
-                    "messages": self.messages,
-                    "tool_calls": [tc.__dict__ for tc in tool_calls],
-                    "response_content": content,
-                }
-            )
+            event: Dict[str, Any] = {
+                "type": "llm_call",
+                "model": self.model,
+                "messages": self.messages,
+                "tool_calls": [tc.__dict__ for tc in tool_calls],
+                "response_content": content,
+            }
+            if stream_stats:
+                event["stream"] = stream_stats
+            if self._window_report:
+                event["context_window"] = self._window_report
+            if self._cache_status:
+                event["cache"] = self._cache_status
+            event["usage"] = usage
+            prompt_cache = self._prompt_cache_report(usage)
+            if prompt_cache:
+                event["prompt_cache"] = prompt_cache
+            self.tracer.log_event(event)
 
         # 👇是为了在后续的对话中保留上下文和工具调用结果
         assistant_message: Dict[str, Any] = {"role": "assistant", "content": content}
@@ -133,7 +454,135 @@ class ChatOpenAI:
         # 这条消息也放到 pending_turn 里，等会儿 flush_history 的时候会一起存储
         self._pending_turn.append(assistant_message)
 
-        return {"content": content, "tool_calls": tool_calls}
+        # cached answers were not rendered while arriving, so the caller prints them
+        streamed = self.stream and self._cache_status != "hit"
+        return {"content": content, "tool_calls": tool_calls, "streamed": streamed}
+
+    def _record_usage(
+        self, content: str, tool_calls: List[ToolCall], stream_stats: Optional[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        usage, self._last_usage = self._last_usage, None
+        if self._cache_status == "hit":
+            # served from the response cache: no tokens were spent
+            return None
+        if usage is not None:
+            return record_usage(self.stage, self.model, usage)
+        # no usage block (e.g. a server that rejects stream_options): estimate locally
+        completion = (stream_stats or {}).get("completion_tokens") or count_text(
+            content + "".join(call.arguments for call in tool_calls), self.model
+        )
+        estimate = {
+            "prompt_tokens": count_messages(self._last_request_messages or self.messages, self.model),
+            "completion_tokens": completion,
+            "cached_tokens": 0,
+        }
+        return record_usage(self.stage, self.model, {**estimate, "estimated": True}, estimated=True)
+
+    def _request_args(self) -> Dict[str, Any]:
+        # tools 是用来定义可用的工具, 
+        tools = self._get_tools_definition() or None
+        messages = self.messages
+        if self.context_window:
+            # old tool outputs / history turns are trimmed in the request copy only
+            messages, self._window_report = self.context_window.fit(
+                self.messages, self._history_spans, count_tools(tools, self.model)
+            )
+        self._last_request_messages = messages
+        request_args = {
+            "model": self.model,
+            "messages": messages,
+            "tools": tools,
+        }
+        if self.prompt_cache_key:
+            request_args["prompt_cache_key"] = f"jarvis-{self._prefix_hash()}"
+        return request_args
+
+    def _complete(self, request_args: Dict[str, Any]):
+        # deadline / retries per stage (agent/resilience.py)
+        response = resilience.call(
+            self.stage,
+            lambda timeout: _limited(
+                self.base_url,
+                request_args,
+                lambda: self.client.chat.completions.create(**request_args, **resilience.timeout_arg(timeout)),
+            ),
+        )
+        self._last_usage = getattr(response, "usage", None)
+        return _parse_completion(response)
+
+    async def _acomplete(self, request_args: Dict[str, Any]):
+        client = get_async_client(self.base_url, self.api_key, self.timeout)
+        # may hedge: a second identical request when this one runs past the stage's p95
+        response = await resilience.acall(
+            self.stage,
+            lambda timeout: _alimited(
+                self.base_url,
+                request_args,
+                lambda: client.chat.completions.create(**request_args, **resilience.timeout_arg(timeout)),
+            ),
+        )
+        self._last_usage = getattr(response, "usage", None)
+        return _parse_completion(response)
+
+    def _complete_streaming(self, request_args: Dict[str, Any]):
+        """
+        Same request with stream=True: content deltas are rendered as they arrive and
+        tool-call deltas are assembled by index. Returns (content, tool_calls, stats).
+        Opening the stream is retried; once content is rendered it is not.
+        """
+        assembler = _StreamAssembler(self.ui)
+        request_args = {**request_args, "stream": True}
+
+        def create(timeout: Optional[float]):
+            if self._stream_usage_supported:
+                try:
+                    return self.client.chat.completions.create(
+                        **request_args, stream_options={"include_usage": True}, **resilience.timeout_arg(timeout)
+                    )
+                except BadRequestError:
+                    self._stream_usage_supported = False
+            return self.client.chat.completions.create(**request_args, **resilience.timeout_arg(timeout))
+
+        stream = resilience.call(
+            self.stage, lambda timeout: _limited(self.base_url, request_args, lambda: create(timeout))
+        )
+        try:
+            for chunk in stream:
+                assembler.feed(chunk)
+        finally:
+            assembler.close_output()
+            stream.close()
+        self._last_usage = assembler.usage
+        return assembler.result()
+
+    async def _acomplete_streaming(self, request_args: Dict[str, Any]):
+        client = get_async_client(self.base_url, self.api_key, self.timeout)
+        assembler = _StreamAssembler(self.ui)
+        request_args = {**request_args, "stream": True}
+
+        async def create(timeout: Optional[float]):
+            if self._stream_usage_supported:
+                try:
+                    return await client.chat.completions.create(
+                        **request_args, stream_options={"include_usage": True}, **resilience.timeout_arg(timeout)
+                    )
+                except BadRequestError:
+                    self._stream_usage_supported = False
+            return await client.chat.completions.create(**request_args, **resilience.timeout_arg(timeout))
+
+        # streamed output is rendered as it arrives, so it is never hedged
+        stream = await resilience.acall(
+            self.stage, lambda timeout: _alimited(self.base_url, request_args, lambda: create(timeout)), hedge=False
+        )
+        try:
+            async for chunk in stream:
+                assembler.feed(chunk)
+        finally:
+            assembler.close_output()
+            # also runs on cancellation: release the connection back to the pool
+            await stream.close()
+        self._last_usage = assembler.usage
+        return assembler.result()
 
     # 这个函数用于将工具调用的结果附加到消息列表中
     def append_tool_result(self, tool_call_id: str, tool_output: str) -> None:
@@ -158,21 +607,56 @@ class ChatOpenAI:
                 self._pending_turn,
                 max_turns=self.max_history_turns or 0,
             )
+            # same turn kept in memory for the next start_turn(), trimmed like the store
+            self.history.append(list(self._pending_turn))
+            if self.max_history_turns and len(self.history) > self.max_history_turns:
+                # dropping one turn per turn would change the cached prefix every time; the
+                # stable layout drops the older half at once and then only appends
+                keep = self.max_history_turns
+                if self.prompt_layout == "stable":
+                    keep = max(1, self.max_history_turns // 2)
+                del self.history[:-keep]
             self._pending_turn.clear()
 
     # 这个函数用于将工具列表转换为OpenAI API所需的格式
     def _get_tools_definition(self) -> List[Dict[str, Any]]:
-        return [
-            {
-                "type": "function",
-                "function": {
-                    "name": tool["name"],
-                    "description": tool.get("description", ""),
-                    "parameters": tool.get("inputSchema", {}),
-                },
-            }
-            for tool in self.tools
-        ]
+        """
+        Sorted by name with canonical key order and built once per tool list, so the tools
+        block is byte-identical on every request no matter what order the servers used.
+        """
+        if self._tools_frozen is None or self._tools_frozen[0] is not self.tools:
+            definitions = [
+                {
+                    "type": "function",
+                    "function": {
+                        "name": tool["name"],
+                        "description": tool.get("description", ""),
+                        "parameters": tool.get("inputSchema", {}),
+                    },
+                }
+                for tool in sorted(self.tools, key=lambda tool: tool["name"])
+            ]
+            canonical = json.dumps(definitions, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+            self._tools_frozen = (self.tools, json.loads(canonical), canonical)
+        return self._tools_frozen[1]
+
+    def _prefix_hash(self) -> str:
+        # identifies the static part of the prompt: tool definitions + system prompt
+        self._get_tools_definition()
+        material = self._tools_frozen[2] + "\n" + self.system_prompt
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+    def _prompt_cache_report(self, usage: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if not usage or usage.get("estimated"):
+            return None
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        cached = usage.get("cached_tokens") or 0
+        return {
+            "prefix": self._prefix_hash(),
+            "cached_tokens": cached,
+            "prompt_tokens": prompt_tokens,
+            "hit_ratio": round(cached / prompt_tokens, 4) if prompt_tokens else None,
+        }
 
 
 class SimpleLLMClient:
@@ -185,39 +669,105 @@ class SimpleLLMClient:
         model: str = "gpt-4o",
         base_url: Optional[str] = None,
         api_key: Optional[str] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        stage: str = "llm",
+        cache: Optional[LLMCache] = None,
     ) -> None:
-        resolved_base_url = (
-            base_url
-            or os.environ.get("OPENAI_BASE_URL")
-            or os.environ.get("OLLAMA_BASE_URL")
-        )
-        resolved_api_key = api_key or os.environ.get("OPENAI_API_KEY")
-        if not resolved_api_key and resolved_base_url:
-            resolved_api_key = "ollama"
-
+        resolved_base_url, resolved_api_key = _resolve_endpoint(base_url, api_key)
+        self.stage = stage
+        self.cache = cache
+        self.base_url = resolved_base_url
+        self.api_key = resolved_api_key
+        self.timeout = timeout
         self.client = OpenAI(
             api_key=resolved_api_key,
             base_url=resolved_base_url,
+            timeout=_timeout(timeout),
+            # retries are handled per stage by agent/resilience.py
+            max_retries=0,
         )
         self.model = model
 
-    def generate(
+    def _request_args(
         self,
         prompt: str,
-        system_prompt: str = "",
-        response_format: Optional[Dict[str, Any]] = None,
-    ) -> str:
+        system_prompt: str,
+        response_format: Optional[Dict[str, Any]],
+    ) -> Dict[str, Any]:
         messages = []
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
         messages.append({"role": "user", "content": prompt})
+        request_args = {"model": self.model, "messages": messages}
+        if response_format is not None:
+            request_args["response_format"] = response_format
+        return request_args
 
-        try:
-            request_args = {"model": self.model, "messages": messages}
-            if response_format is not None:
-                request_args["response_format"] = response_format
-            response = self.client.chat.completions.create(**request_args)
-            return response.choices[0].message.content or ""
-        except Exception as e:
-            print(f"SimpleLLMClient error: {e}")
-            return ""
+    def generate(
+        self,
+        prompt: str,
+        system_prompt: str = "",
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Raises LLMCallError when the stage's retries / deadline are exhausted, so callers
+        fall back explicitly instead of receiving an empty answer.
+        """
+        request_args = self._request_args(prompt, system_prompt, response_format)
+        cache = self.cache or get_llm_cache()
+        stored = cache.get(request_args) if cache else None
+        if stored is not None:
+            return stored.get("content") or ""
+
+        def fetch() -> str:
+            response = resilience.call(
+                self.stage,
+                lambda timeout: _limited(
+                    self.base_url,
+                    request_args,
+                    lambda: self.client.chat.completions.create(**request_args, **resilience.timeout_arg(timeout)),
+                ),
+            )
+            return self._finish(request_args, response, cache)
+
+        # identical concurrent requests (e.g. the same router query) share one upstream call
+        return COALESCER.do(self._coalesce_key(request_args), fetch)
+
+    async def agenerate(
+        self,
+        prompt: str,
+        system_prompt: str = "",
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Async generate() on the shared AsyncOpenAI pool; cancellation propagates.
+        """
+        request_args = self._request_args(prompt, system_prompt, response_format)
+        cache = self.cache or get_llm_cache()
+        stored = cache.get(request_args) if cache else None
+        if stored is not None:
+            return stored.get("content") or ""
+        client = get_async_client(self.base_url, self.api_key or "", self.timeout)
+
+        async def fetch() -> str:
+            response = await resilience.acall(
+                self.stage,
+                lambda timeout: _alimited(
+                    self.base_url,
+                    request_args,
+                    lambda: client.chat.completions.create(**request_args, **resilience.timeout_arg(timeout)),
+                ),
+            )
+            return self._finish(request_args, response, cache)
+
+        return await COALESCER.ado(self._coalesce_key(request_args), fetch)
+
+    def _coalesce_key(self, request_args: Dict[str, Any]) -> str:
+        return f"chat|{self.base_url}|{request_key(request_args)}"
+
+    def _finish(self, request_args: Dict[str, Any], response: Any, cache: Optional[LLMCache]) -> str:
+        usage = record_usage(self.stage, self.model, getattr(response, "usage", None))
+        content = response.choices[0].message.content or ""
+        if cache is not None:
+            cache.put(request_args, content, usage=usage)
+        return content
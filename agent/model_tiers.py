@@ -0,0 +1,87 @@
+"""
+Model tiers: the routing decision of a turn picks the agent model.
+
+A turn the router resolves with requires_rag=false and no tool sets (chit-chat, simple
+questions) does not need the large model. Each kind of turn can name its own model; a tier
+that is not configured uses llm.model:
+
+    "llm": { "model": "gpt-5",
+             "tiers": { "chat": "gpt-5-mini", "rag": "gpt-5-mini", "tools": "gpt-5" } }
+
+- chat:  no RAG context and no MCP server selected
+- rag:   RAG context, no MCP server selected
+- tools: at least one MCP server selected
+
+A turn running on another model than llm.model is offered one more tool, `escalate`. When
+the model calls it, calls a tool it was not given or sends arguments that are not JSON, the
+agent drops that reply and asks again with llm.model and every registered MCP server
+(see Agent.invoke).
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.context_window import ContextWindow
+
+TIERS = ("chat", "rag", "tools")
+ESCALATE_TOOL = "escalate"
+
+
+class ModelTiers:
+    def __init__(
+        self,
+        default_model: str,
+        tiers: Dict[str, str],
+        context_window_cfg: Optional[dict] = None,
+    ) -> None:
+        unknown = sorted(set(tiers) - set(TIERS))
+        if unknown:
+            raise ValueError(f"Unknown model tier(s) {', '.join(unknown)} (use {', '.join(TIERS)})")
+        self.default_model = default_model
+        self.tiers = {tier: tiers.get(tier) or default_model for tier in TIERS}
+        self.context_window_cfg = context_window_cfg
+        self._windows: Dict[str, Optional[ContextWindow]] = {}
+
+    @classmethod
+    def from_config(cls, llm_cfg: dict) -> Optional["ModelTiers"]:
+        tiers = llm_cfg.get("tiers")
+        if not tiers:
+            return None
+        return cls(llm_cfg["model"], dict(tiers), llm_cfg.get("context_window"))
+
+    @staticmethod
+    def classify(use_rag: bool, servers: List[dict]) -> str:
+        if servers:
+            return "tools"
+        return "rag" if use_rag else "chat"
+
+    def select(self, use_rag: bool, servers: List[dict]) -> Tuple[str, str]:
+        """
+        (tier, model) for a turn with this RAG decision and these selected MCP servers.
+        """
+        tier = self.classify(use_rag, servers)
+        return tier, self.tiers[tier]
+
+    def context_window(self, model: str) -> Optional[ContextWindow]:
+        if model not in self._windows:
+            self._windows[model] = ContextWindow.from_config(model, self.context_window_cfg)
+        return self._windows[model]
+
+    @staticmethod
+    def tool_schema() -> Dict[str, Any]:
+        """
+        The escalate tool, in the same shape as MCP tool listings.
+        """
+        return {
+            "name": ESCALATE_TOOL,
+            "description": (
+                "Hand this request to a more capable assistant that has tools (files, web, "
+                "databases, notes) and more reasoning power. Call it when you cannot answer "
+                "well yourself or the user asks for something that needs a tool."
+            ),
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "reason": {"type": "string", "description": "What is needed that you cannot do."},
+                },
+                "required": ["reason"],
+            },
+        }
@@ -0,0 +1,241 @@
+"""
+Deadlines, retries and hedged requests for LLM calls, configured per stage
+("agent", "router", "rewriter", ...; see the `stage` of the clients).
+
+- deadline_s: budget of one logical call, retries included; each attempt gets the time
+  left as its request timeout
+- retries: 408/409/429/5xx, connection errors and timeouts are retried up to
+  max_attempts with full-jitter exponential backoff (a Retry-After header wins)
+- hedging (async, non-streaming calls only): when the first attempt has not answered
+  after the stage's rolling p95 latency (hedge_after_s until hedge_min_samples calls have
+  been seen), an identical second request is sent; the first answer wins, the other is
+  cancelled
+
+Retries, hedges and failures are logged to the active tracer ("llm_retry", "llm_hedge",
+"llm_call_failed"). A call that cannot be completed raises LLMCallError. The OpenAI
+clients are created with max_retries=0, so this is the only retry layer.
+
+    "llm": { "resilience": { "router": { "deadline_s": 5, "max_attempts": 2 },
+                             "agent": { "deadline_s": 300, "hedge": true } } }
+"""
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from openai import APIConnectionError, APIStatusError
+
+from utils.tracer import LATENCY, active_tracer
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class LLMCallError(RuntimeError):
+    """
+    An LLM call failed for good (non-retryable error, attempts or deadline exhausted).
+    """
+
+    def __init__(self, stage: str, attempts: int, cause: BaseException) -> None:
+        super().__init__(f"{stage} LLM call failed after {attempts} attempt(s): {type(cause).__name__}: {cause}")
+        self.stage = stage
+        self.attempts = attempts
+        self.cause = cause
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        deadline_s: Optional[float] = None,
+        max_attempts: int = 3,
+        backoff_base_s: float = 0.5,
+        backoff_max_s: float = 8.0,
+        hedge: bool = False,
+        hedge_after_s: Optional[float] = None,
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20,
+    ) -> None:
+        self.deadline_s = deadline_s
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.hedge = hedge
+        self.hedge_after_s = hedge_after_s
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+
+    @classmethod
+    def from_dict(cls, cfg: Optional[dict], base: Optional["RetryPolicy"] = None) -> "RetryPolicy":
+        values = dict(vars(base)) if base else {}
+        values.update(cfg or {})
+        return cls(**values)
+
+    def backoff(self, attempt: int, exc: BaseException) -> float:
+        retry_after = _retry_after(exc)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max_s)
+        return random.uniform(0.0, min(self.backoff_max_s, self.backoff_base_s * 2 ** (attempt - 1)))
+
+    def hedge_delay(self, stage: str) -> Optional[float]:
+        if not self.hedge:
+            return None
+        p = LATENCY.percentile(_latency_name(stage), self.hedge_quantile, self.hedge_min_samples)
+        return p / 1000.0 if p is not None else self.hedge_after_s
+
+
+DEFAULT_POLICY = RetryPolicy()
+# tight budgets where a fallback exists (router -> default routing, rewriter -> original query)
+_policies: Dict[str, RetryPolicy] = {
+    "router": RetryPolicy(deadline_s=8.0, max_attempts=2),
+    "rewriter": RetryPolicy(deadline_s=15.0, max_attempts=2),
+    "agent": RetryPolicy(deadline_s=300.0, max_attempts=3),
+}
+
+
+def configure(cfg: Optional[dict]) -> None:
+    """
+    Apply `llm.resilience`: a "default" block plus per-stage overrides.
+    """
+    global DEFAULT_POLICY
+    cfg = dict(cfg or {})
+    DEFAULT_POLICY = RetryPolicy.from_dict(cfg.pop("default", None))
+    for stage, stage_cfg in cfg.items():
+        _policies[stage] = RetryPolicy.from_dict(stage_cfg, base=_policies.get(stage, DEFAULT_POLICY))
+
+
+def policy_for(stage: str) -> RetryPolicy:
+    return _policies.get(stage, DEFAULT_POLICY)
+
+
+def timeout_arg(timeout: Optional[float]) -> Dict[str, Any]:
+    """
+    Request kwargs for an attempt's timeout (nothing keeps the client's default).
+    """
+    return {"timeout": timeout} if timeout is not None else {}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, APIConnectionError)):
+        # APITimeoutError is an APIConnectionError
+        return True
+    if isinstance(exc, APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS or exc.status_code >= 500
+    return False
+
+
+def call(stage: str, fn: Callable[[Optional[float]], T]) -> T:
+    """
+    Run fn(timeout) under the stage's policy (blocking; no hedging).
+    """
+    policy = policy_for(stage)
+    deadline = time.monotonic() + policy.deadline_s if policy.deadline_s else None
+    attempt = 0
+    while True:
+        attempt += 1
+        remaining = deadline - time.monotonic() if deadline else None
+        started = time.perf_counter()
+        try:
+            result = fn(remaining)
+        except Exception as exc:
+            delay = _next_delay(stage, policy, attempt, exc, deadline)
+            time.sleep(delay)
+            continue
+        LATENCY.observe(_latency_name(stage), (time.perf_counter() - started) * 1000.0)
+        return result
+
+
+async def acall(stage: str, fn: Callable[[Optional[float]], Awaitable[T]], hedge: bool = True) -> T:
+    """
+    Run `await fn(timeout)` under the stage's policy. fn must not have side effects
+    before it returns: with hedging two of them may run at once.
+    """
+    policy = policy_for(stage)
+    deadline = time.monotonic() + policy.deadline_s if policy.deadline_s else None
+    attempt = 0
+    while True:
+        attempt += 1
+        remaining = deadline - time.monotonic() if deadline else None
+        try:
+            return await _attempt(stage, policy, fn, remaining, hedge)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            delay = _next_delay(stage, policy, attempt, exc, deadline)
+            await asyncio.sleep(delay)
+
+
+async def _attempt(
+    stage: str,
+    policy: RetryPolicy,
+    fn: Callable[[Optional[float]], Awaitable[T]],
+    timeout: Optional[float],
+    hedge: bool,
+) -> T:
+    started = time.perf_counter()
+    delay = policy.hedge_delay(stage) if hedge else None
+    if delay is None or (timeout is not None and delay >= timeout):
+        result = await asyncio.wait_for(fn(timeout), timeout)
+        LATENCY.observe(_latency_name(stage), (time.perf_counter() - started) * 1000.0)
+        return result
+
+    tasks: Dict[asyncio.Task, str] = {asyncio.ensure_future(fn(timeout)): "primary"}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            _log("llm_hedge", stage=stage, after_ms=round(delay * 1000.0, 2))
+            tasks[asyncio.ensure_future(fn(timeout - delay if timeout is not None else None))] = "hedge"
+        error: Optional[BaseException] = None
+        while tasks:
+            left = timeout - (time.perf_counter() - started) if timeout is not None else None
+            done, _ = await asyncio.wait(tasks, timeout=left, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise asyncio.TimeoutError()
+            for task in done:
+                label = tasks.pop(task)
+                if task.exception() is None:
+                    elapsed_ms = (time.perf_counter() - started) * 1000.0
+                    LATENCY.observe(_latency_name(stage), elapsed_ms)
+                    if label == "hedge" or tasks:
+                        _log("llm_hedge_result", stage=stage, winner=label, elapsed_ms=round(elapsed_ms, 2))
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _next_delay(stage: str, policy: RetryPolicy, attempt: int, exc: BaseException, deadline: Optional[float]) -> float:
+    """
+    Backoff before the next attempt; raises LLMCallError when there is none.
+    """
+    error = f"{type(exc).__name__}: {exc}"
+    if not is_retryable(exc) or attempt >= policy.max_attempts:
+        _log("llm_call_failed", stage=stage, attempts=attempt, error=error, retryable=is_retryable(exc))
+        raise LLMCallError(stage, attempt, exc) from exc
+    delay = policy.backoff(attempt, exc)
+    if deadline is not None and time.monotonic() + delay >= deadline:
+        _log("llm_call_failed", stage=stage, attempts=attempt, error=error, reason="deadline")
+        raise LLMCallError(stage, attempt, exc) from exc
+    _log("llm_retry", stage=stage, attempt=attempt, error=error, delay_ms=round(delay * 1000.0, 2))
+    return delay
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _latency_name(stage: str) -> str:
+    return f"llm.{stage}"
+
+
+def _log(event_type: str, **fields: Any) -> None:
+    tracer = active_tracer()
+    if tracer:
+        tracer.log_event({"type": event_type, **fields})
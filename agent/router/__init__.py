@@ -16,6 +16,8 @@ Returns:
 
 from typing import Dict, List, Optional, Set
 
+from utils.tracer import traced
+
 from .level1_keywords import classify as level1_classify
 from .level3_llm import LLMRouter
 
@@ -44,22 +46,48 @@ def _normalize(result: Dict[str, object]) -> Dict[str, object]:
     }
 
 
-def get_intent(query: str, available_servers: Optional[List[Dict[str, object]]] = None) -> Dict[str, object]:
+def _propose(query: str):
     """
-    Proposer (L1/L2) -> Reviewer (L3). L3 can overwrite/clear proposals.
-    Fast path: if L1 fully resolves (rag != None and tools != None), return immediately.
+    Level 1 proposal: (resolved result or None, provisional_rag, provisional_tools).
     """
-    provisional_rag: Optional[bool] = None
-    provisional_tools: Optional[List[str]] = None
-
-    # Level 1: strict keywords
     l1 = level1_classify(query)
     if l1:
         l1["source"] = "L1"
         provisional_rag = l1.get("requires_rag")
         provisional_tools = l1.get("tool_sets")
         if provisional_rag is not None and provisional_tools is not None:
-            return _normalize(l1)
+            return _normalize(l1), provisional_rag, provisional_tools
+        return None, provisional_rag, provisional_tools
+    return None, None, None
+
+
+def _review(l3: Optional[Dict[str, object]]) -> Dict[str, object]:
+    if l3:
+        l3["source"] = "L3"
+        return _normalize(l3)
+    # Safety fallback
+    return _normalize(DEFAULT_RESULT)
+
+
+def predict_tool_sets(query: str) -> Optional[List[str]]:
+    """
+    Level 1 tool sets for the query (None when L1 is silent). Cheap and synchronous, so
+    main.py can warm the likely MCP servers before the full routing decision is in.
+    """
+    _, _, provisional_tools = _propose(query)
+    return provisional_tools
+
+
+@traced("get_intent")
+def get_intent(query: str, available_servers: Optional[List[Dict[str, object]]] = None) -> Dict[str, object]:
+    """
+    Proposer (L1/L2) -> Reviewer (L3). L3 can overwrite/clear proposals.
+    Fast path: if L1 fully resolves (rag != None and tools != None), return immediately.
+    """
+    # Level 1: strict keywords
+    resolved, provisional_rag, provisional_tools = _propose(query)
+    if resolved:
+        return resolved
 
     # Level 3: LLM reviewer with authority to overwrite/clear
     l3 = _llm_router.classify(
@@ -68,12 +96,24 @@ def get_intent(query: str, available_servers: Optional[List[Dict[str, object]]]
         provisional_tools=provisional_tools,
         available_servers=available_servers,
     )
-    if l3:
-        l3["source"] = "L3"
-        return _normalize(l3)
+    return _review(l3)
 
-    # Safety fallback
-    return _normalize(DEFAULT_RESULT)
+
+@traced("get_intent")
+async def aget_intent(query: str, available_servers: Optional[List[Dict[str, object]]] = None) -> Dict[str, object]:
+    """
+    Async get_intent(): the L3 review does not block the event loop.
+    """
+    resolved, provisional_rag, provisional_tools = _propose(query)
+    if resolved:
+        return resolved
+    l3 = await _llm_router.aclassify(
+        query,
+        provisional_rag=provisional_rag,
+        provisional_tools=provisional_tools,
+        available_servers=available_servers,
+    )
+    return _review(l3)
 
 
-__all__ = ["get_intent"]
+__all__ = ["get_intent", "aget_intent", "predict_tool_sets"]
@@ -6,6 +6,7 @@ import json
 from typing import Any, Dict, List, Optional
 
 from agent.llm_client import SimpleLLMClient
+from agent.resilience import LLMCallError
 from utils.prompt_loader import load_prompt
 
 
@@ -49,7 +50,7 @@ class LLMRouter:
         client: Optional[SimpleLLMClient] = None,
         prompt_file: str = PROMPT_FILE,
     ) -> None:
-        self.client = client or SimpleLLMClient(model=model, base_url=base_url, api_key=api_key)
+        self.client = client or SimpleLLMClient(model=model, base_url=base_url, api_key=api_key, stage="router")
         # Try loading prompt from prompts directory; fall back to baked-in default if missing.
         try:
             self.system_prompt = load_prompt(prompt_file)
@@ -57,6 +58,37 @@ class LLMRouter:
             print(f"LLMRouter prompt load failed ({prompt_file}): {exc}")
             self.system_prompt = DEFAULT_SYSTEM_PROMPT
 
+    def _prompt(
+        self,
+        query: str,
+        provisional_rag: Optional[bool],
+        provisional_tools: Optional[List[str]],
+        available_servers: Optional[List[Dict[str, Any]]],
+    ) -> str:
+        payload = {
+            "query": query,
+            "provisional_rag": provisional_rag,
+            "provisional_tools": provisional_tools,
+            "available_servers": available_servers or [],
+        }
+        return json.dumps(payload, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def _parse(raw: str) -> Optional[Dict[str, Any]]:
+        data: Dict[str, Any] = json.loads(raw)
+        if not isinstance(data, dict):
+            return None
+        requires_rag = bool(data.get("requires_rag"))
+        tool_sets = data.get("tool_sets") or data.get("tool_domains") or []
+        specific_tools = data.get("specific_tools") or []
+        reasoning = data.get("reasoning", "")
+        return {
+            "requires_rag": requires_rag,
+            "tool_sets": list(tool_sets),
+            "specific_tools": list(specific_tools),
+            "reasoning": reasoning,
+        }
+
     def classify(
         self,
         query: str,
@@ -67,31 +99,41 @@ class LLMRouter:
         if not query:
             return None
         try:
-            payload = {
-                "query": query,
-                "provisional_rag": provisional_rag,
-                "provisional_tools": provisional_tools,
-                "available_servers": available_servers or [],
-            }
-            prompt_text = json.dumps(payload, ensure_ascii=False, indent=2)
             raw = self.client.generate(
-                prompt=prompt_text,
+                prompt=self._prompt(query, provisional_rag, provisional_tools, available_servers),
+                system_prompt=self.system_prompt,
+                response_format={"type": "json_object"},
+            )
+            return self._parse(raw)
+        except LLMCallError:
+            # the call itself failed: let the caller record the fallback instead of guessing
+            raise
+        except Exception as exc:
+            print(f"LLMRouter parse error: {exc}")
+        return None
+
+    async def aclassify(
+        self,
+        query: str,
+        provisional_rag: Optional[bool] = None,
+        provisional_tools: Optional[List[str]] = None,
+        available_servers: Optional[List[Dict[str, Any]]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Async classify() on the shared AsyncOpenAI pool.
+        """
+        if not query:
+            return None
+        try:
+            raw = await self.client.agenerate(
+                prompt=self._prompt(query, provisional_rag, provisional_tools, available_servers),
                 system_prompt=self.system_prompt,
                 response_format={"type": "json_object"},
             )
-            data: Dict[str, Any] = json.loads(raw)
-            if not isinstance(data, dict):
-                return None
-            requires_rag = bool(data.get("requires_rag"))
-            tool_sets = data.get("tool_sets") or data.get("tool_domains") or []
-            specific_tools = data.get("specific_tools") or []
-            reasoning = data.get("reasoning", "")
-            return {
-                "requires_rag": requires_rag,
-                "tool_sets": list(tool_sets),
-                "specific_tools": list(specific_tools),
-                "reasoning": reasoning,
-            }
+            return self._parse(raw)
+        except LLMCallError:
+            # the call itself failed: let the caller record the fallback instead of guessing
+            raise
         except Exception as exc:
             print(f"LLMRouter parse error: {exc}")
         return None
@@ -0,0 +1,165 @@
+"""
+Overlaps the independent stages of one turn (main.py).
+
+Before this a turn ran routing -> RAG retrieval -> MCP startup -> first LLM call strictly in
+sequence. Now:
+- RAG retrieval starts speculatively (in a worker thread) while the router decides. The
+  index is loaded and brought up to date right away (with progress shown as usual), but
+  nothing is rewritten or embedded for the query until the router answers requires_rag=true
+  (see spawn_speculative); otherwise the stage is discarded without having made a paid call.
+  Console output from after that point is held back until the result is used;
+- servers predicted by the Level 1 keyword router are warmed in the background;
+- the selected MCP clients start while retrieval is still running.
+
+Each stage is timed; `report()` gives start offsets, durations, how long the turn actually
+waited on each stage and `overlap_ms`, the time saved compared with running them in order.
+"""
+import asyncio
+import io
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# output buffer of the speculative stage running in the current (worker) context
+_stage_output: ContextVar[Optional[io.StringIO]] = ContextVar("stage_output", default=None)
+
+
+class _StageStdout:
+    """
+    sys.stdout stand-in: writes from a buffered stage go to its buffer, the rest pass through.
+    """
+
+    def __init__(self, target: Any) -> None:
+        self.target = target
+
+    def write(self, text: str) -> int:
+        buffer = _stage_output.get()
+        return (buffer if buffer is not None else self.target).write(text)
+
+    def flush(self) -> None:
+        if _stage_output.get() is None:
+            self.target.flush()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.target, name)
+
+
+class TurnScheduler:
+    # how long a speculative stage waits for result()/discard() before giving up
+    GATE_TIMEOUT_S = 120.0
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        # speculative stages: name -> (decided, go) and held-back output
+        self._gates: Dict[str, tuple] = {}
+        self._outputs: Dict[str, io.StringIO] = {}
+
+    def spawn(self, name: str, awaitable: Awaitable[Any]) -> asyncio.Task:
+        """
+        Start a coroutine stage now; collect it later with result().
+        """
+        stage = self.stages[name] = {"start_ms": self._now_ms(), "duration_ms": None, "waited_ms": 0.0}
+
+        async def run():
+            try:
+                return await awaitable
+            finally:
+                stage["duration_ms"] = round(self._now_ms() - stage["start_ms"], 2)
+
+        task = asyncio.create_task(run(), name=f"turn-{name}")
+        if asyncio.iscoroutine(awaitable):
+            # cancelled before it ever ran: close it so it is not reported as never awaited
+            task.add_done_callback(lambda _: awaitable.close())
+        self.tasks[name] = task
+        return task
+
+    def spawn_thread(self, name: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> asyncio.Task:
+        """
+        Start a blocking stage in a worker thread (tracer span, usage meter and other
+        contextvars carry over).
+        """
+        return self.spawn(name, asyncio.to_thread(fn, *args, **kwargs))
+
+    def spawn_speculative(self, name: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> asyncio.Task:
+        """
+        Like spawn_thread(), for work whose result may be thrown away. fn gets a `proceed`
+        callable: it blocks until the stage is collected (True) or discarded (False), so fn
+        can do the cheap, always-useful part first and leave paid calls until after it.
+        What the stage prints after proceed() is held back; read it with output().
+        """
+        decided, go = threading.Event(), [False]
+        self._gates[name] = (decided, go)
+        buffer = self._outputs[name] = io.StringIO()
+        if not isinstance(sys.stdout, _StageStdout):
+            sys.stdout = _StageStdout(sys.stdout)
+
+        def proceed() -> bool:
+            if not (decided.wait(self.GATE_TIMEOUT_S) and go[0]):
+                return False
+            # from here on the turn's own output is running too: keep ours until it is used
+            _stage_output.set(buffer)
+            return True
+
+        def run() -> Any:
+            return fn(*args, proceed=proceed, **kwargs)
+
+        return self.spawn_thread(name, run)
+
+    def output(self, name: str) -> str:
+        """
+        Console output held back by a speculative stage.
+        """
+        buffer = self._outputs.get(name)
+        return buffer.getvalue() if buffer is not None else ""
+
+    def _decide(self, name: str, go: bool) -> None:
+        gate = self._gates.pop(name, None)
+        if gate:
+            gate[1][0] = go
+            gate[0].set()
+
+    async def result(self, name: str) -> Any:
+        task = self.tasks[name]
+        stage = self.stages[name]
+        self._decide(name, True)
+        started = self._now_ms()
+        stage["awaited"] = True
+        try:
+            return await task
+        finally:
+            stage["waited_ms"] = round(stage["waited_ms"] + self._now_ms() - started, 2)
+
+    def discard(self, name: str, reason: str) -> None:
+        """
+        Drop a speculative stage. A thread that is already running finishes in the
+        background, but its result is ignored.
+        """
+        self._decide(name, False)
+        task = self.tasks.pop(name, None)
+        if task is None:
+            return
+        self.stages[name]["discarded"] = reason
+        if task.done():
+            if not task.cancelled():
+                task.exception()  # retrieve it so asyncio does not warn
+            return
+        task.cancel()
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def report(self) -> Dict[str, Any]:
+        elapsed = self._now_ms()
+        # stages the turn consumed: the part of their run time it did not block on was overlapped
+        used = [s for s in self.stages.values() if s.get("awaited") and s["duration_ms"] is not None]
+        overlap = sum(max(0.0, s["duration_ms"] - s["waited_ms"]) for s in used)
+        return {
+            "stages": self.stages,
+            "elapsed_ms": round(elapsed, 2),
+            "overlap_ms": round(overlap, 2),
+        }
+
+    def _now_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000.0
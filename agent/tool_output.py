@@ -0,0 +1,167 @@
+"""
+Large tool results are kept out of the conversation.
+
+A result longer than `threshold_chars` is written to `spill_dir`, split into chunks and
+embedded into an in-memory index that lives for the current turn. The model receives a
+compact handle (size, head/tail preview) instead of the full text, and pulls the parts it
+needs through the built-in `retrieve_tool_output` tool. Every later LLM call in the tool
+loop, and the saved session history, then carry a few hundred characters, not the page.
+
+Embeddings come from the local HashingEmbedder, so spilling needs no embedding server.
+"""
+import json
+import secrets
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from rag.chunk.recursive import RecursiveCharacterTextSplitter
+from rag.hashing_embedder import HashingEmbedder
+
+RETRIEVE_TOOL = "retrieve_tool_output"
+
+
+class ToolOutputManager:
+    def __init__(
+        self,
+        spill_dir: Optional[Path] = None,
+        threshold_chars: int = 6000,
+        chunk_size: int = 800,
+        chunk_overlap: int = 100,
+        top_k: int = 4,
+        preview_chars: int = 600,
+        embedder: Optional[HashingEmbedder] = None,
+    ) -> None:
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.threshold_chars = threshold_chars
+        self.top_k = top_k
+        self.preview_chars = preview_chars
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.embedder = embedder or HashingEmbedder(dim=4096)
+        # handle -> {"tool", "chunks", "vectors", "path", "chars"}; cleared every turn
+        self._outputs: Dict[str, Dict[str, Any]] = {}
+        # handles stay in the session history: never reuse one, so a stale handle fails
+        # with "Unknown handle" instead of reading another output (the prefix covers
+        # handles saved by earlier processes)
+        self._prefix = secrets.token_hex(3)
+        self._serial = 0
+
+    @classmethod
+    def from_config(cls, cfg: Optional[dict], spill_dir: Optional[Path] = None) -> Optional["ToolOutputManager"]:
+        cfg = cfg or {}
+        if not cfg.get("enabled", True):
+            return None
+        return cls(
+            spill_dir=Path(cfg["spill_dir"]) if cfg.get("spill_dir") else spill_dir,
+            threshold_chars=cfg.get("threshold_chars", 6000),
+            chunk_size=cfg.get("chunk_size", 800),
+            chunk_overlap=cfg.get("chunk_overlap", 100),
+            top_k=cfg.get("top_k", 4),
+            preview_chars=cfg.get("preview_chars", 600),
+        )
+
+    @property
+    def spilled(self) -> bool:
+        """
+        Whether a result of the current turn was stored (so the retrieve tool has something to read).
+        """
+        return bool(self._outputs)
+
+    @staticmethod
+    def tool_schema() -> dict:
+        return {
+            "name": RETRIEVE_TOOL,
+            "description": (
+                "Search a large tool result that was stored instead of shown in full. "
+                "Pass the handle from that result and what you are looking for; "
+                "returns the most relevant excerpts."
+            ),
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "handle": {"type": "string", "description": "Handle of the stored tool output, e.g. 'out_3f9a1c_1'."},
+                    "query": {"type": "string", "description": "What to look for in the output."},
+                    "top_k": {"type": "integer", "description": "Number of excerpts to return (default 4)."},
+                },
+                "required": ["handle", "query"],
+            },
+        }
+
+    def reset(self) -> None:
+        """
+        Drop the per-turn index (spilled files stay on disk with the run's trace).
+        """
+        self._outputs.clear()
+
+    def maybe_spill(self, tool_name: str, arguments: dict, result: Any) -> Optional[dict]:
+        """
+        Compact handle for a serialized tool result over the threshold, else None (inline it).
+        """
+        text = _as_text(result)
+        if len(text) <= self.threshold_chars:
+            return None
+        self._serial += 1
+        handle = f"out_{self._prefix}_{self._serial}"
+        chunks = self.splitter.split_text(text) or [text]
+        path = None
+        if self.spill_dir:
+            try:
+                self.spill_dir.mkdir(parents=True, exist_ok=True)
+                path = self.spill_dir / f"{handle}_{tool_name}.txt"
+                path.write_text(text, encoding="utf-8")
+            except OSError as exc:
+                print(f"[tool_output] failed to spill {handle}: {exc}")
+                path = None
+        self._outputs[handle] = {
+            "tool": tool_name,
+            "chunks": chunks,
+            "vectors": self.embedder.embed(chunks),
+            "path": str(path) if path else None,
+            "chars": len(text),
+        }
+        head = self.preview_chars * 2 // 3
+        tail = self.preview_chars - head
+        return {
+            "handle": handle,
+            "tool": tool_name,
+            "arguments": arguments,
+            "chars": len(text),
+            "chunks": len(chunks),
+            "preview_head": text[:head],
+            "preview_tail": text[-tail:] if tail else "",
+            "note": (
+                f"Output too large to include ({len(text)} chars). "
+                f"Call {RETRIEVE_TOOL} with handle='{handle}' and a query to read the relevant parts. "
+                "The handle is valid for the current request only."
+            ),
+        }
+
+    def retrieve(self, handle: str, query: str, top_k: Optional[int] = None) -> dict:
+        entry = self._outputs.get(handle)
+        if entry is None:
+            return {"error": f"Unknown handle '{handle}'", "handles": sorted(self._outputs)}
+        k = max(1, min(int(top_k or self.top_k), len(entry["chunks"])))
+        scores = entry["vectors"] @ self.embedder.embed([query or ""])[0]
+        best = np.argsort(-scores)[:k]
+        # excerpts in document order read better than in score order
+        excerpts: List[dict] = [
+            {"chunk": int(i), "score": round(float(scores[i]), 4), "text": entry["chunks"][i]}
+            for i in sorted(best.tolist())
+        ]
+        return {"handle": handle, "tool": entry["tool"], "total_chunks": len(entry["chunks"]), "excerpts": excerpts}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "outputs": len(self._outputs),
+            "chars": sum(entry["chars"] for entry in self._outputs.values()),
+        }
+
+
+def _as_text(result: Any) -> str:
+    # serialized MCP content is a list of text strings / content dicts
+    if isinstance(result, str):
+        return result
+    if isinstance(result, list):
+        return "\n".join(item if isinstance(item, str) else json.dumps(item, ensure_ascii=False) for item in result)
+    return json.dumps(result, ensure_ascii=False)
@@ -0,0 +1,88 @@
+"""
+Synthetic corpora for retrieval benchmarks.
+
+Documents mix Latin pseudo-words and CJK "sentences" drawn from Zipf-distributed
+vocabularies, so BM25 and hashed embeddings both see realistic term statistics.
+Queries are spans cut from random documents; the source document is the relevant one.
+"""
+import random
+from dataclasses import dataclass
+from typing import List
+
+SYLLABLES = [
+    "ka", "to", "ri", "shi", "en", "al", "or", "an", "de", "mi", "no", "ve", "la", "pro", "ter",
+    "con", "ex", "ion", "ment", "graph", "tra", "vec", "lu", "mo", "sta", "qu", "ze", "ph", "ly", "ous",
+]
+# common CJK unified ideographs range
+CJK_START = 0x4E00
+CJK_SPAN = 3000
+
+
+@dataclass
+class Query:
+    text: str
+    doc_id: int
+
+
+@dataclass
+class Corpus:
+    documents: List[str]
+    queries: List[Query]
+
+
+def _zipf_weights(n: int, s: float = 1.1) -> List[float]:
+    return [1.0 / (rank ** s) for rank in range(1, n + 1)]
+
+
+def _latin_vocab(rng: random.Random, size: int) -> List[str]:
+    vocab = set()
+    while len(vocab) < size:
+        vocab.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return sorted(vocab)
+
+
+def _cjk_vocab(rng: random.Random, size: int) -> List[str]:
+    vocab = set()
+    while len(vocab) < size:
+        vocab.add("".join(chr(CJK_START + rng.randrange(CJK_SPAN)) for _ in range(rng.randint(1, 3))))
+    return sorted(vocab)
+
+
+def generate_corpus(
+    num_docs: int,
+    num_queries: int = 100,
+    cjk_ratio: float = 0.3,
+    words_per_doc: int = 120,
+    query_words: int = 8,
+    vocab_size: int = 5000,
+    seed: int = 42,
+) -> Corpus:
+    """
+    Build `num_docs` documents; roughly `cjk_ratio` of the sentences are CJK.
+    """
+    rng = random.Random(seed)
+    latin = _latin_vocab(rng, vocab_size)
+    cjk = _cjk_vocab(rng, vocab_size)
+    latin_weights = _zipf_weights(len(latin))
+    cjk_weights = _zipf_weights(len(cjk))
+
+    documents: List[str] = []
+    for _ in range(num_docs):
+        sentences = []
+        remaining = words_per_doc
+        while remaining > 0:
+            length = min(remaining, rng.randint(6, 16))
+            if rng.random() < cjk_ratio:
+                sentences.append("".join(rng.choices(cjk, cjk_weights, k=length)) + "。")
+            else:
+                sentences.append(" ".join(rng.choices(latin, latin_weights, k=length)).capitalize() + ".")
+            remaining -= length
+        documents.append(" ".join(sentences))
+
+    queries: List[Query] = []
+    for _ in range(num_queries):
+        doc_id = rng.randrange(num_docs)
+        tokens = documents[doc_id].split(" ")
+        start = rng.randrange(max(1, len(tokens) - query_words))
+        queries.append(Query(" ".join(tokens[start : start + query_words]), doc_id))
+    return Corpus(documents, queries)
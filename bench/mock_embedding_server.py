@@ -0,0 +1,144 @@
+"""
+Local mock embedding server speaking both the OpenAI and the Ollama embedding protocols.
+
+Embeddings come from rag.hashing_embedder (feature hashing of words + character n-grams), so
+texts that share vocabulary land close together and benchmark runs are reproducible without a
+model. The vectors are identical to the in-process `backend: "hashing"` embedder.
+
+Usage:
+    python -m bench.mock_embedding_server --port 8765 --dim 256
+    EMBEDDING_BASE_URL=http://127.0.0.1:8765/v1 EMBEDDING_KEY=mock python main.py ...
+    OLLAMA_EMBED_BASE_URL=http://127.0.0.1:8765 python main.py ...
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+from rag.hashing_embedder import HashingEmbedder
+
+
+def deterministic_embedding(text: str, dim: int = 256) -> List[float]:
+    """
+    L2-normalized signed feature hashing over character n-grams and words.
+    """
+    return HashingEmbedder(dim=dim).embed([text])[0].tolist()
+
+
+class MockEmbeddingServer:
+    """
+    Threaded HTTP server; `start()` returns immediately and `base_url` points at it.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, dim: int = 256, latency_ms: float = 0.0) -> None:
+        self.dim = dim
+        self.embedder = HashingEmbedder(dim=dim)
+        self.latency_ms = latency_ms
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:  # noqa: N802 - http.server API
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                    body = server.handle(self.path, payload)
+                except ValueError as exc:
+                    self._reply(400, {"error": str(exc)})
+                    return
+                if body is None:
+                    self._reply(404, {"error": f"unknown endpoint {self.path}"})
+                    return
+                self._reply(200, body)
+
+            def _reply(self, status: int, body: dict) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def embed(self, text: str) -> List[float]:
+        return self.embed_batch([text])[0]
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return self.embedder.embed([str(t) for t in texts]).tolist()
+
+    def handle(self, path: str, payload: dict) -> Optional[dict]:
+        self.requests += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        path = path.rstrip("/")
+        if path.endswith("/v1/embeddings") or path == "/embeddings":
+            inputs = payload.get("input")
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            if not isinstance(inputs, list):
+                raise ValueError("'input' must be a string or a list of strings")
+            return {
+                "object": "list",
+                "model": payload.get("model", "mock"),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": vector}
+                    for i, vector in enumerate(self.embed_batch(inputs))
+                ],
+                "usage": {"prompt_tokens": sum(len(t.split()) for t in inputs), "total_tokens": sum(len(t.split()) for t in inputs)},
+            }
+        if path.endswith("/api/embeddings"):
+            return {"embedding": self.embed(str(payload.get("prompt", "")))}
+        if path.endswith("/api/embed"):
+            inputs = payload.get("input")
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            return {"model": payload.get("model", "mock"), "embeddings": self.embed_batch(inputs or [])}
+        return None
+
+    def start(self) -> "MockEmbeddingServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-embedding-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join(5)
+
+    def __enter__(self) -> "MockEmbeddingServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Deterministic mock embedding server (OpenAI + Ollama protocols).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Artificial per-request latency.")
+    args = parser.parse_args()
+    server = MockEmbeddingServer(args.host, args.port, args.dim, args.latency_ms)
+    print(f"Mock embedding server on {server.base_url} (OpenAI: {server.base_url}/v1, Ollama: {server.base_url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
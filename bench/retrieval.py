@@ -0,0 +1,237 @@
+"""
+Retrieval benchmark: index build throughput, query latency and recall as the corpus grows.
+
+Usage:
+    python -m bench.retrieval --sizes 1000,5000,20000 --cjk-ratio 0.3 \
+        --index-factory "IVF64,Flat" --output bench_results.json
+
+For every corpus size it reports:
+- build: embedding + FAISS add throughput (chunks/s), BM25 build time, index bytes, process RSS
+- latency p50/p95/p99 (ms) for FaissVectorStore.search_with_scores, BM25 scoring and the full
+  hybrid EmbeddingRetriever.retrieve (which includes an HTTP round trip to the mock server;
+  `--embedder local` embeds in-process with the hashing backend instead)
+- recall@k of the configured index against an exact Flat index over the same vectors
+- hit@k of the hybrid retriever (query span found in its source document)
+Results are written as JSON so runs can be diffed across releases.
+"""
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+from contextlib import nullcontext, redirect_stdout
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from bench.corpus import generate_corpus
+from bench.mock_embedding_server import MockEmbeddingServer
+from rag.embedding_retriever import EmbeddingRetriever
+from rag.vector_store_faiss import FaissVectorStore
+
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    if not samples_ms:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    arr = np.asarray(samples_ms)
+    return {
+        "p50": round(float(np.percentile(arr, 50)), 4),
+        "p95": round(float(np.percentile(arr, 95)), 4),
+        "p99": round(float(np.percentile(arr, 99)), 4),
+        "mean": round(float(arr.mean()), 4),
+    }
+
+
+def time_calls(fn: Callable, args_list: list) -> List[float]:
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return samples
+
+
+def rss_mb() -> float:
+    """
+    Current resident set size (Linux), falling back to the peak from getrusage.
+    """
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * resource.getpagesize() / 2**20, 2)
+    except Exception:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS reports bytes, Linux kilobytes
+        return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 2)
+
+
+def recall_at_k(approx_ids: np.ndarray, exact_ids: np.ndarray) -> float:
+    k = exact_ids.shape[1]
+    hits = sum(len(set(a[a >= 0]) & set(e[e >= 0])) for a, e in zip(approx_ids, exact_ids))
+    return hits / float(exact_ids.shape[0] * k)
+
+
+def build_store(index_factory: str, vectors: np.ndarray, documents: List[str]) -> FaissVectorStore:
+    store = FaissVectorStore(index_factory=index_factory)
+    faiss, _ = store._require_faiss()
+    store._ensure_index(vectors.shape[1], faiss)
+    if not store.index.is_trained:
+        store.index.train(vectors)
+    store.add_embeddings(vectors, documents)
+    return store
+
+
+def make_retriever(server: Optional[MockEmbeddingServer], args: argparse.Namespace) -> EmbeddingRetriever:
+    vector_store_config = {"backend": "faiss", "index_factory": args.index_factory}
+    if server is None:
+        return EmbeddingRetriever(
+            model="hashing",
+            vector_store_config=vector_store_config,
+            backend="hashing",
+            hashing_config={"dim": args.dim},
+        )
+    return EmbeddingRetriever(
+        model="mock",
+        base_url=f"{server.base_url}/v1",
+        api_key="mock",
+        vector_store_config=vector_store_config,
+    )
+
+
+def run_size(
+    server: Optional[MockEmbeddingServer],
+    num_docs: int,
+    args: argparse.Namespace,
+) -> Dict[str, object]:
+    corpus = generate_corpus(
+        num_docs,
+        num_queries=args.queries,
+        cjk_ratio=args.cjk_ratio,
+        words_per_doc=args.words_per_doc,
+        seed=args.seed,
+    )
+    retriever = make_retriever(server, args)
+    rss_before = rss_mb()
+
+    # --- build ---
+    start = time.perf_counter()
+    embeddings: List[List[float]] = []
+    for i in range(0, len(corpus.documents), args.batch_size):
+        embeddings.extend(retriever.embed_texts(corpus.documents[i : i + args.batch_size]))
+    embed_s = time.perf_counter() - start
+    vectors = np.asarray(embeddings, dtype="float32")
+
+    start = time.perf_counter()
+    retriever.vector_store = build_store(args.index_factory, vectors, corpus.documents)
+    add_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    retriever.documents_buffer = list(corpus.documents)
+    retriever.build_keyword_index()
+    bm25_s = time.perf_counter() - start
+
+    faiss, _ = FaissVectorStore._require_faiss()
+    index_bytes = int(faiss.serialize_index(retriever.vector_store.index).size)
+
+    # --- latency ---
+    query_texts = [q.text for q in corpus.queries]
+    query_vectors = np.asarray(retriever.embed_texts(query_texts), dtype="float32")
+    k = args.top_k
+    vector_ms = time_calls(retriever.vector_store.search_with_scores, [(v, k) for v in query_vectors])
+    bm25_ms = time_calls(retriever.retrieve_keyword_with_scores, [(q, k) for q in query_texts])
+
+    hybrid_ms: List[float] = []
+    hybrid_hits = 0
+    for query in corpus.queries:
+        start = time.perf_counter()
+        results = retriever.retrieve(query.text, top_k=k)
+        hybrid_ms.append((time.perf_counter() - start) * 1000.0)
+        hybrid_hits += int(corpus.documents[query.doc_id] in results)
+
+    # --- recall vs exact Flat ---
+    if args.index_factory.strip().lower() in {"flat", "idmap,flat"}:
+        recall = 1.0
+    else:
+        exact = build_store("Flat", vectors, corpus.documents)
+        _, exact_ids = exact.index.search(query_vectors, k)
+        _, approx_ids = retriever.vector_store.index.search(query_vectors, k)
+        recall = recall_at_k(approx_ids, exact_ids)
+
+    return {
+        "num_docs": num_docs,
+        "num_queries": len(corpus.queries),
+        "build": {
+            "embed_s": round(embed_s, 4),
+            "faiss_add_s": round(add_s, 4),
+            "bm25_build_s": round(bm25_s, 4),
+            "chunks_per_s": round(num_docs / (embed_s + add_s), 2) if embed_s + add_s else None,
+            "index_bytes": index_bytes,
+        },
+        "memory": {"rss_mb": rss_mb(), "rss_delta_mb": round(rss_mb() - rss_before, 2)},
+        "latency_ms": {
+            "faiss_search": percentiles(vector_ms),
+            "bm25": percentiles(bm25_ms),
+            "hybrid_retrieve": percentiles(hybrid_ms),
+        },
+        "quality": {
+            f"recall@{k}_vs_flat": round(recall, 4),
+            f"hybrid_hit@{k}": round(hybrid_hits / max(1, len(corpus.queries)), 4),
+        },
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Retrieval latency / recall benchmark.")
+    parser.add_argument("--sizes", default="1000,5000", help="Comma-separated corpus sizes (documents).")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--cjk-ratio", type=float, default=0.3, help="Fraction of CJK sentences (0..1).")
+    parser.add_argument("--words-per-doc", type=int, default=120)
+    parser.add_argument("--dim", type=int, default=256, help="Hashing embedding dimension.")
+    parser.add_argument(
+        "--embedder",
+        choices=["server", "local"],
+        default="server",
+        help="Embed through the mock HTTP server or in-process with the hashing backend.",
+    )
+    parser.add_argument("--index-factory", default="Flat", help="FAISS index_factory string under test.")
+    parser.add_argument("--batch-size", type=int, default=64, help="Texts per embedding request.")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Artificial mock server latency.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write JSON results here (stdout otherwise).")
+    args = parser.parse_args(argv)
+
+    import faiss  # type: ignore
+
+    report: Dict[str, object] = {
+        "benchmark": "retrieval",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "faiss": getattr(faiss, "__version__", "unknown"),
+            "numpy": np.__version__,
+        },
+        "params": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": [],
+    }
+    # retriever helpers print progress titles; keep stdout clean for the JSON report
+    server_cm = MockEmbeddingServer(dim=args.dim, latency_ms=args.latency_ms) if args.embedder == "server" else nullcontext()
+    with server_cm as server, redirect_stdout(sys.stderr):
+        for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+            print(f"[bench] corpus size {size} ...", file=sys.stderr)
+            report["results"].append(run_size(server, size, args))
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+        print(f"[bench] results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,8 @@ Jarvis CLI entrypoint.
 Behavior:
 - Shows a brief intro (with architecture image if supported in your terminal).
 - Provides a tiny prompt: type `run` to start the main pipeline, `quit` to exit.
+- `jarvis index [--config ...]` builds/updates the knowledge index offline (see rag/indexer.py).
+- `jarvis autotune [--config ...]` tunes the FAISS index type/search params (see rag/autotune.py).
 """
 from pathlib import Path
 import sys
@@ -83,6 +85,14 @@ def prompt_loop() -> None:
 
 
 def cli() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "index":
+        from rag.indexer import main as index_main
+        index_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "autotune":
+        from rag.autotune import main as autotune_main
+        autotune_main(sys.argv[2:])
+        return
     render_intro()
     prompt_loop()
 
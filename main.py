@@ -9,16 +9,30 @@ from typing import List
 from dotenv import load_dotenv
 
 from agent.agent import Agent
+from agent.context_window import ContextWindow
+from agent import resilience
+from agent.llm_cache import LLMCache, set_llm_cache
+from agent.resilience import LLMCallError
+from agent.llm_client import close_async_clients
+from agent.model_tiers import ModelTiers
+from agent.tool_output import ToolOutputManager
 from mcp_core.mcp_client import MCPClient
+from mcp_core.pool import MCPPool
+from mcp_core.result_cache import ToolResultCache
+from mcp_core.schema_cache import DEFAULT_MAX_AGE_S, ToolSchemaCache
 from config.loader import load_user_config
 from utils import log_title
 from utils.prompt_loader import load_prompt
 from rag.context import retrieve_context
-from utils.tracer import RunTracer
+from rag.watcher import LiveKnowledgeIndex
+from utils.tracer import RunTracer, start_span
+from utils import rate_limit
+from utils.usage import UsageMeter, format_usage
 from utils.session_store import SessionStore
 from datetime import datetime, timezone
 from utils.ui import get_ui
-from agent.router import get_intent
+from agent.router import aget_intent, predict_tool_sets
+from agent.scheduler import TurnScheduler
 from utils import log_title
 
 
@@ -78,14 +92,55 @@ async def main_async() -> None:
     if session_enabled:
         db_path = Path(conversation_cfg.get("db_path", "data/sessions.db"))
         session_store = SessionStore(db_path)
-
-    # MCP client cache (reuse connections across turns)
-    mcp_clients_cache: dict[str, MCPClient] = {}
+    # token usage / cost: one meter per turn, rolled up per session (and persisted with it)
+    pricing = llm_cfg.get("pricing")
+    session_meters: dict[str, UsageMeter] = {}
+    # LLM response cache / record-replay shared by the agent, router and rewriter clients
+    llm_cache = LLMCache.from_config(llm_cfg.get("cache"))
+    set_llm_cache(llm_cache)
+    # per-stage deadlines, retries and hedging of LLM calls
+    resilience.configure(llm_cfg.get("resilience"))
+    # per-endpoint requests/tokens per minute shared by chat and embedding calls
+    rate_limit.configure(cfg.get("rate_limits"))
+
+    # Optional background watcher: keeps the knowledge index fresh off the turn's critical path
+    live_index = None
+    watch_cfg = knowledge_cfg.get("watch", False)
+    if isinstance(watch_cfg, bool):
+        watch_cfg = {"enabled": watch_cfg}
+    if knowledge_cfg.get("enabled", True) and watch_cfg.get("enabled", False):
+        live_index = LiveKnowledgeIndex(
+            knowledge_globs,
+            embed_model=embed_cfg["model"],
+            chunking_strategy=embed_cfg["chunking_strategy"],
+            vector_store_config=vector_store_cfg,
+            debounce=watch_cfg.get("debounce_s", 1.0),
+            poll_interval=watch_cfg.get("poll_interval_s", 2.0),
+            use_inotify=watch_cfg.get("inotify", True),
+            embedding_backend=embed_cfg.get("backend"),
+            hashing_config=embed_cfg.get("hashing"),
+        )
+        live_index.start()
+
+    # tool schemas persisted across runs: servers are spawned on their first tool call
+    mcp_cfg = cfg.get("mcp", {})
+    schema_cache = ToolSchemaCache(
+        Path(mcp_cfg.get("schema_cache", "data/mcp_tool_schemas.json")),
+        max_age_s=mcp_cfg.get("schema_cache_max_age_s", DEFAULT_MAX_AGE_S),
+    )
+    lazy_start = mcp_cfg.get("lazy_start", True)
+    # results of allowlisted read-only tools (per-server "cache" block), shared across turns;
+    # opt-in: a cached read does not see edits made outside the agent
+    result_cache_cfg = mcp_cfg.get("result_cache", {})
+    result_cache = None
+    if result_cache_cfg.get("enabled", False):
+        result_cache = ToolResultCache(
+            max_entries=result_cache_cfg.get("max_entries", 512),
+            max_bytes=int(result_cache_cfg.get("max_mb", 32) * 2**20),
+        )
 
     def _build_client(server: dict) -> MCPClient:
         name = server.get("name")
-        if name in mcp_clients_cache:
-            return mcp_clients_cache[name]
         args = [arg.replace("{output_dir}", str(output_dir)) for arg in server["args"]]
         env = server.get("env")
         if env:
@@ -95,10 +150,63 @@ async def main_async() -> None:
             }
         else:
             resolved_env = None
-        client = MCPClient(command=server["command"], args=args, env=resolved_env)
-        mcp_clients_cache[name] = client
+        client = MCPClient(
+            command=server["command"],
+            args=args,
+            env=resolved_env,
+            name=name,
+            max_concurrency=server.get("max_concurrency"),
+            timeout=server.get("timeout_s"),
+            schema_cache=schema_cache,
+            lazy=lazy_start and server.get("lazy", True),
+            result_cache=result_cache,
+            cache_policy=server.get("cache"),
+            pool_size=server.get("pool_size", 1),
+        )
         return client
 
+    # MCP pool (reuse connections across turns): background prefetch, health checks, idle eviction
+    pool_cfg = mcp_cfg.get("pool", {})
+    mcp_pool = MCPPool(
+        mcp_registry,
+        _build_client,
+        prefetch=pool_cfg.get("prefetch"),
+        prefetch_top=pool_cfg.get("prefetch_top", 2),
+        idle_ttl_s=pool_cfg.get("idle_ttl_s", 600),
+        health_interval_s=pool_cfg.get("health_interval_s", 30),
+        usage_path=Path(pool_cfg.get("usage_path", "data/mcp_pool_usage.json")),
+    )
+    mcp_pool.start()
+
+    # events are buffered and written by a background thread (see utils/tracer.py)
+    tracing_cfg = cfg.get("tracing", {})
+
+    # one agent for the whole run: its LLM client, HTTP connections, tool definitions and
+    # in-memory history are reused by every turn
+    model_name = llm_cfg["model"]
+    system_prompt = load_prompt("agent_system.md")
+    if session_enabled:
+        system_prompt += "\n\nYou are a stateful assistant with access to prior conversation history. Use it to stay consistent, avoid repetition, and reference past context when helpful."
+    tool_output_cfg = cfg.get("tool_output") or {}
+    tool_output = ToolOutputManager.from_config(tool_output_cfg)
+    agent = Agent(
+        model_name,
+        [],
+        system_prompt=system_prompt,
+        session_store=session_store,
+        max_history_turns=max_history_turns,
+        ui=ui,
+        stream=llm_cfg.get("stream", False),
+        tool_output=tool_output,
+        context_window=ContextWindow.from_config(model_name, llm_cfg.get("context_window")),
+        prompt_layout=llm_cfg.get("prompt_layout", "default"),
+        prompt_cache_key=llm_cfg.get("prompt_cache_key", False),
+        # a smaller tier that needs tools escalates to the full model with every server
+        escalation_clients=lambda: [mcp_pool.get(srv) for srv in mcp_registry],
+    )
+    # chat / rag / tools turns may run on different models (llm.tiers)
+    model_tiers = ModelTiers.from_config(llm_cfg)
+
     def _select_servers(intent: dict, registry: list[dict], router_enabled: bool) -> list[dict]:
         if not router_enabled:
             return registry
@@ -133,8 +241,24 @@ async def main_async() -> None:
 
             run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
             tracer_dir = Path.cwd() / "logs" / run_id
-            tracer = RunTracer(tracer_dir)
+            tracer = RunTracer(
+                tracer_dir,
+                flush_interval_s=tracing_cfg.get("flush_interval_s", 0.5),
+                compression=tracing_cfg.get("compression"),
+                rotate_bytes=int(tracing_cfg["rotate_mb"] * 2**20) if tracing_cfg.get("rotate_mb") else None,
+                max_files=tracing_cfg.get("max_files"),
+            )
             tracer.info("run_start", {"query": query_text})
+            mcp_pool.tracer = tracer
+            # spans opened anywhere below (router, RAG, LLM, MCP) nest under this turn
+            tracer.activate()
+            turn_span = start_span("turn", run_id=run_id)
+            turn_usage = UsageMeter(prices=pricing)
+            turn_usage.activate()
+
+            # Stages overlap (agent/scheduler.py): retrieval starts while the router decides,
+            # the servers Level 1 predicts warm up, MCP clients start during retrieval
+            scheduler = TurnScheduler()
 
             # Intent Router
             intent_router_cfg = cfg.get("intent_router", {"enabled": False})
@@ -150,9 +274,38 @@ async def main_async() -> None:
             knowledge_enabled = knowledge_cfg.get("enabled", True)
             use_rag = knowledge_enabled and intent_result["requires_rag"]
 
+            if knowledge_enabled:
+                # speculative: the index loads (and, if stale, updates with visible progress)
+                # now; the query is rewritten and embedded only once the router confirms
+                # knowledge is needed (discarded otherwise). Output from that part is held
+                # back and shown when the result is used.
+                scheduler.spawn_speculative(
+                    "rag",
+                    retrieve_context,
+                    task=query_text,
+                    knowledge_globs=knowledge_globs,
+                    embed_model=embed_cfg["model"],
+                    chunking_strategy=embed_cfg["chunking_strategy"],
+                    enable_rewrite=embed_cfg["enable_query_rewrite"],
+                    rewrite_num_queries=embed_cfg.get("rewrite_num_queries", 3),
+                    llm_model=llm_cfg["model"],
+                    vector_store_config=vector_store_cfg,
+                    tracer=tracer,
+                    ui=ui,
+                    live_index=live_index,
+                    embedding_backend=embed_cfg.get("backend"),
+                    hashing_config=embed_cfg.get("hashing"),
+                )
+
             if intent_router_enabled:
+                predicted_sets = predict_tool_sets(query_text)
+                if predicted_sets:
+                    predicted = _select_servers({"tool_sets": predicted_sets}, mcp_registry, True)
+                    names = [server.get("name") for server in predicted]
+                    if mcp_pool.warm(names):
+                        tracer.info("mcp_warm", {"tool_sets": predicted_sets, "servers": names})
                 try:
-                    intent_result = get_intent(query_text, available_servers=mcp_registry)
+                    intent_result = await aget_intent(query_text, available_servers=mcp_registry)
                     tracer.info("intent_router", {"intent": intent_result})
                 except Exception as exc:
                     tracer.info("intent_router_error", {"error": str(exc)})
@@ -179,83 +332,128 @@ async def main_async() -> None:
                 print(f"use_external_knowledge: {use_rag}")
                 print(f"resolved_by: {intent_result.get('source', 'unknown')}")
 
-            # Session info visibility
+            # MCP selection
+            selected_servers = _select_servers(intent_result, mcp_registry, intent_router_enabled)
+            if not ui.enabled:
+                log_title("MCP SERVER SELECTION")
+                print(f"available: {[s.get('name') for s in mcp_registry]}")
+                print(f"selected: {[s.get('name') for s in selected_servers]}")
+
+            selected_clients = [mcp_pool.get(srv) for srv in selected_servers]
+
+            # model tier from the routing decision
+            tier, turn_model = "default", model_name
+            if model_tiers:
+                tier, turn_model = model_tiers.select(use_rag, selected_servers)
+                if not ui.enabled:
+                    log_title("MODEL TIER")
+                    print(f"tier: {tier} ({turn_model})")
+
+            # the agent lives across turns; only the tool set, session, tracer and context change
             session_id = conversation_cfg.get("session_id") or run_id
+            stored_turns = agent.begin_turn(
+                selected_clients,
+                session_id,
+                tracer=tracer,
+                model=turn_model,
+                context_window=model_tiers.context_window(turn_model) if model_tiers else None,
+            )
+            if tool_output and not tool_output_cfg.get("spill_dir"):
+                # spilled tool results are kept next to the run's trace
+                tool_output.spill_dir = tracer_dir / "tool_outputs"
+
+            # Session info visibility
             if session_enabled and session_store:
-                existing_turns = session_store.load_turns(session_id, limit=max_history_turns or 0)
-                current_turns = len(existing_turns)
                 max_turns_display = max_history_turns if max_history_turns else "unlimited"
                 if ui.enabled:
-                    ui.log("System", f"Session {session_id}: {current_turns} stored / max {max_turns_display}")
+                    ui.log("System", f"Session {session_id}: {stored_turns} stored / max {max_turns_display}")
                 else:
                     log_title("SESSION")
-                    print(f"Session {session_id}: {current_turns} stored / max {max_turns_display}")
+                    print(f"Session {session_id}: {stored_turns} stored / max {max_turns_display}")
+
+            # MCP servers start while retrieval finishes
+            scheduler.spawn("mcp_connect", agent.connect())
 
             # RAG context
-            context = ""
+            agent.context = ""
             if use_rag:
-                context = retrieve_context(
-                    task=query_text,
-                    knowledge_globs=knowledge_globs,
-                    embed_model=embed_cfg["model"],
-                    chunking_strategy=embed_cfg["chunking_strategy"],
-                    enable_rewrite=embed_cfg["enable_query_rewrite"],
-                    rewrite_num_queries=embed_cfg.get("rewrite_num_queries", 3),
-                    llm_model=llm_cfg["model"],
-                    vector_store_config=vector_store_cfg,
-                    tracer=tracer,
-                    ui=ui,
-                )
+                agent.context = await scheduler.result("rag")
+                held_back = scheduler.output("rag")
+                if not ui.enabled:
+                    print(held_back, end="")
+                elif held_back.strip():
+                    ui.log("System", held_back.strip())
             else:
+                scheduler.discard("rag", "intent_router_requires_rag_false")
                 tracer.info(
                     "rag_disabled",
                     {"reason": "config.disabled" if not knowledge_enabled else "intent_router_requires_rag_false"},
                 )
 
-            # MCP selection
-            selected_servers = _select_servers(intent_result, mcp_registry, intent_router_enabled)
-            if not ui.enabled:
-                log_title("MCP SERVER SELECTION")
-                print(f"available: {[s.get('name') for s in mcp_registry]}")
-                print(f"selected: {[s.get('name') for s in selected_servers]}")
-
-            selected_clients = [_build_client(srv) for srv in selected_servers]
-
-            model_name = llm_cfg["model"]
-            system_prompt = load_prompt("agent_system.md")
-            if session_enabled:
-                system_prompt += "\n\nYou are a stateful assistant with access to prior conversation history. Use it to stay consistent, avoid repetition, and reference past context when helpful."
-            agent = Agent(
-                model_name,
-                selected_clients,
-                context=context,
-                system_prompt=system_prompt,
-                tracer=tracer,
-                session_store=session_store,
-                session_id=session_id,
-                max_history_turns=max_history_turns,
-                ui=ui,
-            )
-
             async def run_agent():
+                await scheduler.result("mcp_connect")
                 await agent.init()
+                tracer.log_event({"type": "turn_schedule", **scheduler.report()})
                 try:
                     await agent.invoke(query_text)
                 finally:
                     agent.flush_history()
+                    tracer.info(
+                        "model_tier",
+                        {"tier": tier, "model": turn_model, "final_model": agent.model, "escalated": agent.escalated},
+                    )
+
+            def _roll_up_usage() -> dict:
+                rows = turn_usage.rows()
+                session_meter = session_meters.get(session_id)
+                if session_meter is None:
+                    session_meter = session_meters[session_id] = UsageMeter(prices=pricing)
+                    if session_store:
+                        session_meter.merge_rows(session_store.load_usage(session_id))
+                session_meter.merge_rows(rows)
+                if session_store:
+                    session_store.append_usage(session_id, run_id, rows)
+                usage = {"turn": turn_usage.summary(), "session": session_meter.summary()}
+                tracer.log_event({"type": "usage", "session_id": session_id, **usage})
+                return usage
 
             with ui.live():
                 if ui.enabled:
                     ui.log("User", query_text)
-                await run_agent()
+                try:
+                    await run_agent()
+                except LLMCallError as exc:
+                    # upstream kept failing past the stage's retries / deadline, or a replay
+                    # had no recorded answer (LLMReplayMiss): report it and keep the session going
+                    tracer.info("turn_failed", {"error": str(exc)})
+                    if ui.enabled:
+                        ui.log("System", f"LLM unavailable: {exc}")
+                    else:
+                        print(f"[ERROR] LLM unavailable: {exc}")
+                usage = _roll_up_usage()
+                ui.stats(usage)
+            if not ui.enabled:
+                log_title("USAGE")
+                print(f"turn:    {format_usage(usage['turn'])}")
+                print(f"session: {format_usage(usage['session'])}")
+            tracer.log_event({"type": "mcp_pool_stats", **mcp_pool.stats()})
+            if result_cache:
+                tracer.log_event({"type": "tool_cache_stats", **result_cache.stats()})
+            if llm_cache:
+                tracer.log_event({"type": "llm_cache_stats", **llm_cache.stats()})
+            if cfg.get("rate_limits"):
+                tracer.log_event({"type": "rate_limit_stats", **rate_limit.stats()})
+            if turn_span:
+                turn_span.finish()
+            # writes trace.json + latency breakdown, then drains the background writer;
+            # later pool events on this tracer are written directly
+            tracer.close()
 
     finally:
-        async def _close_all():
-            for client in mcp_clients_cache.values():
-                await client.close()
-
-        if mcp_clients_cache:
-            await _close_all()
+        if live_index:
+            live_index.stop()
+        await mcp_pool.close()
+        await close_async_clients()
 
 
 if __name__ == "__main__":
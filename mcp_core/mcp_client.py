@@ -1,90 +1,370 @@
-from typing import Optional, List, Any, Dict
+from typing import Optional, List, Any, Dict, Tuple
 from contextlib import AsyncExitStack
+from datetime import timedelta
+import asyncio
 import json
 import os
+import time
 
-from mcp import ClientSession, StdioServerParameters
+from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
 
 from dotenv import load_dotenv
 
+from mcp_core.result_cache import ToolResultCache
+from mcp_core.schema_cache import ToolSchemaCache
+from utils.tracer import span
+
 load_dotenv()
 
 
 # MCP client build refer to https://modelcontextprotocol.io/docs/develop/build-client#python
 
+# defaults for servers that do not set "max_concurrency" / "timeout_s" in mcp_servers.json
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_TOOL_TIMEOUT = 120.0
+
+
+class _SessionSlot:
+    """
+    One server process + ClientSession; a client with pool_size > 1 holds several.
+    """
+
+    def __init__(self, index: int, max_concurrency: int) -> None:
+        self.index = index
+        self.session: Optional[ClientSession] = None
+        self.owner: Optional[asyncio.Task] = None
+        self.stop: Optional[asyncio.Event] = None
+        # in-flight call_tool requests allowed on this session; the rest queue here
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.calls = 0
+
 
 class MCPClient:
-    def __init__(self, command: str, args: List[str], env: Optional[Dict[str, str]] = None):
+    def __init__(
+        self,
+        command: str,
+        args: List[str],
+        env: Optional[Dict[str, str]] = None,
+        name: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        schema_cache: Optional[ToolSchemaCache] = None,
+        lazy: bool = False,
+        result_cache: Optional[ToolResultCache] = None,
+        cache_policy: Optional[dict] = None,
+        pool_size: int = 1,
+    ):
         # Initialize session and client objects
-        self.session: Optional[ClientSession] = None
-        self.exit_stack = AsyncExitStack()
         self.command = command
         self.args = args
         self.env = env or None
+        self.name = name or command
+        # in-flight call_tool requests allowed per session; the rest queue there
+        self.max_concurrency = max_concurrency or DEFAULT_MAX_CONCURRENCY
+        self.timeout = timeout or DEFAULT_TOOL_TIMEOUT
+        # pool_size > 1: that many server processes, each call goes to the least busy one
+        self.pool_size = max(1, int(pool_size or 1))
+        self._slots: List[_SessionSlot] = []
+        # tool list cache; dropped when the server sends notifications/tools/list_changed
+        self._tools: Optional[List[dict]] = None
+        # bumped on every tools/list_changed so callers holding derived tables can rebuild
+        self.tools_version = 0
+        # lazy=True: init() serves tool schemas from schema_cache and the server process
+        # is only spawned by the first call_tool
+        self.schema_cache = schema_cache
+        self.lazy = lazy
+        self._cache_key = ToolSchemaCache.key_for(command, args, env)
+        self._connect_lock = asyncio.Lock()
+        # activity / lifecycle counters (read by MCPPool)
+        self.in_flight = 0
+        self.last_used = time.monotonic()
+        self.starts = 0
+        # tool calls made through this client (cache hits included)
+        self.tool_calls = 0
+        self.last_start_ms: Optional[float] = None
+        # opt-in result cache: {"ttl_s": {tool: seconds}, "invalidate_on": [write tools]}
+        self.result_cache = result_cache
+        policy = cache_policy or {}
+        self.cache_ttls: Dict[str, float] = {k: float(v) for k, v in (policy.get("ttl_s") or {}).items()}
+        self.cache_invalidators = set(policy.get("invalidate_on") or [])
 
     async def init(self) -> None:
         """
             Connect to an MCP server
+            (lazy clients with cached tool schemas only load the cache here)
         """
         if self.session:
             return
+        if self.lazy and self.schema_cache and self._tools is None:
+            cached = self.schema_cache.get(self._cache_key)
+            if cached is not None:
+                self._tools = cached
+                print(f"\nLoaded {len(cached)} cached tool schemas for {self.name}; server starts on first call")
+        if self.lazy and self._tools is not None:
+            # schemas known (cache or an earlier, since stopped session)
+            return
+        await self.connect()
+
+    @property
+    def session(self) -> Optional[ClientSession]:
+        """
+        First live session (used for tools/list and as the "is it running" check).
+        """
+        for slot in self._slots:
+            if slot.session is not None:
+                return slot.session
+        return None
+
+    @property
+    def running(self) -> bool:
+        return self.session is not None
+
+    async def connect(self) -> None:
+        """
+        Spawn the server process(es) and open the session(s) (idempotent, safe under
+        concurrent callers). With pool_size > 1 all processes start in parallel; the client
+        is usable as long as at least one of them came up.
+        """
+        async with self._connect_lock:
+            if self.session:
+                return
+            # drop slots whose processes died before starting fresh ones
+            await self._stop_slots()
+            slots = [_SessionSlot(i, self.max_concurrency) for i in range(self.pool_size)]
+            started = time.perf_counter()
+            outcomes = await asyncio.gather(*(self._start_slot(slot) for slot in slots), return_exceptions=True)
+            errors = [exc for exc in outcomes if isinstance(exc, BaseException)]
+            self._slots = [slot for slot, exc in zip(slots, outcomes) if not isinstance(exc, BaseException)]
+            if not self._slots:
+                raise errors[0]
+            if errors:
+                print(f"\n[mcp] {self.name}: {len(errors)}/{self.pool_size} sessions failed to start: {errors[0]}")
+            self.starts += 1
+            # a fresh start counts as activity for idle eviction
+            self.last_used = time.monotonic()
+            self.last_start_ms = round((time.perf_counter() - started) * 1000.0, 2)
+
+        # List available tools (and keep them for get_tools)
+        cached = self._tools
+        tools = await self.get_tools(refresh=True)
+        if cached is not None and cached != tools:
+            # schemas changed since they were cached (e.g. an unpinned package upgraded)
+            self.tools_version += 1
+        if self.schema_cache and cached != tools:
+            server_info = getattr(self, "server_info", None)
+            self.schema_cache.put(
+                self._cache_key,
+                tools,
+                name=self.name,
+                args=self.args,
+                server_version=getattr(server_info, "version", None),
+            )
+        available_tools = [tool["name"] for tool in tools]
+        print(f"\nConnected to server with tools: {', '.join(available_tools)}")
+
+    async def _start_slot(self, slot: _SessionSlot) -> None:
+        ready: asyncio.Future = asyncio.get_running_loop().create_future()
+        slot.stop = asyncio.Event()
+        # the stdio/session contexts hold anyio cancel scopes, which must be entered and
+        # exited by the same task; a dedicated owner task keeps that true no matter which
+        # task triggered the (lazy) start or later calls close()
+        slot.owner = asyncio.create_task(self._own_session(slot, ready), name=f"mcp-{self.name}-{slot.index}")
+        await ready
+
+    async def _own_session(self, slot: _SessionSlot, ready: asyncio.Future) -> None:
         server_params = StdioServerParameters(
             command=self.command,
             args=self.args,
             env=self._resolve_env(),
         )
+        try:
+            async with AsyncExitStack() as exit_stack:
+                stdio_transport = await exit_stack.enter_async_context(stdio_client(server_params))
+                read_stream, write_stream = stdio_transport
+                session = await exit_stack.enter_async_context(
+                    ClientSession(read_stream, write_stream, message_handler=self._handle_message)
+                )
+                init_result = await session.initialize()
+                self.server_info = init_result.serverInfo
+                slot.session = session
+                ready.set_result(None)
+                await slot.stop.wait()
+        except BaseException as exc:
+            if not ready.done():
+                ready.set_exception(exc if isinstance(exc, Exception) else RuntimeError(f"MCP server {self.name} start aborted"))
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+        finally:
+            slot.session = None
 
-        stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
-        self.stdio, self.write = stdio_transport
-        self.session = await self.exit_stack.enter_async_context(ClientSession(self.stdio, self.write))
+    async def close(self):
+        """
+        Clean up resources
+        """
+        await self._stop_slots()
 
-        await self.session.initialize()
+    async def _stop_slots(self) -> None:
+        slots, self._slots = self._slots, []
+        for slot in slots:
+            if slot.owner:
+                slot.stop.set()
+        for slot in slots:
+            if not slot.owner:
+                continue
+            try:
+                await slot.owner
+            except BaseException:
+                # Ignore errors during cleanup (like CancelledError or RuntimeError from anyio)
+                pass
+            slot.owner = None
 
-        # List available tools
-        response = await self.session.list_tools()
-        available_tools = [tool.name for tool in response.tools]
-        print(f"\nConnected to server with tools: {', '.join(available_tools)}")
+    async def restart(self) -> None:
+        await self.close()
+        await self.connect()
 
-    async def close(self):
+    async def ping(self, timeout: float = 5.0) -> bool:
         """
-        Clean up resources
+        True if every session answers an MCP ping within `timeout` seconds.
         """
-        try:
-            await self.exit_stack.aclose()
-        except BaseException:
-            # Ignore errors during cleanup (like CancelledError or RuntimeError from anyio)
-            pass
+        if not self._slots or any(slot.session is None for slot in self._slots):
+            return False
+
+        async def one(session: ClientSession) -> bool:
+            try:
+                await asyncio.wait_for(session.send_ping(), timeout)
+                return True
+            except Exception:
+                return False
+
+        return all(await asyncio.gather(*(one(slot.session) for slot in self._slots)))
 
-    async def get_tools(self) -> List[dict]:
+    def session_stats(self) -> List[Dict[str, Any]]:
+        return [
+            {"index": slot.index, "running": slot.session is not None, "in_flight": slot.in_flight, "calls": slot.calls}
+            for slot in self._slots
+        ]
+
+    async def get_tools(self, refresh: bool = False) -> List[dict]:
         """
         Retrieve the list of available tools from the MCP server
         用于从 MCP 服务器获取可用工具列表, 并将其转换为字典列表格式返回
         mcp返回的工具包含 name, description, inputSchema 等字段, 后续会被用于构建 LLM 的工具调用定义, 
         必须符合 OpenAI function-calling 的规范
+        结果会缓存, 只有 refresh=True 或服务器发出 tools/list_changed 通知后才会重新 list_tools
+        (lazy 模式下缓存可能来自磁盘, 此时不会启动服务器)
         """
+        if self._tools is not None and not refresh:
+            return list(self._tools)
         if not self.session:
+            if self.lazy:
+                await self.connect()
+                return list(self._tools or [])
             raise RuntimeError("MCPClient not initialized")
 
         response = await self.session.list_tools()
-        tools = [{
+        self._tools = [{
             "name": tool.name,
             "description": tool.description,
             "inputSchema": tool.inputSchema
         } for tool in response.tools]
-        return tools
+        return list(self._tools)
+
+    async def _handle_message(self, message: Any) -> None:
+        """
+        Session message handler: invalidate the tool cache on tools/list_changed.
+        """
+        if isinstance(message, types.ServerNotification) and isinstance(message.root, types.ToolListChangedNotification):
+            self._tools = None
+            self.tools_version += 1
     
-    async def call_tool(self, tool_name: str, arguments: dict) -> Any:
+    async def call_tool(self, tool_name: str, arguments: dict, timeout: Optional[float] = None) -> Any:
+        """
+        Call a tool on the MCP server.
+        Concurrent callers are limited to max_concurrency in flight; each call times out
+        after `timeout` (or the server default) seconds with an McpError.
+        """
+        content, _ = await self.call_tool_with_stats(tool_name, arguments, timeout)
+        return content
+
+    async def call_tool_with_stats(
+        self, tool_name: str, arguments: dict, timeout: Optional[float] = None
+    ) -> Tuple[Any, Dict[str, Any]]:
         """
-        Call a tool on the MCP server
+        call_tool plus per-call metadata:
+        {"cache": "hit" | "miss" | "invalidate" | None, "queue_ms": float, "session": int}.
+        Allowlisted tools are answered from the result cache while fresh; successful results
+        are stored, error results never are. Write tools drop the server's cached results.
+        queue_ms is the time spent waiting for a free slot on the chosen session.
         """
+        self.tool_calls += 1
+        with span("mcp.call_tool", server=self.name, tool=tool_name) as current:
+            content, meta = await self._cached_call(tool_name, arguments, timeout)
+            if current:
+                current.set(**meta)
+            return content, meta
+
+    async def _cached_call(
+        self, tool_name: str, arguments: dict, timeout: Optional[float] = None
+    ) -> Tuple[Any, Dict[str, Any]]:
+        cache = self.result_cache
+        ttl = self.cache_ttls.get(tool_name) if cache else None
+        if ttl:
+            key = cache.key(self.name, tool_name, arguments)
+            hit, content = cache.get(key)
+            if hit:
+                self.last_used = time.monotonic()
+                return content, {"cache": "hit", "queue_ms": 0.0}
+            generation = cache.generation(self.name)
+            result, meta = await self._call(tool_name, arguments, timeout)
+            if not result.isError:
+                cache.put(key, result.content, ttl, generation)
+            return result.content, {"cache": "miss", **meta}
+        if cache and tool_name in self.cache_invalidators:
+            try:
+                result, meta = await self._call(tool_name, arguments, timeout)
+            finally:
+                # also after failures: a write may have partially happened
+                cache.invalidate_server(self.name)
+            return result.content, {"cache": "invalidate", **meta}
+        result, meta = await self._call(tool_name, arguments, timeout)
+        return result.content, {"cache": None, **meta}
+
+    async def _call(
+        self, tool_name: str, arguments: dict, timeout: Optional[float] = None
+    ) -> Tuple[types.CallToolResult, Dict[str, Any]]:
         if not self.session:
-            raise RuntimeError("MCPClient not initialized")
+            if not self.lazy and not self.starts:
+                raise RuntimeError("MCPClient not initialized")
+            # cold start on first use, or restart after the process died / was evicted;
+            # concurrent callers share one spawn
+            await self.connect()
             
         #refer to https://modelcontextprotocol.io/docs/develop/build-client#calling-tools
 
-        result = await self.session.call_tool(tool_name, arguments)
-        return result.content
+        # least busy live session (ties go to the lowest index)
+        slot = min(
+            (slot for slot in self._slots if slot.session is not None),
+            key=lambda slot: slot.in_flight,
+        )
+        queued = time.perf_counter()
+        self.in_flight += 1
+        slot.in_flight += 1
+        try:
+            async with slot.semaphore:
+                queue_ms = (time.perf_counter() - queued) * 1000.0
+                slot.calls += 1
+                result = await slot.session.call_tool(
+                    tool_name,
+                    arguments,
+                    read_timeout_seconds=timedelta(seconds=timeout or self.timeout),
+                )
+        finally:
+            self.in_flight -= 1
+            slot.in_flight -= 1
+            self.last_used = time.monotonic()
+        return result, {"queue_ms": round(queue_ms, 2), "session": slot.index}
 
     def _resolve_env(self) -> Optional[Dict[str, str]]:
         """
@@ -0,0 +1,228 @@
+"""
+Process-wide pool of MCP clients that keeps frequently used servers warm.
+
+- prefetch: servers listed in `prefetch`, plus the `prefetch_top` most used ones from
+  earlier runs (tool calls per server, persisted in `usage_path`), are started in the background
+  at startup, so their cold start is off the first turn's critical path. warm() does the
+  same on demand, for servers the router is about to select.
+- health checks: every `health_interval_s` running sessions are pinged; a server whose
+  process died or stopped answering is restarted.
+- idle eviction: a running server with no call for `idle_ttl_s` is stopped. The client
+  stays in the pool (tool schemas included) and starts again on its next call.
+"""
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from mcp_core.mcp_client import MCPClient
+
+
+class MCPPool:
+    def __init__(
+        self,
+        registry: List[dict],
+        factory: Callable[[dict], MCPClient],
+        prefetch: Optional[List[str]] = None,
+        prefetch_top: int = 0,
+        idle_ttl_s: Optional[float] = 600.0,
+        health_interval_s: float = 30.0,
+        ping_timeout_s: float = 5.0,
+        usage_path: Optional[Path] = None,
+        tracer=None,
+    ) -> None:
+        self.registry = {server.get("name"): server for server in registry}
+        self.factory = factory
+        self.prefetch = list(prefetch or [])
+        self.prefetch_top = prefetch_top
+        self.idle_ttl_s = idle_ttl_s
+        self.health_interval_s = health_interval_s
+        self.ping_timeout_s = ping_timeout_s
+        self.usage_path = Path(usage_path) if usage_path else None
+        self.tracer = tracer
+        self.clients: Dict[str, MCPClient] = {}
+        # tool calls per server in earlier runs; this run's are read from the clients
+        self.usage: Dict[str, int] = self._load_usage()
+        self.restarts: Dict[str, int] = {}
+        self.evictions: Dict[str, int] = {}
+        self._tasks: List[asyncio.Task] = []
+        # stopped on purpose (idle); not restarted by health checks
+        self._evicted: set = set()
+
+    # --- lookup ---
+    def get(self, server: dict) -> MCPClient:
+        """
+        Client for a registry entry (created on first use). Selecting a client is not a use:
+        only its tool calls count towards prefetch_top.
+        """
+        name = server.get("name")
+        client = self.clients.get(name)
+        if client is None:
+            client = self.factory(server)
+            self.clients[name] = client
+        return client
+
+    def uses(self) -> Dict[str, int]:
+        """
+        Tool calls per server, earlier runs included.
+        """
+        usage = dict(self.usage)
+        for name, client in self.clients.items():
+            if client.tool_calls:
+                usage[name] = usage.get(name, 0) + client.tool_calls
+        return usage
+
+    # --- lifecycle ---
+    def start(self) -> None:
+        """
+        Kick off background prefetch and maintenance; returns immediately.
+        """
+        names = self._prefetch_names()
+        if names:
+            self._tasks.append(asyncio.create_task(self._prefetch(names), name="mcp-pool-prefetch"))
+        if self.health_interval_s and self.health_interval_s > 0:
+            self._tasks.append(asyncio.create_task(self._maintain(), name="mcp-pool-maintain"))
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except BaseException:
+                pass
+        self._tasks.clear()
+        await asyncio.gather(*(client.close() for client in self.clients.values()), return_exceptions=True)
+        self._save_usage()
+
+    def warm(self, names: List[str]) -> Optional[asyncio.Task]:
+        """
+        Start the named servers in the background (e.g. the ones the router is likely to
+        pick); returns the task, or None when every one is already running.
+        """
+        names = [
+            name for name in names
+            if name in self.registry and not (name in self.clients and self.clients[name].running)
+        ]
+        if not names:
+            return None
+        task = asyncio.create_task(self._prefetch(names, reason="warm"), name="mcp-pool-warm")
+        self._tasks = [t for t in self._tasks if not t.done()] + [task]
+        return task
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        usage = self.uses()
+        servers = {}
+        for name, client in self.clients.items():
+            servers[name] = {
+                "running": client.running,
+                "in_flight": client.in_flight,
+                "idle_s": round(now - client.last_used, 1),
+                "uses": usage.get(name, 0),
+                "starts": client.starts,
+                "last_start_ms": client.last_start_ms,
+                "restarts": self.restarts.get(name, 0),
+                "evictions": self.evictions.get(name, 0),
+            }
+            if client.pool_size > 1:
+                servers[name]["sessions"] = client.session_stats()
+        return {
+            "servers": servers,
+            "running": sum(1 for c in self.clients.values() if c.running),
+            "known": len(self.clients),
+        }
+
+    # --- background work ---
+    def _prefetch_names(self) -> List[str]:
+        names = [name for name in self.prefetch if name in self.registry]
+        ranked = sorted(self.usage.items(), key=lambda item: item[1], reverse=True)
+        for name, _ in ranked[: max(0, self.prefetch_top)]:
+            if name in self.registry and name not in names:
+                names.append(name)
+        return names
+
+    async def _prefetch(self, names: List[str], reason: str = "prefetch") -> None:
+        started = time.perf_counter()
+
+        async def warm(name: str) -> Optional[str]:
+            client = self.clients.get(name) or self.clients.setdefault(name, self.factory(self.registry[name]))
+            try:
+                await client.connect()
+                return None
+            except Exception as exc:
+                return f"{name}: {exc}"
+
+        errors = [err for err in await asyncio.gather(*(warm(name) for name in names)) if err]
+        if self.tracer:
+            self.tracer.log_event(
+                {
+                    "type": "mcp_pool_prefetch",
+                    "reason": reason,
+                    "servers": names,
+                    "errors": errors,
+                    "elapsed_ms": round((time.perf_counter() - started) * 1000.0, 2),
+                }
+            )
+
+    async def _maintain(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval_s)
+            await self.check()
+
+    async def check(self) -> None:
+        """
+        One maintenance pass: evict idle servers, restart unhealthy ones.
+        """
+        now = time.monotonic()
+        for name, client in list(self.clients.items()):
+            if not client.starts or client.in_flight:
+                # never started (lazy, cached schemas) or busy: nothing to do
+                continue
+            if client.running:
+                self._evicted.discard(name)
+            elif name in self._evicted:
+                # stopped for idleness: starts again on its next call
+                continue
+            if self.idle_ttl_s and client.running and now - client.last_used > self.idle_ttl_s:
+                await client.close()
+                self._evicted.add(name)
+                self.evictions[name] = self.evictions.get(name, 0) + 1
+                self._log("mcp_pool_evict", name, idle_s=round(now - client.last_used, 1))
+                continue
+            if client.running and await client.ping(self.ping_timeout_s):
+                continue
+            # process died or stopped answering pings
+            try:
+                await client.restart()
+                self.restarts[name] = self.restarts.get(name, 0) + 1
+                self._log("mcp_pool_restart", name)
+            except Exception as exc:
+                self._log("mcp_pool_restart_failed", name, error=str(exc))
+
+    def _log(self, event_type: str, name: str, **extra: Any) -> None:
+        if self.tracer:
+            self.tracer.log_event({"type": event_type, "server": name, **extra})
+
+    # --- usage persistence ---
+    def _load_usage(self) -> Dict[str, int]:
+        if not self.usage_path:
+            return {}
+        try:
+            data = json.loads(self.usage_path.read_text(encoding="utf-8"))
+            return {str(k): int(v) for k, v in data.items()}
+        except Exception:
+            return {}
+
+    def _save_usage(self) -> None:
+        if not self.usage_path:
+            return
+        try:
+            self.usage_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.usage_path.with_suffix(self.usage_path.suffix + ".tmp")
+            tmp.write_text(json.dumps(self.uses(), ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, self.usage_path)
+        except OSError as exc:
+            print(f"[mcp] failed to write pool usage {self.usage_path}: {exc}")
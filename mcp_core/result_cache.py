@@ -0,0 +1,116 @@
+"""
+TTL + LRU cache for results of idempotent MCP tools.
+
+Opt-in: enabled with "mcp": {"result_cache": {"enabled": true}} in the user config, then per
+server in mcp_servers.json:
+
+    "cache": {
+        "ttl_s": {"read_text_file": 60, "list_directory": 15},   # read-only allowlist
+        "invalidate_on": ["write_file", "edit_file", "move_file"]
+    }
+
+Only tools listed under `ttl_s` are cached, keyed by (server, tool, canonical JSON of the
+arguments). A successful call to an `invalidate_on` tool drops every cached entry of that
+server. The cache is bounded by entry count and approximate payload bytes.
+
+Each invalidation bumps the server's generation; a miss records the generation before the
+call and `put` drops the result if a write landed in the meantime, so a read racing a write
+never caches pre-write content.
+"""
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+def canonical_args(arguments: Optional[dict]) -> str:
+    return json.dumps(arguments or {}, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _approx_size(content: Any) -> int:
+    if isinstance(content, list):
+        return sum(_approx_size(item) for item in content)
+    text = getattr(content, "text", None)
+    if isinstance(text, str):
+        return len(text)
+    data = getattr(content, "data", None)
+    if isinstance(data, str):
+        return len(data)
+    return len(str(content))
+
+
+class ToolResultCache:
+    def __init__(self, max_entries: int = 512, max_bytes: int = 32 * 2**20) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._generations: Dict[str, int] = {}
+        self._per_tool: Dict[str, Dict[str, int]] = {}
+
+    def key(self, server: str, tool: str, arguments: Optional[dict]) -> Tuple[str, str, str]:
+        return (server, tool, canonical_args(arguments))
+
+    def get(self, key: Tuple[str, str, str]) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self._count(key, "hits")
+            return True, entry[1]
+        if entry is not None:
+            self._drop(key)
+        self._count(key, "misses")
+        return False, None
+
+    def generation(self, server: str) -> int:
+        return self._generations.get(server, 0)
+
+    def put(self, key: Tuple[str, str, str], value: Any, ttl_s: float, generation: Optional[int] = None) -> None:
+        size = _approx_size(value)
+        if ttl_s <= 0 or size > self.max_bytes:
+            return
+        if generation is not None and generation != self.generation(key[0]):
+            # the server was written to while this result was in flight
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic() + ttl_s, value, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def invalidate_server(self, server: str) -> int:
+        self._generations[server] = self.generation(server) + 1
+        keys = [key for key in self._entries if key[0] == server]
+        for key in keys:
+            self._drop(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "per_tool": {name: dict(counts) for name, counts in self._per_tool.items()},
+        }
+
+    def _drop(self, key: Hashable) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _count(self, key: Tuple[str, str, str], field: str) -> None:
+        setattr(self, field, getattr(self, field) + 1)
+        counts = self._per_tool.setdefault(f"{key[0]}.{key[1]}", {"hits": 0, "misses": 0})
+        counts[field] += 1
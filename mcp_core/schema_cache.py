@@ -0,0 +1,88 @@
+"""
+Persisted MCP tool schemas, so the LLM can be offered a server's tools without spawning it.
+
+Entries are keyed by the server's command, args and env variable names (never values).
+A version pinned in the args (`pkg@1.2.3`, `pkg==1.2.3`) is part of the key, so upgrading
+a pinned package misses the cache. Unpinned servers (`npx -y pkg`, `uvx pkg`) can pick up
+new releases at any time, so their entries expire after `max_age_s`. Whenever a server does
+start, MCPClient compares its live tool list with the cached one and rewrites the entry.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+DEFAULT_MAX_AGE_S = 7 * 24 * 3600
+
+_PINNED = re.compile(r"^@?[^@=\s]+(@|==)[\w.\-+]+$")
+
+
+def pinned_version(args: List[str]) -> Optional[str]:
+    """
+    The first argument that pins a package version (npm `pkg@1.2.3`, pip `pkg==1.2.3`).
+    """
+    for arg in args:
+        if not arg.startswith("-") and _PINNED.match(arg):
+            return arg
+    return None
+
+
+class ToolSchemaCache:
+    def __init__(self, path: Path, max_age_s: float = DEFAULT_MAX_AGE_S) -> None:
+        self.path = Path(path)
+        self.max_age_s = max_age_s
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+
+    @staticmethod
+    def key_for(command: str, args: List[str], env: Optional[Dict[str, str]] = None) -> str:
+        material = json.dumps(
+            [command, list(args), sorted((env or {}).keys()), pinned_version(args)],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()[:32]
+
+    def get(self, key: str) -> Optional[List[dict]]:
+        entry = self._load().get(key)
+        if not entry:
+            return None
+        if not entry.get("pinned") and time.time() - entry.get("updated_at", 0) > self.max_age_s:
+            return None
+        return entry.get("tools")
+
+    def put(
+        self,
+        key: str,
+        tools: List[dict],
+        name: str,
+        args: List[str],
+        server_version: Optional[str] = None,
+    ) -> None:
+        entries = self._load()
+        entries[key] = {
+            "server": name,
+            "pinned": pinned_version(args) is not None,
+            "server_version": server_version,
+            "updated_at": time.time(),
+            "tools": tools,
+        }
+        self._save(entries)
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            try:
+                self._entries = json.loads(self.path.read_text(encoding="utf-8"))
+            except Exception:
+                self._entries = {}
+        return self._entries
+
+    def _save(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+            tmp.write_text(json.dumps(entries, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError as exc:
+            print(f"[mcp] failed to write tool schema cache {self.path}: {exc}")
@@ -0,0 +1,282 @@
+"""
+ANN parameter autotuner for the FAISS vector store.
+
+Usage:
+    jarvis autotune --config config/user_RAG.json --latency-slo-ms 2 --top-k 10
+    python -m rag.autotune --config config/user_RAG.json --min-recall 0.95 --write
+
+Steps:
+1. Load the persisted index and its chunks; recover their vectors (reconstructed from the
+   index when possible, re-embedded otherwise).
+2. Sample held-out queries from the chunks themselves (a random span of each sampled chunk)
+   and compute exact top-k neighbours with a Flat index.
+3. Sweep candidate index types (Flat, HNSW, IVF-Flat, IVF-SQ8, ...) and their search
+   parameters (efSearch / nprobe), measuring recall@k, per-query latency and index memory.
+4. Print the Pareto frontier and pick a configuration: the highest recall within the latency
+   SLO, or the fastest one reaching --min-recall. The choice is emitted as a `vector_store`
+   config block and written back with --write (rebuild the index afterwards: `jarvis index`).
+"""
+import argparse
+import json
+import math
+import random
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from rag.embedding_retriever import EmbeddingRetriever
+from rag.indexer import build_retriever
+from utils import log_title
+
+
+@dataclass
+class TrialResult:
+    index_factory: str
+    search_params: Dict[str, int] = field(default_factory=dict)
+    recall: float = 0.0
+    latency_p50_ms: float = 0.0
+    latency_p95_ms: float = 0.0
+    memory_bytes: int = 0
+    build_s: float = 0.0
+
+    def dominates(self, other: "TrialResult") -> bool:
+        no_worse = (
+            self.recall >= other.recall
+            and self.latency_p95_ms <= other.latency_p95_ms
+            and self.memory_bytes <= other.memory_bytes
+        )
+        better = (
+            self.recall > other.recall
+            or self.latency_p95_ms < other.latency_p95_ms
+            or self.memory_bytes < other.memory_bytes
+        )
+        return no_worse and better
+
+
+def default_candidates(num_vectors: int, dim: int) -> List[Tuple[str, str, List[int]]]:
+    """
+    (index_factory, search parameter name, values to sweep) sized for the corpus.
+    """
+    candidates: List[Tuple[str, str, List[int]]] = [("Flat", "", [0])]
+    candidates.append(("HNSW32", "efSearch", [16, 32, 64, 128, 256]))
+    # rule of thumb: nlist ~ 4*sqrt(N), with at least ~39 training points per list
+    nlist = 2 ** int(round(math.log2(max(1.0, 4 * math.sqrt(num_vectors)))))
+    while nlist > 1 and nlist * 39 > num_vectors:
+        nlist //= 2
+    if nlist >= 4:
+        nprobes = [p for p in (1, 2, 4, 8, 16, 32, 64, 128) if p <= nlist]
+        candidates.append((f"IVF{nlist},Flat", "nprobe", nprobes))
+        candidates.append((f"IVF{nlist},SQ8", "nprobe", nprobes))
+    return candidates
+
+
+def load_vectors(retriever: EmbeddingRetriever, batch_size: int = 64):
+    """
+    Return (vectors[N, d] float32, documents[N]) for everything in the store.
+    """
+    faiss, np = retriever.vector_store._require_faiss()
+    store = retriever.vector_store
+    store._train_pending(force=True)
+    if store.index is None or store.index.ntotal == 0:
+        raise RuntimeError("Vector store is empty; run `jarvis index` first.")
+    try:
+        ids = faiss.vector_to_array(store.index.id_map)
+        vectors = faiss.downcast_index(store.index.index).reconstruct_n(0, store.index.ntotal)
+        documents = [store.id_to_doc[int(i)] for i in ids]
+        return np.asarray(vectors, dtype="float32"), documents
+    except Exception:
+        # index type cannot reconstruct (e.g. PQ): re-embed the stored chunks
+        documents = store.all_documents()
+        embeddings: List[List[float]] = []
+        for i in range(0, len(documents), batch_size):
+            embeddings.extend(retriever.embed_texts(documents[i : i + batch_size]))
+        return np.asarray(embeddings, dtype="float32"), documents
+
+
+def sample_queries(documents: List[str], count: int, seed: int = 0) -> List[str]:
+    """
+    A random contiguous span (~1/3 of the chunk) from each of `count` sampled chunks.
+    """
+    rng = random.Random(seed)
+    picks = rng.sample(range(len(documents)), min(count, len(documents)))
+    queries = []
+    for idx in picks:
+        text = documents[idx]
+        span = max(16, len(text) // 3)
+        start = rng.randrange(max(1, len(text) - span + 1))
+        queries.append(text[start : start + span])
+    return queries
+
+
+def run_trials(
+    vectors,
+    queries,
+    top_k: int,
+    candidates: List[Tuple[str, str, List[int]]],
+) -> List[TrialResult]:
+    import faiss  # type: ignore
+    import numpy as np  # type: ignore
+
+    dim = vectors.shape[1]
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, top_k)
+
+    results: List[TrialResult] = []
+    for factory, param, values in candidates:
+        start = time.perf_counter()
+        try:
+            index = faiss.index_factory(dim, factory)
+            if not index.is_trained:
+                index.train(vectors)
+            index.add(vectors)
+        except Exception as exc:
+            print(f"[autotune] skip {factory}: {exc}")
+            continue
+        build_s = time.perf_counter() - start
+        memory = int(faiss.serialize_index(index).size)
+        space = faiss.ParameterSpace()
+        for value in values:
+            if param:
+                space.set_index_parameter(index, param, value)
+            latencies = []
+            found = []
+            # one query per call, the way the agent searches
+            for row in queries:
+                t0 = time.perf_counter()
+                _, ids = index.search(row.reshape(1, -1), top_k)
+                latencies.append((time.perf_counter() - t0) * 1000.0)
+                found.append(ids[0])
+            hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+            results.append(
+                TrialResult(
+                    index_factory=factory,
+                    search_params={param: value} if param else {},
+                    recall=round(hits / float(len(truth) * top_k), 4),
+                    latency_p50_ms=round(float(np.percentile(latencies, 50)), 4),
+                    latency_p95_ms=round(float(np.percentile(latencies, 95)), 4),
+                    memory_bytes=memory,
+                    build_s=round(build_s, 4),
+                )
+            )
+    return results
+
+
+def pareto_frontier(results: List[TrialResult]) -> List[TrialResult]:
+    frontier = [r for r in results if not any(o.dominates(r) for o in results if o is not r)]
+    return sorted(frontier, key=lambda r: (r.latency_p95_ms, -r.recall))
+
+
+def choose(
+    frontier: List[TrialResult],
+    latency_slo_ms: Optional[float] = None,
+    min_recall: Optional[float] = None,
+) -> Optional[TrialResult]:
+    """
+    Within the SLO: highest recall (then lowest latency). With --min-recall: the fastest
+    configuration reaching it. Neither: fastest configuration with recall >= 0.95.
+    """
+    if latency_slo_ms is not None:
+        within = [r for r in frontier if r.latency_p95_ms <= latency_slo_ms]
+        if min_recall is not None:
+            within = [r for r in within if r.recall >= min_recall]
+        if within:
+            return max(within, key=lambda r: (r.recall, -r.latency_p95_ms))
+        return None
+    threshold = 0.95 if min_recall is None else min_recall
+    reaching = [r for r in frontier if r.recall >= threshold]
+    if reaching:
+        return min(reaching, key=lambda r: (r.latency_p95_ms, -r.recall))
+    return max(frontier, key=lambda r: r.recall) if frontier else None
+
+
+def recommended_block(current: dict, choice: TrialResult) -> dict:
+    block = {k: v for k, v in current.items() if k != "search_params"}
+    block["backend"] = current.get("backend", "faiss")
+    block["index_factory"] = choice.index_factory
+    if choice.search_params:
+        block["search_params"] = dict(choice.search_params)
+    return block
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from dotenv import load_dotenv
+
+    from config.loader import load_user_config
+
+    parser = argparse.ArgumentParser(prog="jarvis autotune", description="Tune FAISS index type and search parameters.")
+    parser.add_argument("--config", default="config/user_RAG.json")
+    parser.add_argument("--queries", type=int, default=200, help="Held-out queries sampled from indexed chunks.")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--latency-slo-ms", type=float, help="p95 per-query search latency budget.")
+    parser.add_argument("--min-recall", type=float, help="Required recall@k against exact search.")
+    parser.add_argument("--factories", help="Extra index_factory strings to try, ';'-separated (e.g. 'IVF256,PQ16;HNSW16').")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write all trials + frontier as JSON here.")
+    parser.add_argument("--write", action="store_true", help="Write the recommended vector_store block back into --config.")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    cfg = load_user_config(args.config)
+    retriever = build_retriever(cfg)
+    vectors, documents = load_vectors(retriever)
+    import numpy as np  # type: ignore
+
+    queries = np.asarray(retriever.embed_texts(sample_queries(documents, args.queries, args.seed)), dtype="float32")
+    top_k = min(args.top_k, len(documents))
+
+    candidates = default_candidates(len(documents), vectors.shape[1])
+    for factory in (args.factories or "").split(";"):
+        factory = factory.strip()
+        if not factory:
+            continue
+        lowered = factory.lower()
+        if "ivf" in lowered:
+            candidates.append((factory, "nprobe", [1, 2, 4, 8, 16, 32, 64]))
+        elif "hnsw" in lowered:
+            candidates.append((factory, "efSearch", [16, 32, 64, 128, 256]))
+        else:
+            candidates.append((factory, "", [0]))
+
+    results = run_trials(vectors, queries, top_k, candidates)
+    frontier = pareto_frontier(results)
+    choice = choose(frontier, args.latency_slo_ms, args.min_recall)
+
+    log_title("AUTOTUNE")
+    print(f"vectors: {len(documents)}  dim: {vectors.shape[1]}  queries: {len(queries)}  k: {top_k}")
+    print(f"{'index_factory':<18} {'params':<16} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8} {'memory':>10}")
+    for r in frontier:
+        params = ",".join(f"{k}={v}" for k, v in r.search_params.items()) or "-"
+        marker = "  <= chosen" if r is choice else ""
+        print(
+            f"{r.index_factory:<18} {params:<16} {r.recall:>7.3f} {r.latency_p50_ms:>8.3f} "
+            f"{r.latency_p95_ms:>8.3f} {r.memory_bytes / 2**20:>8.2f}MB{marker}"
+        )
+
+    report = {
+        "top_k": top_k,
+        "num_vectors": len(documents),
+        "trials": [asdict(r) for r in results],
+        "frontier": [asdict(r) for r in frontier],
+        "chosen": asdict(choice) if choice else None,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+
+    if not choice:
+        print("No configuration satisfies the constraints; relax --latency-slo-ms / --min-recall.")
+        return
+    block = recommended_block(cfg.get("vector_store", {}), choice)
+    log_title("RECOMMENDED CONFIG")
+    print(json.dumps({"vector_store": block}, ensure_ascii=False, indent=2))
+    if args.write:
+        config_path = Path(args.config)
+        raw = json.loads(config_path.read_text(encoding="utf-8"))
+        raw["vector_store"] = block
+        config_path.write_text(json.dumps(raw, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"Written to {config_path}. Rebuild the index to apply: jarvis index --config {config_path}")
+
+
+if __name__ == "__main__":
+    main()
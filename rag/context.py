@@ -1,14 +1,16 @@
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, List, Optional
 
 from agent.llm_client import SimpleLLMClient
 from rag.embedding_retriever import EmbeddingRetriever
-from rag.loader import load_file
+from rag.indexer import compute_data_signature, update_index
 from rag.query_rewriter import QueryRewriter
 from utils import log_title
+from utils.tracer import traced
 from utils.ui import BaseUI
 
 
+@traced("retrieve_context")
 def retrieve_context(
     task: str,
     knowledge_globs: List[str],
@@ -20,6 +22,10 @@ def retrieve_context(
     vector_store_config: Optional[dict] = None,
     tracer=None,
     ui: Optional[BaseUI] = None,
+    live_index=None,
+    embedding_backend: Optional[str] = None,
+    hashing_config: Optional[dict] = None,
+    proceed: Optional[Callable[[], bool]] = None,
 ) -> str:
     """
     Embed knowledge sources and retrieve top matches for the given task.
@@ -33,6 +39,13 @@ def retrieve_context(
         rewrite_num_queries: Number of queries to generate if rewriting is enabled
         llm_model: LLM model name for query rewriting
         vector_store_config: Vector store backend config (faiss only)
+        live_index: Optional LiveKnowledgeIndex kept fresh in the background; when given,
+            no change detection or indexing happens on this path
+        embedding_backend: "hashing" for the built-in local embedder (no server needed)
+        hashing_config: HashingEmbedder parameters (dim, projection_dim, ngram_range, word_tokens)
+        proceed: For speculative runs (agent/scheduler.py): called once the index is ready, before
+            the query is rewritten or embedded; False returns no context. Indexing before it
+            reports through `ui`/stdout as usual.
         
     Note:
         base_url and api_key are read from .env environment variables
@@ -40,14 +53,32 @@ def retrieve_context(
     ui = ui or BaseUI()
     if ui.enabled:
         ui.stage("RAG Retrieval", "in_progress")
+    if live_index is not None:
+        retriever = live_index.current()
+        if retriever is None:
+            # first background build still running; answer without knowledge rather than wait
+            if tracer:
+                tracer.log_event({"type": "context_index_not_ready"})
+            if ui.enabled:
+                ui.stage("RAG Retrieval", "completed")
+            else:
+                print("Knowledge index is still being built in the background; skipping retrieval.")
+            return ""
+        if tracer:
+            tracer.log_event({"type": "context_live_index", "version": live_index.version})
+        return _search(retriever, task, enable_rewrite, rewrite_num_queries, llm_model, tracer, ui, proceed)
+
     data_signature = _compute_data_signature(knowledge_globs)
     retriever = EmbeddingRetriever(
         model=embed_model,
         chunking_strategy=chunking_strategy,
         vector_store_config=vector_store_config,
+        backend=embedding_backend,
+        hashing_config=hashing_config,
     )
-    retriever.set_meta_info(embed_model, chunking_strategy, data_signature)
-    retriever.ensure_compatibility(embed_model, chunking_strategy, data_signature)
+    # only a model/chunking mismatch invalidates the index; changed files are updated incrementally
+    # (retriever.model is the effective model, e.g. the hashing parameters for the local backend)
+    retriever.ensure_compatibility(retriever.model, chunking_strategy)
     if tracer:
         tracer.log_event(
             {
@@ -56,31 +87,41 @@ def retrieve_context(
                 "reuse_index": False,
             }
         )
-    reuse_index = retriever.has_ready_index(embed_model, chunking_strategy, data_signature)
+    reuse_index = retriever.has_ready_index(retriever.model, chunking_strategy, data_signature)
     if tracer and reuse_index:
         tracer.log_event({"type": "context_reuse_index", "size": getattr(retriever.vector_store, "size", lambda: None)() if retriever.vector_store else None})
     if not reuse_index:
+        # Normally `jarvis index` has already built the index; otherwise update it here
+        # (resuming from any checkpoint left by an interrupted run).
         if ui.enabled:
             ui.detail("RAG", "Indexing knowledge base...")
-        for pattern in knowledge_globs:
-            for file_path in sorted(Path.cwd().glob(pattern)):
-                if not file_path.is_file():
-                    continue
-                
-                # Use unified loader to handle files of different formats
-                content = load_file(file_path)
-                
-                if content.strip():
-                    # doc_id is file name
-                    retriever.embed_document(content)
-    else:
-        # reuse FAISS index: hydrate keyword buffer from persisted docs if available
-        if hasattr(retriever.vector_store, "id_to_doc"):
-            retriever.documents_buffer = list(getattr(retriever.vector_store, "id_to_doc", {}).values())
+        else:
+            print("Knowledge index missing or stale; run `jarvis index` to build it ahead of time.")
+        update_index(retriever, knowledge_globs, ui=ui, tracer=tracer)
+    # hydrate keyword buffer from the indexed chunks
+    retriever.documents_buffer = retriever.vector_store.all_documents()
 
     # build keyword/BM25 index for hybrid search
     retriever.build_keyword_index()
-            
+    return _search(retriever, task, enable_rewrite, rewrite_num_queries, llm_model, tracer, ui, proceed)
+
+
+def _search(
+    retriever: EmbeddingRetriever,
+    task: str,
+    enable_rewrite: bool,
+    rewrite_num_queries: int,
+    llm_model: Optional[str],
+    tracer,
+    ui: BaseUI,
+    proceed: Optional[Callable[[], bool]] = None,
+) -> str:
+    if proceed is not None and not proceed():
+        if tracer:
+            tracer.log_event({"type": "context_skipped", "reason": "speculation_discarded"})
+        if ui.enabled:
+            ui.stage("RAG Retrieval", "pending")
+        return ""
     # --- Retrieval Logic ---
     search_queries = [task]
     if enable_rewrite and llm_model:
@@ -132,8 +173,6 @@ def retrieve_context(
     else:
         log_title("CONTEXT")
         print(context)
-    # 保存向量索引（仅对支持持久化的后端有效，例如 FAISS）
-    retriever.save_if_possible()
     if tracer:
         tracer.log_event({"type": "context_done", "chunks": len(all_results)})
     return context
@@ -143,14 +182,4 @@ def _compute_data_signature(knowledge_globs: List[str]) -> str:
     """
     Lightweight signature based on file path + mtime to detect knowledge changes.
     """
-    parts = []
-    for pattern in knowledge_globs:
-        for file_path in sorted(Path.cwd().glob(pattern)):
-            if not file_path.is_file():
-                continue
-            try:
-                mtime = file_path.stat().st_mtime
-                parts.append(f"{file_path.relative_to(Path.cwd())}:{mtime}")
-            except Exception:
-                continue
-    return "|".join(parts)
+    return compute_data_signature(knowledge_globs)
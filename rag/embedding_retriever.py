@@ -1,3 +1,5 @@
+import copy
+import hashlib
 import json
 import os
 import re
@@ -16,6 +18,10 @@ except Exception:  # pragma: no cover - optional dependency
     jieba = None
 
 from utils import log_title
+from utils.rate_limit import COALESCER, limiter_for
+from utils.tokens import count_text
+from utils.tracer import span, traced
+from rag.hashing_embedder import HashingEmbedder
 from rag.vector_store_faiss import FaissVectorStore
 from rag.chunk.recursive import RecursiveCharacterTextSplitter
 
@@ -24,12 +30,13 @@ class EmbeddingRetriever:
     """
     Embedding 服务封装。
     
-    支持两种模式：
+    支持三种模式：
     1. OpenAI 兼容 API（包括 OpenAI 官方、DeepBricks 等）
     2. Ollama 原生 API
+    3. 本地 hashing 向量化（backend="hashing"，无需任何服务，见 rag/hashing_embedder.py）
     
     配置优先级：
-    - 构造函数参数 > 环境变量
+    - 构造函数参数 > 环境变量（EMBEDDING_BACKEND 可切换到 hashing）
     """
 
     def __init__(
@@ -39,28 +46,40 @@ class EmbeddingRetriever:
         api_key: Optional[str] = None,
         chunking_strategy: str = "whole",  # "whole" or "recursive"
         vector_store_config: Optional[dict] = None,
+        backend: Optional[str] = None,  # "hashing" for the local embedder; None = detect from URL/env
+        hashing_config: Optional[dict] = None,
     ) -> None:
         self.model = model
         self.base_url = base_url
         self.api_key = api_key
         self.chunking_strategy = chunking_strategy
         self.vector_store_config = vector_store_config or {}
-        backend = self.vector_store_config.get("backend", "faiss")
-        self.vector_store = self._init_vector_store(backend)
+        self.vector_store = self._init_vector_store(self.vector_store_config.get("backend", "faiss"))
         self.documents_buffer: List[str] = []
         self.bm25 = None
         self.last_scores: List[dict] = []
+        # token count reported by the last batch embedding call (None if unknown)
+        self.last_usage_tokens: Optional[int] = None
         
         # 初始化切分器
         self.recursive_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
         
         # 确定使用哪种 API
-        self._detect_api_type()
+        self._local: Optional[HashingEmbedder] = None
+        backend = (backend or os.environ.get("EMBEDDING_BACKEND") or "").lower()
+        if backend in ("hashing", "local"):
+            self._api_type = "local"
+            self._local = HashingEmbedder.from_config(hashing_config)
+            # index metadata records the embedder parameters, so changing them forces a re-index
+            self.model = self._local.model_name
+        else:
+            self._detect_api_type()
 
     def _detect_api_type(self) -> None:
         """检测应该使用哪种 API"""
         # 优先使用传入的参数
         if self.base_url:
+            self._rate_base = self.base_url
             # 如果 URL 包含 /v1，认为是 OpenAI 兼容格式
             if "/v1" in self.base_url:
                 self._api_type = "openai"
@@ -77,10 +96,12 @@ class EmbeddingRetriever:
         ollama_url = os.environ.get("OLLAMA_EMBED_BASE_URL")
         
         if openai_url and openai_key:
+            self._rate_base = openai_url
             self._api_type = "openai"
             self._endpoint = f"{openai_url.rstrip('/')}/embeddings"
             self.api_key = openai_key
         elif ollama_url:
+            self._rate_base = ollama_url
             self._api_type = "ollama"
             self._endpoint = f"{ollama_url.rstrip('/')}/api/embeddings"
         else:
@@ -88,21 +109,38 @@ class EmbeddingRetriever:
                 "Embedding 配置缺失。请设置以下任一组合：\n"
                 "1. 构造函数传入 base_url\n"
                 "2. 环境变量 EMBEDDING_BASE_URL + EMBEDDING_KEY\n"
-                "3. 环境变量 OLLAMA_EMBED_BASE_URL"
+                "3. 环境变量 OLLAMA_EMBED_BASE_URL\n"
+                "4. 本地 hashing：配置 embedding.backend = \"hashing\"（或环境变量 EMBEDDING_BACKEND=hashing）"
             )
 
-    def embed_document(self, document: str) -> Optional[List[float]]:
-        log_title("EMBEDDING DOCUMENT")
-        
-        chunks = []
+    def fork(self) -> "EmbeddingRetriever":
+        """
+        Copy of this retriever with an independent vector store and empty keyword index.
+        """
+        other = copy.copy(self)
+        other.vector_store = self.vector_store.clone()
+        other.documents_buffer = []
+        other.bm25 = None
+        other.last_scores = []
+        return other
+
+    def split_document(self, document: str) -> List[str]:
+        """
+        Split a document according to the configured chunking strategy.
+        """
         # Check strategy (default to whole if not set)
         strategy = getattr(self, 'chunking_strategy', 'whole')
-        
         if strategy == "recursive":
-            chunks = self.recursive_splitter.split_text(document)
+            return self.recursive_splitter.split_text(document)
+        return [document]
+
+    def embed_document(self, document: str) -> Optional[List[float]]:
+        log_title("EMBEDDING DOCUMENT")
+        
+        chunks = self.split_document(document)
+        if getattr(self, 'chunking_strategy', 'whole') == "recursive":
             print(f"  - Splitting document into {len(chunks)} chunks (Recursive)")
         else:
-            chunks = [document]
             print(f"  - Using whole document as 1 chunk (Default)")
             
         last_embedding = None
@@ -121,21 +159,25 @@ class EmbeddingRetriever:
         log_title("EMBEDDING QUERY")
         return self._embed(query)
 
+    @traced("retriever.retrieve")
     def retrieve(self, query: str, top_k: int = 3) -> List[str]:
         self.last_scores = []
-        query_embedding = self.embed_query(query)
+        with span("retriever.embed_query", backend=getattr(self, "_api_type", None)):
+            query_embedding = self.embed_query(query)
         if not self.vector_store:
             return []
         # 如果还没有文档被添加，返回空
         if getattr(self.vector_store, "size", None) and self.vector_store.size() == 0:
             return []
-        vector_results_with_scores = self.vector_store.search_with_scores(query_embedding, top_k)
+        with span("retriever.vector_search", top_k=top_k):
+            vector_results_with_scores = self.vector_store.search_with_scores(query_embedding, top_k)
         vector_results = [doc for doc, _ in vector_results_with_scores]
 
         # 确保 BM25 已构建
-        if not self.bm25 and self.documents_buffer:
-            self.build_keyword_index()
-        keyword_results_with_scores = self.retrieve_keyword_with_scores(query, top_k)
+        with span("retriever.bm25_search", top_k=top_k):
+            if not self.bm25 and self.documents_buffer:
+                self.build_keyword_index()
+            keyword_results_with_scores = self.retrieve_keyword_with_scores(query, top_k)
         keyword_results = [doc for doc, _ in keyword_results_with_scores]
 
         # prepare fusion records
@@ -173,45 +215,89 @@ class EmbeddingRetriever:
 
         return [rec["doc"] for rec in fused_records[:top_k]]
 
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a batch of texts. OpenAI-compatible endpoints take the whole batch in
+        one request; Ollama's /api/embeddings only accepts a single prompt. The local
+        backend returns a float32 array with one row per text.
+        """
+        self.last_usage_tokens = None
+        if not texts:
+            return []
+        if self._api_type == "local":
+            return self._local.embed(texts)
+        if self._api_type == "openai":
+            return self._embed_openai_batch(texts)
+        return [self._embed(text) for text in texts]
+
     def _embed(self, text: str) -> List[float]:
+        if self._api_type == "local":
+            return self._local.embed([text])[0]
+        # the same text embedded concurrently (e.g. one query from two sessions) is sent once
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        key = f"embed|{self._endpoint}|{self.model}|{digest}"
         if self._api_type == "openai":
-            return self._embed_openai(text)
+            return COALESCER.do(key, lambda: self._embed_openai(text))
         else:
-            return self._embed_ollama(text)
+            return COALESCER.do(key, lambda: self._embed_ollama(text))
 
-    def _embed_openai(self, text: str) -> List[float]:
-        """OpenAI 兼容 API 格式"""
+    def _post(self, payload: dict, timeout: float, tokens: int) -> dict:
+        """
+        POST to the embedding endpoint through its rate limiter (utils/rate_limit.py).
+        """
         headers = {"Content-Type": "application/json"}
         if self.api_key:
             headers["Authorization"] = f"Bearer {self.api_key}"
-        
-        response = requests.post(
-            self._endpoint,
-            headers=headers,
-            json={
+
+        def send() -> dict:
+            response = requests.post(self._endpoint, headers=headers, json=payload, timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+
+        limiter = limiter_for(self._rate_base, self.model)
+        if limiter is None:
+            return send()
+        return limiter.call(tokens, send, lambda data: (data.get("usage") or {}).get("prompt_tokens"))
+
+    def _embed_openai(self, text: str) -> List[float]:
+        """OpenAI 兼容 API 格式"""
+        data = self._post(
+            {
                 "model": self.model,
                 "input": text,
                 "encoding_format": "float",
             },
             timeout=60,
+            tokens=count_text(text, self.model),
         )
-        response.raise_for_status()
-        data = response.json()
         return data["data"][0]["embedding"]
 
+    def _embed_openai_batch(self, texts: List[str]) -> List[List[float]]:
+        data = self._post(
+            {
+                "model": self.model,
+                "input": texts,
+                "encoding_format": "float",
+            },
+            timeout=120,
+            tokens=sum(count_text(text, self.model) for text in texts),
+        )
+        usage = data.get("usage") or {}
+        self.last_usage_tokens = usage.get("prompt_tokens") or usage.get("total_tokens")
+        # the API may return items out of order; "index" is authoritative
+        items = sorted(data["data"], key=lambda item: item.get("index", 0))
+        return [item["embedding"] for item in items]
+
     def _embed_ollama(self, text: str) -> List[float]:
         """Ollama 原生 API 格式"""
-        response = requests.post(
-            self._endpoint,
-            headers={"Content-Type": "application/json"},
-            json={
+        data = self._post(
+            {
                 "model": self.model,
                 "prompt": text,
             },
             timeout=60,
+            tokens=count_text(text, self.model),
         )
-        response.raise_for_status()
-        data = response.json()
         return data["embedding"]
 
     def _init_vector_store(self, backend: str):
@@ -221,6 +307,7 @@ class EmbeddingRetriever:
                 index_factory=self.vector_store_config.get("index_factory", "Flat"),
                 persist_path=self.vector_store_config.get("path"),
                 metadata_path=self.vector_store_config.get("meta_path"),
+                search_params=self.vector_store_config.get("search_params"),
             )
             try:
                 store.load()
@@ -0,0 +1,199 @@
+"""
+Local, deterministic embedding backend: signed feature hashing over character n-grams and
+word tokens, with optional Gaussian random projection to a fixed dimension.
+
+No server, no model download, identical vectors on every machine, which makes it
+suitable for tests, CI, air-gapped boxes and benchmarks. Select it in the user config:
+
+    "embedding": {
+        "backend": "hashing",
+        "model": "hashing",
+        "chunking_strategy": "recursive",
+        "hashing": {"dim": 4096, "projection_dim": 512, "ngram_range": [2, 4], "word_tokens": "regex"}
+    }
+
+Everything except the optional jieba tokenization is vectorized with NumPy: the whole batch is
+concatenated into one code-point array and every n-gram / word hash comes from a single
+prefix-sum polynomial hash (mod 2**64), so a batch costs a handful of array passes.
+"""
+import math
+import zlib
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import jieba
+except Exception:  # pragma: no cover - optional dependency
+    jieba = None
+
+_MASK64 = (1 << 64) - 1
+# odd multiplier => invertible mod 2**64, which lets segment hashes come from prefix sums
+_BASE = 0x100000001B3
+_BASE_INV = pow(_BASE, -1, 1 << 64)
+_WORD_SEED = 0x9E3779B97F4A7C15
+
+
+def _mix(h: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer: spreads polynomial hashes over all 64 bits."""
+    h = h ^ (h >> np.uint64(30))
+    h = h * np.uint64(0xBF58476D1CE4E5B9)
+    h = h ^ (h >> np.uint64(27))
+    h = h * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def _powers(base: int, count: int) -> np.ndarray:
+    powers = np.full(count, base, dtype=np.uint64)
+    powers[0] = 1
+    return np.cumprod(powers, dtype=np.uint64)
+
+
+class HashingEmbedder:
+    """
+    Stateless feature-hashing vectorizer; `embed(texts)` returns L2-normalized float32 rows.
+    """
+
+    def __init__(
+        self,
+        dim: int = 4096,
+        ngram_range: Sequence[int] = (2, 4),
+        word_tokens: Optional[str] = "regex",
+        projection_dim: Optional[int] = None,
+        seed: int = 0,
+    ) -> None:
+        if word_tokens not in (None, "none", "regex", "jieba"):
+            raise ValueError(f"Unsupported word_tokens '{word_tokens}' (use 'regex', 'jieba' or None)")
+        if word_tokens == "jieba" and jieba is None:
+            raise RuntimeError("word_tokens='jieba' requested but jieba is not installed")
+        self.dim = int(dim)
+        self.ngram_range = (int(ngram_range[0]), int(ngram_range[1]))
+        self.word_tokens = None if word_tokens == "none" else word_tokens
+        self.projection_dim = int(projection_dim) if projection_dim else None
+        self.seed = int(seed)
+        self._projection: Optional[np.ndarray] = None
+        self._pow_cache = None
+        if self.projection_dim:
+            rng = np.random.default_rng(self.seed)
+            self._projection = (
+                rng.standard_normal((self.dim, self.projection_dim)).astype(np.float32) / math.sqrt(self.projection_dim)
+            )
+
+    @classmethod
+    def from_config(cls, cfg: Optional[Dict] = None) -> "HashingEmbedder":
+        cfg = cfg or {}
+        return cls(
+            dim=cfg.get("dim", 4096),
+            ngram_range=tuple(cfg.get("ngram_range", (2, 4))),
+            word_tokens=cfg.get("word_tokens", "regex"),
+            projection_dim=cfg.get("projection_dim"),
+            seed=cfg.get("seed", 0),
+        )
+
+    @property
+    def output_dim(self) -> int:
+        return self.projection_dim or self.dim
+
+    @property
+    def model_name(self) -> str:
+        """
+        Identifier stored in index metadata; any parameter change forces a re-index.
+        """
+        lo, hi = self.ngram_range
+        proj = f"-p{self.projection_dim}" if self.projection_dim else ""
+        return f"hashing-d{self.dim}{proj}-n{lo}_{hi}-{self.word_tokens or 'none'}-s{self.seed}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        n_docs = len(texts)
+        if n_docs == 0:
+            return np.zeros((0, self.output_dim), dtype=np.float32)
+        lowered = [text.lower() for text in texts]
+        # one code-point array for the whole batch; a 0 separator closes every doc
+        joined = "\0".join(lowered) + "\0"
+        cps = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        lengths = np.fromiter((len(t) + 1 for t in lowered), dtype=np.int64, count=n_docs)
+        doc_of = np.repeat(np.arange(n_docs, dtype=np.int64), lengths)
+        total = cps.shape[0]
+
+        # prefix sums of cp[j] * BASE^-j, so hash(s..e) = BASE^e * (C[e+1] - C[s]) (mod 2**64)
+        pow_base, pow_inv = self._powers_for(total)
+        prefix = np.zeros(total + 1, dtype=np.uint64)
+        np.cumsum(cps * pow_inv[:total], dtype=np.uint64, out=prefix[1:])
+
+        is_sep = cps == 0
+        is_space = (cps == 32) | (cps == 10) | (cps == 9) | (cps == 13)
+        keys: List[np.ndarray] = []
+        weights: List[np.ndarray] = []
+
+        lo, hi = self.ngram_range
+        for n in range(lo, hi + 1):
+            count = total - n + 1
+            if count <= 0:
+                continue
+            # n-gram i spans [i, i+n-1]; contiguous slices avoid fancy-index gathers.
+            # Drop n-grams that cross a document boundary or start and end on whitespace.
+            valid = (doc_of[:count] == doc_of[n - 1 :]) & ~is_sep[n - 1 :]
+            valid &= ~(is_space[:count] & is_space[n - 1 :])
+            h = pow_base[n - 1 : total] * (prefix[n:] - prefix[:count])
+            self._collect(h[valid], n * 0x1F1F1F1F, doc_of[:count][valid], keys, weights)
+
+        if self.word_tokens == "regex":
+            # words = maximal runs of [0-9a-z_] or Latin letters; CJK is covered by the n-grams
+            is_word = (
+                ((cps >= 48) & (cps <= 57)) | ((cps >= 97) & (cps <= 122)) | (cps == 95) | ((cps >= 0xC0) & (cps <= 0x24F))
+            )
+            edges = np.diff(is_word.view(np.int8), prepend=np.int8(0), append=np.int8(0))
+            starts = np.flatnonzero(edges == 1)
+            ends = np.flatnonzero(edges == -1) - 1
+            if starts.size:
+                h = pow_base[ends] * (prefix[ends + 1] - prefix[starts])
+                self._collect(h, _WORD_SEED, doc_of[starts], keys, weights)
+        elif self.word_tokens == "jieba":
+            for doc_idx, text in enumerate(lowered):
+                tokens = [tok for tok in jieba.cut(text) if tok.strip()]
+                if not tokens:
+                    continue
+                h = np.fromiter(
+                    ((zlib.crc32(tok.encode("utf-8")) << 32 | len(tok)) & _MASK64 for tok in tokens),
+                    dtype=np.uint64,
+                    count=len(tokens),
+                )
+                self._collect(h, _WORD_SEED, np.full(len(tokens), doc_idx, dtype=np.int64), keys, weights)
+
+        if keys:
+            counts = np.bincount(
+                np.concatenate(keys), weights=np.concatenate(weights), minlength=n_docs * self.dim
+            ).astype(np.float32)
+            # sublinear term frequency so long chunks are not dominated by frequent n-grams
+            np.copysign(np.sqrt(np.abs(counts)), counts, out=counts)
+            vectors = counts.reshape(n_docs, self.dim)
+        else:
+            vectors = np.zeros((n_docs, self.dim), dtype=np.float32)
+        if self._projection is not None:
+            vectors = vectors @ self._projection
+        norms = np.sqrt(np.einsum("ij,ij->i", vectors, vectors))[:, None]
+        norms[norms == 0] = 1.0
+        vectors /= norms
+        return vectors
+
+    def _powers_for(self, total: int):
+        # BASE^j and BASE^-j tables, grown geometrically and reused across batches
+        if self._pow_cache is None or self._pow_cache[0].shape[0] < total:
+            size = max(total, 2 * (0 if self._pow_cache is None else self._pow_cache[0].shape[0]))
+            self._pow_cache = (_powers(_BASE, size), _powers(_BASE_INV, size))
+        return self._pow_cache
+
+    def _collect(
+        self,
+        hashes: np.ndarray,
+        salt: int,
+        doc_ids: np.ndarray,
+        keys: List[np.ndarray],
+        weights: List[np.ndarray],
+    ) -> None:
+        hashes = _mix(hashes ^ np.uint64((salt ^ self.seed) & _MASK64))
+        # low bits pick the bucket, the top bit the sign
+        buckets = (hashes % np.uint64(self.dim)).astype(np.int64)
+        buckets += doc_ids * self.dim
+        keys.append(buckets)
+        weights.append(1.0 - 2.0 * (hashes >> np.uint64(63)).astype(np.float64))
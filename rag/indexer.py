@@ -0,0 +1,311 @@
+"""
+Offline knowledge indexing: build or incrementally update the FAISS index outside the chat loop.
+
+Usage:
+    jarvis index --config config/user_RAG.json
+    python -m rag.indexer --config config/user_RAG.json --workers 8 --batch-size 64
+
+Notes:
+- Files are loaded in parallel and embedded in batches.
+- Each file is recorded in the index metadata (path -> mtime) once all of its chunks are in,
+  and the index is checkpointed to disk every `checkpoint_every` chunks. Re-running after an
+  interruption resumes from the last checkpoint: finished files are skipped.
+- Unchanged files are skipped on later runs as well, so this doubles as an incremental update.
+"""
+import argparse
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from rag.embedding_retriever import EmbeddingRetriever
+from rag.loader import load_file
+from utils import log_title
+from utils.ui import BaseUI
+
+# Marker stored as data_signature while an index is only partially built, so the
+# interactive path never mistakes a checkpoint for a finished index.
+PARTIAL_SIGNATURE = "partial"
+
+
+@dataclass
+class IndexStats:
+    files_total: int = 0
+    files_indexed: int = 0
+    files_skipped: int = 0
+    files_removed: int = 0
+    chunks: int = 0
+    tokens: int = 0
+    checkpoints: int = 0
+    elapsed: float = 0.0
+    rebuilt: bool = False
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def tokens_per_sec(self) -> float:
+        return self.tokens / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "files_total": self.files_total,
+            "files_indexed": self.files_indexed,
+            "files_skipped": self.files_skipped,
+            "files_removed": self.files_removed,
+            "chunks": self.chunks,
+            "tokens": self.tokens,
+            "checkpoints": self.checkpoints,
+            "elapsed_s": round(self.elapsed, 3),
+            "chunks_per_s": round(self.chunks_per_sec, 2),
+            "tokens_per_s": round(self.tokens_per_sec, 2),
+            "rebuilt": self.rebuilt,
+            "errors": self.errors,
+        }
+
+
+def iter_knowledge_files(knowledge_globs: List[str]) -> Iterator[Tuple[Path, str, str]]:
+    """
+    Yield (path, relative key, mtime signature) for every file matched by the globs.
+    """
+    root = Path.cwd()
+    for pattern in knowledge_globs:
+        for file_path in sorted(root.glob(pattern)):
+            if not file_path.is_file():
+                continue
+            try:
+                mtime = file_path.stat().st_mtime
+            except Exception:
+                continue
+            yield file_path, str(file_path.relative_to(root)), str(mtime)
+
+
+def compute_data_signature(knowledge_globs: List[str]) -> str:
+    """
+    Lightweight signature based on file path + mtime to detect knowledge changes.
+    """
+    return "|".join(f"{key}:{mtime}" for _, key, mtime in iter_knowledge_files(knowledge_globs))
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token estimate (one per CJK character or latin word) when the API reports no usage.
+    """
+    return len(re.findall(r"[\u4e00-\u9fff]|\w+", text))
+
+
+def update_index(
+    retriever: EmbeddingRetriever,
+    knowledge_globs: List[str],
+    workers: int = 4,
+    batch_size: int = 32,
+    checkpoint_every: int = 256,
+    rebuild: bool = False,
+    ui: Optional[BaseUI] = None,
+    tracer=None,
+    show_progress: bool = True,
+) -> IndexStats:
+    """
+    Bring the retriever's vector store in line with the files matched by knowledge_globs.
+
+    Only new or modified files are (re-)embedded; files that disappeared are dropped.
+    The store is persisted at checkpoints and at the end (if it has a persist path).
+    Pass show_progress=False when running in the background.
+    """
+    ui = ui or BaseUI()
+    store = retriever.vector_store
+    stats = IndexStats()
+    start = time.perf_counter()
+
+    files = list(iter_knowledge_files(knowledge_globs))
+    stats.files_total = len(files)
+
+    # Indexes built before per-source tracking cannot be updated incrementally.
+    legacy = store.size() > 0 and not store.id_to_source
+    if rebuild or legacy:
+        store.reset()
+        stats.rebuilt = True
+
+    pending = _plan_updates(store, files, stats)
+    if pending is None:
+        # index type without remove support (e.g. HNSW): start over
+        store.reset()
+        stats.rebuilt = True
+        stats.files_removed = 0
+        pending = list(files)
+    stats.files_skipped = stats.files_total - len(pending)
+
+    if tracer:
+        tracer.log_event(
+            {
+                "type": "index_start",
+                "files_total": stats.files_total,
+                "files_pending": len(pending),
+                "rebuilt": stats.rebuilt,
+            }
+        )
+
+    chunks_since_checkpoint = 0
+    if pending:
+        store.set_meta_info(retriever.model, retriever.chunking_strategy, PARTIAL_SIGNATURE)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool, (
+            ui.progress(len(pending), "Indexing") if show_progress else _SilentProgress()
+        ) as bar:
+            for (file_path, key, mtime), content in _load_ahead(pool, pending, max(1, workers) * 2):
+                try:
+                    chunks = [chunk for chunk in retriever.split_document(content) if chunk.strip()] if content.strip() else []
+                    for i in range(0, len(chunks), max(1, batch_size)):
+                        batch = chunks[i : i + batch_size]
+                        embeddings = retriever.embed_texts(batch)
+                        store.add_embeddings(embeddings, batch, source=key)
+                        stats.chunks += len(batch)
+                        stats.tokens += retriever.last_usage_tokens or sum(estimate_tokens(c) for c in batch)
+                        chunks_since_checkpoint += len(batch)
+                except Exception as exc:
+                    # drop the half-indexed file; it will be retried on the next run
+                    store.remove_source(key)
+                    stats.errors.append(f"{key}: {exc}")
+                    bar.advance(1, f"failed: {key}")
+                    continue
+                store.source_signatures[key] = mtime
+                stats.files_indexed += 1
+                elapsed = time.perf_counter() - start
+                bar.advance(1, f"{stats.chunks} chunks, {stats.chunks / elapsed:.1f} chunks/s")
+                if checkpoint_every and chunks_since_checkpoint >= checkpoint_every:
+                    store.save()
+                    stats.checkpoints += 1
+                    chunks_since_checkpoint = 0
+                    if tracer:
+                        tracer.log_event({"type": "index_checkpoint", "files_indexed": stats.files_indexed, "chunks": stats.chunks})
+
+    signature = PARTIAL_SIGNATURE if stats.errors else "|".join(f"{key}:{mtime}" for _, key, mtime in files)
+    store.set_meta_info(retriever.model, retriever.chunking_strategy, signature)
+    if pending or stats.files_removed or stats.rebuilt:
+        store.save()
+    stats.elapsed = time.perf_counter() - start
+    if tracer:
+        tracer.log_event({"type": "index_done", **stats.to_dict()})
+    return stats
+
+
+class _SilentProgress:
+    def __enter__(self) -> "_SilentProgress":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+    def advance(self, step: int = 1, info: str = "") -> None:
+        pass
+
+
+def _plan_updates(store, files: List[Tuple[Path, str, str]], stats: IndexStats) -> Optional[list]:
+    """
+    Drop stale sources from the store and return the files that need (re-)embedding.
+    Returns None if the index cannot remove entries.
+    """
+    current_keys = {key for _, key, _ in files}
+    indexed = set(store.source_signatures) | set(store.id_to_source.values())
+    for source in indexed - current_keys:
+        if not store.remove_source(source):
+            return None
+        stats.files_removed += 1
+
+    pending = []
+    for file_path, key, mtime in files:
+        if store.source_signatures.get(key) == mtime:
+            continue
+        if key in indexed and not store.remove_source(key):
+            return None
+        pending.append((file_path, key, mtime))
+    return pending
+
+
+def index_up_to_date(store, files: List[Tuple[Path, str, str]]) -> bool:
+    """
+    True when the store already holds exactly these files at these mtimes (read-only check).
+    """
+    indexed = set(store.source_signatures) | set(store.id_to_source.values())
+    if indexed != {key for _, key, _ in files}:
+        return False
+    return all(store.source_signatures.get(key) == mtime for _, key, mtime in files)
+
+
+def _load_ahead(pool: ThreadPoolExecutor, files: list, depth: int) -> Iterator[Tuple[tuple, str]]:
+    """
+    Load files in the pool, keeping at most `depth` in flight, and yield them in order.
+    """
+    queue: deque = deque()
+    for item in files:
+        queue.append((item, pool.submit(load_file, item[0])))
+        if len(queue) >= depth:
+            head, future = queue.popleft()
+            yield head, future.result()
+    while queue:
+        head, future = queue.popleft()
+        yield head, future.result()
+
+
+def build_retriever(cfg: dict) -> EmbeddingRetriever:
+    embed_cfg = cfg["embedding"]
+    return EmbeddingRetriever(
+        model=embed_cfg["model"],
+        chunking_strategy=embed_cfg["chunking_strategy"],
+        vector_store_config=cfg.get("vector_store", {}),
+        backend=embed_cfg.get("backend"),
+        hashing_config=embed_cfg.get("hashing"),
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from dotenv import load_dotenv
+
+    from config.loader import load_user_config
+    from utils import rate_limit
+    from utils.ui import get_ui
+
+    parser = argparse.ArgumentParser(prog="jarvis index", description="Build or update the knowledge index.")
+    parser.add_argument("--config", default="config/user_RAG.json", help="Config file with knowledge_globs/embedding/vector_store.")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel file loaders.")
+    parser.add_argument("--batch-size", type=int, default=32, help="Chunks per embedding request.")
+    parser.add_argument("--checkpoint-every", type=int, default=256, help="Persist the index every N chunks (0 disables).")
+    parser.add_argument("--rebuild", action="store_true", help="Discard the existing index and rebuild from scratch.")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    cfg = load_user_config(args.config)
+    # bulk embedding stays under the endpoint's limits instead of bursting into 429s
+    rate_limit.configure(cfg.get("rate_limits"))
+    if not cfg.get("vector_store", {}).get("path"):
+        print("[warn] vector_store.path is not set; the index will not be persisted.")
+    ui = get_ui(cfg.get("tui", {}).get("enabled", False))
+    retriever = build_retriever(cfg)
+    retriever.ensure_compatibility(retriever.model, cfg["embedding"]["chunking_strategy"])
+
+    stats = update_index(
+        retriever,
+        cfg.get("knowledge_globs", []),
+        workers=args.workers,
+        batch_size=args.batch_size,
+        checkpoint_every=args.checkpoint_every,
+        rebuild=args.rebuild,
+        ui=ui,
+    )
+    log_title("INDEX")
+    print(
+        f"files: {stats.files_indexed} indexed, {stats.files_skipped} unchanged, {stats.files_removed} removed "
+        f"(of {stats.files_total})"
+    )
+    print(f"chunks: {stats.chunks} in {stats.elapsed:.1f}s ({stats.chunks_per_sec:.1f} chunks/s, {stats.tokens_per_sec:.1f} tokens/s)")
+    print(f"index size: {retriever.vector_store.size()}  checkpoints: {stats.checkpoints}")
+    for err in stats.errors:
+        print(f"[error] {err}")
+
+
+if __name__ == "__main__":
+    main()
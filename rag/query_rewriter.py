@@ -2,12 +2,14 @@ import json
 from typing import List
 
 from agent.llm_client import SimpleLLMClient
+from agent.resilience import LLMCallError
 from utils.prompt_loader import load_prompt
+from utils.tracer import active_tracer
 
 
 class QueryRewriter:
     def __init__(self, model_name: str):
-        self.llm = SimpleLLMClient(model=model_name)
+        self.llm = SimpleLLMClient(model=model_name, stage="rewriter")
 
     def rewrite(self, original_task: str, num_queries: int = 4) -> List[str]:
         """
@@ -25,7 +27,14 @@ class QueryRewriter:
         try:
             # Call LLM
             response = self.llm.generate(prompt, system_prompt)
-            
+        except LLMCallError as e:
+            print(f"Query rewrite unavailable: {e}. Fallback to original task.")
+            tracer = active_tracer()
+            if tracer:
+                tracer.log_event({"type": "query_rewrite_fallback", "error": str(e)})
+            return [original_task]
+
+        try:
             # Clean Markdown format
             content = response.strip()
             if content.startswith("```json"):
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import json
+import os
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
@@ -15,8 +16,16 @@ class FaissVectorStore:
         index_factory: str = "Flat",
         persist_path: Optional[Path] = None,
         metadata_path: Optional[Path] = None,
+        search_params: Optional[Dict[str, float]] = None,
     ) -> None:
         self.index_factory = index_factory
+        # factory from config; index_factory may differ (loaded index, or Flat fallback for tiny corpora)
+        self.configured_factory = index_factory
+        self._built_for_factory: Optional[str] = None
+        # runtime knobs such as {"nprobe": 8} (IVF) or {"efSearch": 64} (HNSW)
+        self.search_params: Dict[str, float] = dict(search_params or {})
+        # vectors waiting for an untrained index (IVF/PQ) to see enough training data
+        self._pending: List[tuple] = []
         self.persist_path = Path(persist_path) if persist_path else None
         self.metadata_path = (
             Path(metadata_path)
@@ -27,6 +36,9 @@ class FaissVectorStore:
         self.dim: Optional[int] = None
         self.next_id = 0
         self.id_to_doc: Dict[int, str] = {}
+        # per-source bookkeeping for incremental (re-)indexing
+        self.id_to_source: Dict[int, str] = {}
+        self.source_signatures: Dict[str, str] = {}
         # runtime meta for compatibility check
         self.embedding_model: Optional[str] = None
         self.chunk_strategy: Optional[str] = None
@@ -34,12 +46,60 @@ class FaissVectorStore:
 
     # --- Public API ---
     def add_embedding(self, embedding: List[float], document: str) -> None:
+        self.add_embeddings([embedding], [document])
+
+    def add_embeddings(
+        self,
+        embeddings: List[List[float]],
+        documents: List[str],
+        source: Optional[str] = None,
+    ) -> None:
+        """
+        Batch variant of add_embedding; optionally tags the chunks with their source file.
+        """
+        if len(embeddings) == 0:
+            return
         faiss, np = self._require_faiss()
-        self._ensure_index(len(embedding), faiss)
-        vector = np.asarray([embedding], dtype="float32")
-        ids = self._next_ids(1, np)
-        self.index.add_with_ids(vector, ids)
-        self.id_to_doc[int(ids[0])] = document
+        vectors = np.asarray(embeddings, dtype="float32")
+        self._ensure_index(vectors.shape[1], faiss)
+        ids = self._next_ids(len(documents), np)
+        for doc_id, document in zip(ids, documents):
+            self.id_to_doc[int(doc_id)] = document
+            if source:
+                self.id_to_source[int(doc_id)] = source
+        if self.index.is_trained:
+            self.index.add_with_ids(vectors, ids)
+        else:
+            self._pending.append((vectors, ids))
+            self._train_pending()
+
+    def remove_source(self, source: str) -> bool:
+        """
+        Drop every chunk indexed from `source`. Returns False if the index type
+        does not support removal (caller should rebuild from scratch).
+        """
+        _, np = self._require_faiss()
+        ids = [doc_id for doc_id, src in self.id_to_source.items() if src == source]
+        self.source_signatures.pop(source, None)
+        if not ids:
+            return True
+        if self._pending:
+            drop = np.asarray(ids, dtype="int64")
+            kept = []
+            for vectors, pending_ids in self._pending:
+                mask = ~np.isin(pending_ids, drop)
+                if mask.any():
+                    kept.append((vectors[mask], pending_ids[mask]))
+            self._pending = kept
+        if self.index is not None:
+            try:
+                self.index.remove_ids(np.asarray(ids, dtype="int64"))
+            except RuntimeError:
+                return False
+        for doc_id in ids:
+            self.id_to_doc.pop(doc_id, None)
+            self.id_to_source.pop(doc_id, None)
+        return True
 
     def search(self, query_embedding: List[float], top_k: int = 3) -> List[str]:
         results = [doc for doc, _ in self.search_with_scores(query_embedding, top_k)]
@@ -47,6 +107,7 @@ class FaissVectorStore:
 
     def search_with_scores(self, query_embedding: List[float], top_k: int = 3) -> List[Tuple[str, float]]:
         faiss, np = self._require_faiss()
+        self._train_pending(force=True)
         if not self.index or self.index.ntotal == 0:
             return []
         query = np.asarray([query_embedding], dtype="float32")
@@ -68,15 +129,41 @@ class FaissVectorStore:
         return list(self.id_to_doc.values())
 
     def size(self) -> int:
-        return int(self.index.ntotal) if self.index else 0
+        pending = sum(len(ids) for _, ids in self._pending)
+        return (int(self.index.ntotal) if self.index else 0) + pending
+
+    def clone(self) -> "FaissVectorStore":
+        """
+        Independent copy (index + metadata), e.g. to update in the background while
+        readers keep using this instance.
+        """
+        other = FaissVectorStore(self.configured_factory, self.persist_path, self.metadata_path, self.search_params)
+        other.index_factory = self.index_factory
+        other._built_for_factory = self._built_for_factory
+        other._pending = list(self._pending)
+        if self.index is not None:
+            faiss, _ = self._require_faiss()
+            other.index = faiss.clone_index(self.index)
+            other._apply_search_params()
+        other.dim = self.dim
+        other.next_id = self.next_id
+        other.id_to_doc = dict(self.id_to_doc)
+        other.id_to_source = dict(self.id_to_source)
+        other.source_signatures = dict(self.source_signatures)
+        other.set_meta_info(self.embedding_model, self.chunk_strategy, self.data_signature)
+        return other
 
     # --- Persistence ---
     def save(self) -> None:
+        self._train_pending(force=True)
         if not self.persist_path or not self.index:
             return
         faiss, _ = self._require_faiss()
         self.persist_path.parent.mkdir(parents=True, exist_ok=True)
-        faiss.write_index(self.index, str(self.persist_path))
+        # write-then-rename so an interrupted save never leaves a truncated index behind
+        tmp_index = self.persist_path.with_name(self.persist_path.name + ".tmp")
+        faiss.write_index(self.index, str(tmp_index))
+        os.replace(tmp_index, self.persist_path)
 
         meta_path = self._meta_path()
         meta_path.parent.mkdir(parents=True, exist_ok=True)
@@ -84,12 +171,17 @@ class FaissVectorStore:
             "next_id": self.next_id,
             "dim": self.dim,
             "index_factory": self.index_factory,
+            "configured_index_factory": self._built_for_factory or self.configured_factory,
             "id_to_doc": self.id_to_doc,
+            "id_to_source": self.id_to_source,
+            "source_signatures": self.source_signatures,
             "embedding_model": self.embedding_model,
             "chunk_strategy": self.chunk_strategy,
             "data_signature": self.data_signature,
         }
-        meta_path.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        tmp_meta = meta_path.with_name(meta_path.name + ".tmp")
+        tmp_meta.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_meta, meta_path)
 
     def load(self) -> None:
         faiss, _ = self._require_faiss()
@@ -102,13 +194,17 @@ class FaissVectorStore:
             self.next_id = int(meta.get("next_id", 0))
             self.dim = meta.get("dim")
             self.index_factory = meta.get("index_factory", self.index_factory)
+            self._built_for_factory = meta.get("configured_index_factory", self.index_factory)
             self.id_to_doc = {int(k): v for k, v in meta.get("id_to_doc", {}).items()}
+            self.id_to_source = {int(k): v for k, v in meta.get("id_to_source", {}).items()}
+            self.source_signatures = dict(meta.get("source_signatures", {}))
             self.embedding_model = meta.get("embedding_model")
             self.chunk_strategy = meta.get("chunk_strategy")
             self.data_signature = meta.get("data_signature")
         else:
             self.next_id = int(self.index.ntotal)
             self.dim = self.index.d if self.index else None
+        self._apply_search_params()
 
     # --- Internal helpers ---
     def _ensure_index(self, dim: int, faiss) -> None:
@@ -124,6 +220,57 @@ class FaissVectorStore:
             else:
                 base_index = faiss.IndexFlatL2(dim)
         self.index = faiss.IndexIDMap(base_index)
+        self._built_for_factory = self.configured_factory
+        self._apply_search_params()
+
+    def _train_pending(self, force: bool = False) -> None:
+        """
+        Train an IVF/PQ index once enough vectors are buffered (~39 per centroid, as FAISS
+        recommends) and flush the buffer. With force=True (search/save), train on whatever
+        is there; if that is below the hard minimum, fall back to an exact Flat index.
+        """
+        if not self._pending:
+            return
+        faiss, np = self._require_faiss()
+        count = sum(len(ids) for _, ids in self._pending)
+        minimum = self._min_train_points(faiss)
+        if not force and count < minimum * 39:
+            return
+        vectors = np.concatenate([v for v, _ in self._pending])
+        ids = np.concatenate([i for _, i in self._pending])
+        self._pending = []
+        if count < minimum:
+            print(
+                f"FaissVectorStore: {count} vectors are too few to train '{self.index_factory}' "
+                f"(needs {minimum}); using an exact Flat index."
+            )
+            self.index_factory = "Flat"
+            self.index = faiss.IndexIDMap(faiss.IndexFlatL2(self.dim))
+        else:
+            self.index.train(vectors)
+        self.index.add_with_ids(vectors, ids)
+        self._apply_search_params()
+
+    def _min_train_points(self, faiss) -> int:
+        minimum = 1
+        try:
+            minimum = int(faiss.extract_index_ivf(self.index).nlist)
+        except Exception:
+            pass
+        if "pq" in self.index_factory.lower():
+            minimum = max(minimum, 256)
+        return minimum
+
+    def _apply_search_params(self) -> None:
+        if not self.search_params or self.index is None:
+            return
+        faiss, _ = self._require_faiss()
+        space = faiss.ParameterSpace()
+        for name, value in self.search_params.items():
+            try:
+                space.set_index_parameter(self.index, name, value)
+            except Exception as exc:
+                print(f"FaissVectorStore: cannot set {name}={value} on '{self.index_factory}': {exc}")
 
     def _next_ids(self, count: int, np):
         ids = np.arange(self.next_id, self.next_id + count, dtype="int64")
@@ -159,6 +306,8 @@ class FaissVectorStore:
     def is_compatible(self, embedding_model: str, chunk_strategy: str, data_signature: str = "") -> bool:
         if self.index is None:
             return False
+        if self._built_for_factory and self._built_for_factory != self.configured_factory:
+            return False
         if self.embedding_model and self.embedding_model != embedding_model:
             return False
         if self.chunk_strategy and self.chunk_strategy != chunk_strategy:
@@ -169,7 +318,12 @@ class FaissVectorStore:
 
     def reset(self) -> None:
         """Clear index and metadata (used when meta mismatch)."""
+        self.index_factory = self.configured_factory
+        self._built_for_factory = None
+        self._pending = []
         self.index = None
         self.dim = None
         self.next_id = 0
         self.id_to_doc = {}
+        self.id_to_source = {}
+        self.source_signatures = {}
@@ -0,0 +1,330 @@
+"""
+Background re-indexing of the knowledge base.
+
+KnowledgeWatcher watches the directories behind `knowledge_globs` (inotify on Linux,
+polling elsewhere or when inotify is unavailable) and reports debounced batches of changes.
+LiveKnowledgeIndex re-indexes on that watcher thread into a private copy of the index and
+then swaps it in; queries keep reading the previous version until the swap, so a turn
+never waits for indexing.
+"""
+import ctypes
+import ctypes.util
+import glob
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set
+
+from rag.embedding_retriever import EmbeddingRetriever
+from rag.indexer import index_up_to_date, iter_knowledge_files, update_index
+
+# inotify event masks (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_ISDIR = 0x40000000
+WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _watch_roots(knowledge_globs: List[str]) -> Dict[Path, bool]:
+    """
+    Map each glob to the directory that has to be watched -> whether to watch recursively.
+    """
+    roots: Dict[Path, bool] = {}
+    for pattern in knowledge_globs:
+        parts = Path(pattern).parts
+        base: List[str] = []
+        for part in parts:
+            if glob.has_magic(part):
+                break
+            base.append(part)
+        root = Path.cwd().joinpath(*base) if base else Path.cwd()
+        if len(base) == len(parts):
+            # literal file path
+            root = root.parent
+        recursive = "**" in parts or len(parts) - len(base) > 1
+        roots[root] = roots.get(root, False) or recursive
+    return roots
+
+
+class _InotifyBackend:
+    def __init__(self, roots: Dict[Path, bool]) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._wd_to_dir: Dict[int, Path] = {}
+        self._recursive: Dict[Path, bool] = {}
+        for root, recursive in roots.items():
+            if not root.is_dir():
+                raise FileNotFoundError(f"Knowledge directory not found: {root}")
+            self._add_tree(root, recursive)
+
+    def _add_tree(self, root: Path, recursive: bool, strict: bool = True) -> None:
+        """
+        Watch root (and its subdirectories). With strict=False, directories that vanish or
+        cannot be watched are skipped (a new directory may be gone again by now).
+        """
+        dirs = [root]
+        if recursive:
+            try:
+                dirs.extend(p for p in root.rglob("*") if p.is_dir())
+            except OSError:
+                if strict:
+                    raise
+        for directory in dirs:
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), WATCH_MASK)
+            if wd < 0:
+                if strict:
+                    raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+                continue
+            self._wd_to_dir[wd] = directory
+            self._recursive[directory] = recursive
+
+    def wait(self, timeout: float) -> Set[str]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed: Set[str] = set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset : offset + name_len].rstrip(b"\0").decode(errors="replace")
+            offset += name_len
+            directory = self._wd_to_dir.get(wd)
+            if directory is None:
+                continue
+            path = directory / name if name else directory
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and self._recursive.get(directory):
+                self._add_tree(path, True, strict=False)
+            changed.add(str(path))
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class _PollingBackend:
+    def __init__(self, knowledge_globs: List[str], interval: float) -> None:
+        self.knowledge_globs = knowledge_globs
+        self.interval = interval
+        self._snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self) -> Dict[str, str]:
+        return {key: mtime for _, key, mtime in iter_knowledge_files(self.knowledge_globs)}
+
+    def wait(self, timeout: float) -> Set[str]:
+        delay = self._next_scan - time.monotonic()
+        if delay > 0:
+            time.sleep(min(delay, timeout))
+            if time.monotonic() < self._next_scan:
+                return set()
+        self._next_scan = time.monotonic() + self.interval
+        snapshot = self._scan()
+        changed = {key for key in snapshot.keys() | self._snapshot.keys() if snapshot.get(key) != self._snapshot.get(key)}
+        self._snapshot = snapshot
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+class KnowledgeWatcher:
+    """
+    Watch knowledge files and call `on_change(paths)` from a background thread once
+    changes have been quiet for `debounce` seconds.
+    """
+
+    def __init__(
+        self,
+        knowledge_globs: List[str],
+        on_change: Callable[[Set[str]], None],
+        debounce: float = 1.0,
+        poll_interval: float = 2.0,
+        use_inotify: bool = True,
+    ) -> None:
+        self.knowledge_globs = knowledge_globs
+        self.on_change = on_change
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.backend_name = ""
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="knowledge-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _make_backend(self):
+        if self.use_inotify and sys.platform.startswith("linux"):
+            try:
+                backend = _InotifyBackend(_watch_roots(self.knowledge_globs))
+                self.backend_name = "inotify"
+                return backend
+            except Exception as exc:
+                print(f"KnowledgeWatcher: inotify unavailable ({exc}); falling back to polling.")
+        self.backend_name = "polling"
+        return _PollingBackend(self.knowledge_globs, self.poll_interval)
+
+    def _run(self) -> None:
+        backend = self._make_backend()
+        pending: Set[str] = set()
+        quiet_at = 0.0
+        try:
+            while not self._stop.is_set():
+                timeout = max(0.05, quiet_at - time.monotonic()) if pending else 0.5
+                try:
+                    changed = backend.wait(timeout)
+                except OSError as exc:
+                    if isinstance(backend, _PollingBackend):
+                        raise
+                    # e.g. the inotify watch limit: keep the index fresh by polling instead
+                    print(f"KnowledgeWatcher: {self.backend_name} failed ({exc}); falling back to polling.")
+                    backend.close()
+                    backend = _PollingBackend(self.knowledge_globs, self.poll_interval)
+                    self.backend_name = "polling"
+                    # a full rescan on the next debounce catches whatever was missed
+                    changed = {"*"}
+                if changed:
+                    pending |= changed
+                    quiet_at = time.monotonic() + self.debounce
+                if pending and time.monotonic() >= quiet_at:
+                    batch, pending = pending, set()
+                    try:
+                        self.on_change(batch)
+                    except Exception as exc:
+                        print(f"KnowledgeWatcher: re-index failed: {exc}")
+        finally:
+            backend.close()
+
+
+class LiveKnowledgeIndex:
+    """
+    Versioned, always-queryable knowledge index kept fresh by a KnowledgeWatcher.
+
+    `current()` returns a retriever with vector + keyword indexes ready; it is replaced
+    (never mutated) when a background update finishes.
+    """
+
+    def __init__(
+        self,
+        knowledge_globs: List[str],
+        embed_model: str,
+        chunking_strategy: str = "whole",
+        vector_store_config: Optional[dict] = None,
+        debounce: float = 1.0,
+        poll_interval: float = 2.0,
+        use_inotify: bool = True,
+        tracer=None,
+        embedding_backend: Optional[str] = None,
+        hashing_config: Optional[dict] = None,
+    ) -> None:
+        self.knowledge_globs = knowledge_globs
+        self.embed_model = embed_model
+        self.embedding_backend = embedding_backend
+        self.hashing_config = hashing_config
+        self.chunking_strategy = chunking_strategy
+        self.vector_store_config = vector_store_config
+        self.tracer = tracer
+        self.version = 0
+        self._current: Optional[EmbeddingRetriever] = None
+        self._base: Optional[EmbeddingRetriever] = None
+        self._update_lock = threading.Lock()
+        self.watcher = KnowledgeWatcher(
+            knowledge_globs,
+            self._on_change,
+            debounce=debounce,
+            poll_interval=poll_interval,
+            use_inotify=use_inotify,
+        )
+
+    def start(self) -> None:
+        """
+        Open the persisted index right away, then catch up and watch in the background.
+        """
+        retriever = EmbeddingRetriever(
+            model=self.embed_model,
+            chunking_strategy=self.chunking_strategy,
+            vector_store_config=self.vector_store_config,
+            backend=self.embedding_backend,
+            hashing_config=self.hashing_config,
+        )
+        retriever.ensure_compatibility(retriever.model, self.chunking_strategy)
+        if retriever.vector_store.size() > 0:
+            self._publish(retriever)
+        self._base = retriever
+        self.watcher.start()
+        # catch up with changes made while we were not running
+        threading.Thread(target=self._catch_up, name="knowledge-catchup", daemon=True).start()
+
+    def stop(self) -> None:
+        self.watcher.stop()
+
+    def current(self) -> Optional[EmbeddingRetriever]:
+        return self._current
+
+    def _publish(self, retriever: EmbeddingRetriever) -> None:
+        retriever.documents_buffer = retriever.vector_store.all_documents()
+        retriever.build_keyword_index()
+        # single reference assignment: readers see either the old or the new version
+        self._current = retriever
+        self.version += 1
+
+    def _catch_up(self) -> None:
+        try:
+            self._on_change(set())
+        except Exception as exc:
+            print(f"LiveKnowledgeIndex: initial update failed: {exc}")
+
+    def _on_change(self, paths: Set[str]) -> None:
+        # the event paths only trigger the update: update_index diffs every file matched by
+        # the globs against the store, which also covers events the watcher merged or missed
+        with self._update_lock:
+            base = self._current or self._base
+            if self._current is not None and index_up_to_date(
+                base.vector_store, list(iter_knowledge_files(self.knowledge_globs))
+            ):
+                # nothing the index covers changed (e.g. an editor's temp file): skip the fork
+                return
+            candidate = base.fork()
+            stats = update_index(candidate, self.knowledge_globs, tracer=self.tracer, show_progress=False)
+            if stats.files_indexed or stats.files_removed or stats.rebuilt or self._current is None:
+                self._publish(candidate)
+                self._base = candidate
+            if self.tracer:
+                self.tracer.log_event(
+                    {
+                        "type": "knowledge_reindex",
+                        "changed": sorted(paths),
+                        "version": self.version,
+                        **stats.to_dict(),
+                    }
+                )
@@ -0,0 +1,292 @@
+"""
+Client-side rate limiting and request coalescing for model APIs (chat and embeddings).
+
+- RateLimiter: token buckets per endpoint for requests/min and tokens/min, refilled
+  continuously at `headroom` (default 0.9) of the configured limits, so throughput settles
+  just under the provider's limits instead of bursting into 429s and then idling. Callers
+  reserve before sending (blocking in threads, sleeping in the event loop), a 429 pauses
+  the whole endpoint for its Retry-After, and the token estimate is corrected with the
+  usage the response reports.
+- SingleFlight: identical concurrent requests (the same text to embed, the same router
+  prompt) share one upstream call.
+
+Limits are keyed by endpoint base URL ("*" covers every other endpoint); a "models" block
+gives a model its own buckets:
+
+    "rate_limits": {
+        "https://api.openai.com/v1": { "rpm": 500, "tpm": 200000,
+                                       "models": { "text-embedding-3-small": { "rpm": 3000, "tpm": 1000000 } } },
+        "*": { "rpm": 60 }
+    }
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+OPENAI_ENDPOINT = "https://api.openai.com/v1"
+
+
+class _Bucket:
+    """
+    Continuous-refill bucket that may go negative: a reservation bigger than what is left
+    waits for the deficit to refill instead of being refused.
+    """
+
+    def __init__(self, per_minute: float, headroom: float, burst_s: float) -> None:
+        self.rate = per_minute * headroom / 60.0
+        self.capacity = max(1.0, self.rate * burst_s)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        self._refill(now)
+        self.level -= amount
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def refund(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        name: str,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        headroom: float = 0.9,
+        burst_s: float = 5.0,
+    ) -> None:
+        self.name = name
+        self._requests = _Bucket(rpm, headroom, burst_s) if rpm else None
+        self._tokens = _Bucket(tpm, headroom, burst_s) if tpm else None
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens = 0
+        self.throttled = 0
+        self.waited_s = 0.0
+        self.rate_limited = 0
+
+    def reserve(self, tokens: int = 0) -> float:
+        """
+        Take one request and `tokens` from the buckets; returns how long to wait before sending.
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._paused_until - now)
+            if self._requests:
+                wait = max(wait, self._requests.reserve(1, now))
+            if self._tokens and tokens:
+                wait = max(wait, self._tokens.reserve(tokens, now))
+            self.requests += 1
+            self.tokens += tokens
+            if wait > 0:
+                self.throttled += 1
+                self.waited_s += wait
+            return wait
+
+    def acquire(self, tokens: int = 0) -> float:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, tokens: int = 0) -> float:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def settle(self, reserved: int, actual: Optional[int]) -> None:
+        """
+        Correct a reservation with the tokens the response reports.
+        """
+        if not self._tokens or actual is None or actual == reserved:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if actual < reserved:
+                self._tokens.refund(reserved - actual, now)
+            else:
+                self._tokens.reserve(actual - reserved, now)
+            self.tokens += actual - reserved
+
+    def penalize(self, seconds: float) -> None:
+        """
+        The provider answered 429: hold every caller of this endpoint for `seconds`.
+        """
+        with self._lock:
+            self.rate_limited += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def call(
+        self,
+        tokens: int,
+        send: Callable[[], T],
+        tokens_used: Optional[Callable[[T], Optional[int]]] = None,
+    ) -> T:
+        self.acquire(tokens)
+        try:
+            result = send()
+        except Exception as exc:
+            self._on_error(exc)
+            raise
+        if tokens_used is not None:
+            self.settle(tokens, tokens_used(result))
+        return result
+
+    async def acall(
+        self,
+        tokens: int,
+        send: Callable[[], Awaitable[T]],
+        tokens_used: Optional[Callable[[T], Optional[int]]] = None,
+    ) -> T:
+        await self.aacquire(tokens)
+        try:
+            result = await send()
+        except Exception as exc:
+            self._on_error(exc)
+            raise
+        if tokens_used is not None:
+            self.settle(tokens, tokens_used(result))
+        return result
+
+    def _on_error(self, exc: BaseException) -> None:
+        response = getattr(exc, "response", None)
+        status = getattr(exc, "status_code", None) or getattr(response, "status_code", None)
+        if status != 429:
+            return
+        try:
+            retry_after = float(response.headers.get("retry-after")) if response is not None else None
+        except (TypeError, ValueError):
+            retry_after = None
+        self.penalize(retry_after if retry_after is not None else 1.0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "tokens": self.tokens,
+                "throttled": self.throttled,
+                "waited_s": round(self.waited_s, 3),
+                "rate_limited": self.rate_limited,
+            }
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time; callers arriving while it is in flight get its result.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self._tasks: Dict[Tuple[int, str], Tuple[asyncio.Task, list]] = {}
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        # tasks are bound to their loop, so the key includes it
+        slot = (id(asyncio.get_running_loop()), key)
+        entry = self._tasks.get(slot)
+        if entry is None:
+            task = asyncio.ensure_future(fn())
+            entry = self._tasks[slot] = (task, [0])
+            task.add_done_callback(lambda _: self._tasks.pop(slot, None))
+        else:
+            self.shared += 1
+        task, waiters = entry
+        waiters[0] += 1
+        try:
+            # one waiter giving up must not cancel the call for the others
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if waiters[0] == 1:
+                task.cancel()
+            raise
+        finally:
+            waiters[0] -= 1
+
+
+COALESCER = SingleFlight()
+
+_config: Dict[str, dict] = {}
+_limiters: Dict[Tuple[str, Optional[str]], RateLimiter] = {}
+_registry_lock = threading.Lock()
+
+
+def configure(cfg: Optional[dict]) -> None:
+    """
+    Apply the `rate_limits` block of the user config (replaces earlier limiters).
+    """
+    global _config
+    with _registry_lock:
+        _config = {_normalize(key) if key != "*" else key: value for key, value in (cfg or {}).items()}
+        _limiters.clear()
+
+
+def limiter_for(endpoint: Optional[str], model: Optional[str] = None) -> Optional[RateLimiter]:
+    """
+    Shared limiter of an endpoint (and model, if it has its own limits); None when unlimited.
+    """
+    base = _normalize(endpoint)
+    entry = _config.get(base) or _config.get("*")
+    if not entry:
+        return None
+    model_cfg = (entry.get("models") or {}).get(model) if model else None
+    key = (base, model if model_cfg else None)
+    with _registry_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limits = model_cfg or entry
+            limiter = _limiters[key] = RateLimiter(
+                f"{base} {model}" if model_cfg else base,
+                rpm=limits.get("rpm"),
+                tpm=limits.get("tpm"),
+                headroom=limits.get("headroom", entry.get("headroom", 0.9)),
+                burst_s=limits.get("burst_s", entry.get("burst_s", 5.0)),
+            )
+        return limiter
+
+
+def stats() -> Dict[str, Any]:
+    with _registry_lock:
+        limiters = list(_limiters.values())
+    return {
+        "limiters": {limiter.name: limiter.stats() for limiter in limiters},
+        "coalesced": COALESCER.shared,
+    }
+
+
+def _normalize(endpoint: Optional[str]) -> str:
+    return (endpoint or OPENAI_ENDPOINT).rstrip("/")
@@ -1,13 +1,14 @@
 import json
 import sqlite3
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 
 
 class SessionStore:
     """
     Turn-based SQLite store. Each turn groups user->tool(s)->assistant messages.
     We persist turns only when completed to avoid half-written history.
+    Token usage per turn is kept in a separate `usage` table (never pruned with the turns).
     """
 
     def __init__(self, db_path: Path) -> None:
@@ -28,6 +29,24 @@ class SessionStore:
                 )
                 """
             )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS usage (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    run_id TEXT,
+                    stage TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    calls INTEGER NOT NULL DEFAULT 0,
+                    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                    completion_tokens INTEGER NOT NULL DEFAULT 0,
+                    cached_tokens INTEGER NOT NULL DEFAULT 0,
+                    estimated_calls INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_session ON usage (session_id)")
             conn.commit()
         finally:
             conn.close()
@@ -94,3 +113,57 @@ class SessionStore:
             except Exception:
                 continue
         return turns
+
+    def append_usage(self, session_id: str, run_id: str, rows: List[Dict[str, Any]]) -> None:
+        """
+        Persist one turn's usage rows (UsageMeter.rows()).
+        """
+        if not rows:
+            return
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executemany(
+                """
+                INSERT INTO usage (session_id, run_id, stage, model, calls, prompt_tokens,
+                                   completion_tokens, cached_tokens, estimated_calls)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        session_id,
+                        run_id,
+                        row["stage"],
+                        row["model"],
+                        row.get("calls", 0),
+                        row.get("prompt_tokens", 0),
+                        row.get("completion_tokens", 0),
+                        row.get("cached_tokens", 0),
+                        row.get("estimated_calls", 0),
+                    )
+                    for row in rows
+                ],
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def load_usage(self, session_id: str) -> List[Dict[str, Any]]:
+        """
+        Session totals per (stage, model).
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cur = conn.execute(
+                """
+                SELECT stage, model, SUM(calls), SUM(prompt_tokens), SUM(completion_tokens),
+                       SUM(cached_tokens), SUM(estimated_calls)
+                FROM usage WHERE session_id = ?
+                GROUP BY stage, model ORDER BY stage, model
+                """,
+                (session_id,),
+            )
+            rows = cur.fetchall()
+        finally:
+            conn.close()
+        fields = ("stage", "model", "calls", "prompt_tokens", "completion_tokens", "cached_tokens", "estimated_calls")
+        return [dict(zip(fields, row)) for row in rows]
@@ -0,0 +1,102 @@
+"""
+Token counting for chat messages.
+
+Uses tiktoken when installed (encodings cached per model, counts cached per string), and
+falls back to a character-based estimate otherwise: ~4 ASCII characters per token, one
+token per non-ASCII (e.g. CJK) character.
+"""
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+try:
+    import tiktoken
+except Exception:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+# per-message framing overhead of the chat format (role, separators)
+_MESSAGE_OVERHEAD = 4
+_REPLY_PRIMING = 3
+
+# context windows (input + output tokens) by model prefix; longest prefix wins
+CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-5": 400_000,
+    "gpt-4.1": 1_047_576,
+    "gpt-4o": 128_000,
+    "gpt-4-turbo": 128_000,
+    "gpt-4": 8_192,
+    "gpt-3.5-turbo": 16_385,
+    "o1": 200_000,
+    "o3": 200_000,
+    "o4-mini": 200_000,
+    "qwen": 32_768,
+    "llama3": 8_192,
+    "deepseek": 64_000,
+}
+DEFAULT_CONTEXT_WINDOW = 32_768
+
+
+def context_window_for(model: str) -> int:
+    name = (model or "").lower().split("/")[-1]
+    matches = [prefix for prefix in CONTEXT_WINDOWS if name.startswith(prefix)]
+    if not matches:
+        return DEFAULT_CONTEXT_WINDOW
+    return CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+@lru_cache(maxsize=16)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # unknown / non-OpenAI model names: the current OpenAI encoding is a fair proxy
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception:
+            return None
+    except Exception:
+        return None
+
+
+def tokenizer_name(model: str) -> str:
+    encoding = _encoding(model)
+    return f"tiktoken:{encoding.name}" if encoding is not None else "estimate"
+
+
+@lru_cache(maxsize=8192)
+def count_text(text: str, model: str = "") -> int:
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    non_ascii = (len(text.encode("utf-8")) - len(text)) // 2
+    return (len(text) - non_ascii + 3) // 4 + non_ascii
+
+
+def count_message(message: Dict[str, Any], model: str = "") -> int:
+    tokens = _MESSAGE_OVERHEAD
+    content = message.get("content")
+    if isinstance(content, str):
+        tokens += count_text(content, model)
+    elif content:
+        tokens += count_text(json.dumps(content, ensure_ascii=False), model)
+    for call in message.get("tool_calls") or []:
+        function = call.get("function", {})
+        tokens += _MESSAGE_OVERHEAD + count_text(function.get("name", ""), model)
+        tokens += count_text(function.get("arguments", ""), model)
+    if message.get("name"):
+        tokens += count_text(message["name"], model)
+    return tokens
+
+
+def count_messages(messages: List[Dict[str, Any]], model: str = "") -> int:
+    return sum(count_message(message, model) for message in messages) + _REPLY_PRIMING
+
+
+def count_tools(tools: Optional[List[Dict[str, Any]]], model: str = "") -> int:
+    if not tools:
+        return 0
+    return count_text(json.dumps(tools, ensure_ascii=False, sort_keys=True), model)
@@ -1,30 +1,503 @@
+import asyncio
+import atexit
+import functools
+import gzip
+import inspect
+import io
+import itertools
 import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except Exception:  # pragma: no cover - optional dependency
+    zstandard = None
+
+_SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+# conversations tracked for message deltas at once (agent loop, router, rewriter, ...)
+_MAX_DELTA_BASES = 8
+
+# tracer / innermost open span of the current task or thread (asyncio tasks and
+# asyncio.to_thread inherit both, so nested calls anywhere in a turn find them)
+_active_tracer: ContextVar[Optional["RunTracer"]] = ContextVar("run_tracer", default=None)
+_active_span: ContextVar[Optional["Span"]] = ContextVar("trace_span", default=None)
+_span_ids = itertools.count(1)
 
 
 class RunTracer:
     """
     Lightweight JSONL tracer to record prompts, responses, tool calls, etc.
     Each event is appended as a JSON object to events.jsonl under a run-specific directory.
+
+    log_event only stamps the event and appends it to an in-memory buffer; a background
+    writer thread serializes and writes buffered events in batches every `flush_interval_s`
+    (or once `max_batch` events are waiting). Call flush()/close() to wait for the writes.
+
+    Events carrying a growing `messages` list (llm_call) are stored as deltas: the messages
+    already logged by an earlier event of the same conversation are replaced by
+    {"messages_ref": <seq of that event>, "messages_offset": n, "messages_delta": [new ones]}.
+    load_events() rebuilds the full lists.
+
+    compression: None, "gzip" or "zstd" (needs the zstandard package). rotate_bytes: once the
+    active file reaches this size it is renamed to events.<n>.jsonl[.gz|.zst] and a new one is
+    started (deltas never point into an earlier file); max_files caps the rotated files kept.
     """
 
-    def __init__(self, log_dir: Path) -> None:
+    def __init__(
+        self,
+        log_dir: Path,
+        flush_interval_s: float = 0.5,
+        max_batch: int = 512,
+        compression: Optional[str] = None,
+        rotate_bytes: Optional[int] = None,
+        max_files: Optional[int] = None,
+        delta_messages: bool = True,
+    ) -> None:
+        if compression not in _SUFFIXES:
+            raise ValueError(f"Unsupported trace compression '{compression}' (use 'gzip', 'zstd' or None)")
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("compression='zstd' requested but zstandard is not installed")
         self.log_dir = log_dir
         self.log_dir.mkdir(parents=True, exist_ok=True)
-        self.events_file = self.log_dir / "events.jsonl"
+        self.compression = compression
+        self.events_file = self.log_dir / f"events.jsonl{_SUFFIXES[compression]}"
+        self.flush_interval_s = flush_interval_s
+        self.max_batch = max_batch
+        self.rotate_bytes = rotate_bytes
+        self.max_files = max_files
+        self.delta_messages = delta_messages
+        self._cond = threading.Condition()
+        self._buffer: List[Dict[str, Any]] = []
+        self._seq = 0
+        self._written_seq = 0
+        self._closed = False
+        # writer-thread state: id(first message) -> (seq, messages) of the last logged list
+        self._bases: Dict[int, Tuple[int, List[Any]]] = {}
+        self._rotations = 0
+        self._write_lock = threading.Lock()
+        # finished spans of this run; timestamps are relative to the tracer's creation
+        self._spans: List["Span"] = []
+        self._spans_lock = threading.Lock()
+        self._t0_ns = time.perf_counter_ns()
+        self._thread = threading.Thread(target=self._run, name="run-tracer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
 
     def log_event(self, event: Dict[str, Any]) -> None:
         payload = {
             "timestamp": datetime.utcnow().isoformat() + "Z",
             **event,
         }
-        with self.events_file.open("a", encoding="utf-8") as f:
-            f.write(json.dumps(payload, ensure_ascii=False))
-            f.write("\n")
+        messages = payload.get("messages")
+        if isinstance(messages, list):
+            # snapshot of the references (serialized later, diffed by identity in the writer)
+            payload["messages"] = list(messages)
+        with self._cond:
+            self._seq += 1
+            payload["seq"] = self._seq
+            if self._closed:
+                # late events (e.g. background MCP pool checks) are written synchronously
+                batch = [payload]
+            else:
+                self._buffer.append(payload)
+                if len(self._buffer) >= self.max_batch:
+                    self._cond.notify_all()
+                return
+        self._write(batch)
 
     def info(self, message: str, extra: Optional[Dict[str, Any]] = None) -> None:
         data = extra.copy() if extra else {}
         data["message"] = message
         self.log_event({"type": "info", **data})
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """
+        Block until every event logged so far is on disk.
+        """
+        with self._cond:
+            target = self._seq
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self._written_seq >= target or not self._thread.is_alive(), timeout)
+
+    def activate(self) -> None:
+        """
+        Make this the tracer that span()/traced() record into for the current task
+        (and every task / thread started from it afterwards).
+        """
+        _active_tracer.set(self)
+
+    def record_span(self, span: "Span") -> None:
+        with self._spans_lock:
+            self._spans.append(span)
+        LATENCY.observe(span.name, span.duration_ms)
+
+    def write_spans(self) -> None:
+        """
+        Write the run's spans as trace.json (Chrome trace / Perfetto: open it in
+        ui.perfetto.dev or chrome://tracing) and log a per-name latency breakdown plus the
+        process-wide rolling p50/p95 per span name.
+        """
+        with self._spans_lock:
+            spans, self._spans = sorted(self._spans, key=lambda s: s.start_ns), []
+        if not spans:
+            return
+        tracks: Dict[Any, int] = {}
+        trace_events: List[Dict[str, Any]] = []
+        children_ms: Dict[int, float] = {}
+        for item in spans:
+            if item.track not in tracks:
+                tracks[item.track] = len(tracks) + 1
+                trace_events.append(
+                    {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tracks[item.track], "args": {"name": str(item.track)}}
+                )
+            trace_events.append(
+                {
+                    "name": item.name,
+                    "cat": item.name.split(".")[0],
+                    "ph": "X",
+                    "ts": round((item.start_ns - self._t0_ns) / 1000.0, 3),
+                    "dur": round((item.end_ns - item.start_ns) / 1000.0, 3),
+                    "pid": os.getpid(),
+                    "tid": tracks[item.track],
+                    "args": {"span_id": item.span_id, "parent_id": item.parent_id, **item.attrs},
+                }
+            )
+            if item.parent_id is not None:
+                children_ms[item.parent_id] = children_ms.get(item.parent_id, 0.0) + item.duration_ms
+        path = self.log_dir / "trace.json"
+        try:
+            tmp = path.with_suffix(".json.tmp")
+            tmp.write_text(json.dumps({"traceEvents": trace_events, "displayTimeUnit": "ms"}, default=str), encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError as exc:
+            print(f"[tracer] failed to write {path}: {exc}")
+
+        by_name: Dict[str, Dict[str, float]] = {}
+        for item in spans:
+            entry = by_name.setdefault(item.name, {"count": 0, "total_ms": 0.0, "self_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += item.duration_ms
+            # children may overlap (concurrent tool calls), so self time is clamped at 0
+            entry["self_ms"] += max(0.0, item.duration_ms - children_ms.get(item.span_id, 0.0))
+        for entry in by_name.values():
+            entry["total_ms"] = round(entry["total_ms"], 3)
+            entry["self_ms"] = round(entry["self_ms"], 3)
+        self.log_event(
+            {
+                "type": "latency_breakdown",
+                "wall_ms": round(sum(item.duration_ms for item in spans if item.parent_id is None), 3),
+                "spans": len(spans),
+                "by_name": by_name,
+            }
+        )
+        self.log_event({"type": "latency_histograms", "spans": LATENCY.snapshot()})
+
+    def close(self) -> None:
+        with self._cond:
+            if self._closed:
+                return
+        self.write_spans()
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    # --- writer thread ---
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._buffer and not self._closed:
+                    self._cond.wait(self.flush_interval_s)
+                batch, self._buffer = self._buffer, []
+                closed = self._closed
+            if batch:
+                self._write(batch)
+            if closed and not batch:
+                return
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        with self._write_lock:
+            try:
+                self._maybe_rotate()
+                lines = [json.dumps(self._encode(payload), ensure_ascii=False, default=str) for payload in batch]
+                data = ("\n".join(lines) + "\n").encode("utf-8")
+                if self.compression == "gzip":
+                    # one gzip member per batch; concatenated members read back as one stream
+                    data = gzip.compress(data, compresslevel=5)
+                elif self.compression == "zstd":
+                    data = zstandard.ZstdCompressor(level=3).compress(data)
+                with self.events_file.open("ab") as f:
+                    f.write(data)
+            except Exception as exc:
+                print(f"[tracer] failed to write {len(batch)} events to {self.events_file}: {exc}")
+        with self._cond:
+            self._written_seq = max(self._written_seq, batch[-1]["seq"])
+            self._cond.notify_all()
+
+    def _encode(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        messages = payload.get("messages")
+        if not self.delta_messages or not isinstance(messages, list) or not messages:
+            return payload
+        key = id(messages[0])
+        base = self._bases.pop(key, None)
+        self._bases[key] = (payload["seq"], messages)
+        while len(self._bases) > _MAX_DELTA_BASES:
+            self._bases.pop(next(iter(self._bases)))
+        if base is None:
+            return payload
+        base_seq, previous = base
+        offset = 0
+        limit = min(len(previous), len(messages))
+        while offset < limit and messages[offset] is previous[offset]:
+            offset += 1
+        encoded = {k: v for k, v in payload.items() if k != "messages"}
+        encoded["messages_ref"] = base_seq
+        encoded["messages_offset"] = offset
+        encoded["messages_delta"] = messages[offset:]
+        return encoded
+
+    def _maybe_rotate(self) -> None:
+        if not self.rotate_bytes:
+            return
+        try:
+            if self.events_file.stat().st_size < self.rotate_bytes:
+                return
+        except FileNotFoundError:
+            return
+        self._rotations += 1
+        self.events_file.rename(self.log_dir / f"events.{self._rotations}.jsonl{_SUFFIXES[self.compression]}")
+        # every file stands alone: the next messages event is logged in full
+        self._bases.clear()
+        if self.max_files:
+            rotated = [path for path in _segments(self.log_dir) if path != self.events_file]
+            for old in rotated[: -self.max_files]:
+                old.unlink(missing_ok=True)
+
+
+def _segments(log_dir: Path) -> List[Path]:
+    """
+    Trace files of a run, oldest first (rotated files, then the active one).
+    """
+    rotated = []
+    active = []
+    for path in log_dir.glob("events*.jsonl*"):
+        parts = path.name.split(".")
+        if len(parts) > 2 and parts[1].isdigit():
+            rotated.append((int(parts[1]), path))
+        elif path.name.startswith("events.jsonl"):
+            active.append(path)
+    return [path for _, path in sorted(rotated)] + active
+
+
+def _read_lines(path: Path) -> Iterator[str]:
+    if path.suffix == ".gz":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            yield from f
+    elif path.suffix == ".zst":
+        if zstandard is None:
+            raise RuntimeError(f"{path} is zstd-compressed but zstandard is not installed")
+        with path.open("rb") as raw:
+            reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+            yield from io.TextIOWrapper(reader, encoding="utf-8")
+    else:
+        with path.open("r", encoding="utf-8") as f:
+            yield from f
+
+
+def load_events(log_dir: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Read a run's events in order, with delta-encoded `messages` rebuilt in full.
+    """
+    for path in _segments(Path(log_dir)):
+        messages_by_seq: Dict[int, List[Any]] = {}
+        for line in _read_lines(path):
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if "messages_ref" in event:
+                base = messages_by_seq.get(event.pop("messages_ref"), [])
+                event["messages"] = base[: event.pop("messages_offset")] + event.pop("messages_delta")
+            if isinstance(event.get("messages"), list) and "seq" in event:
+                messages_by_seq[event["seq"]] = event["messages"]
+            yield event
+
+
+# --- spans ---
+def _track() -> str:
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        return f"task {task.get_name()}"
+    return f"thread {threading.current_thread().name}"
+
+
+class Span:
+    """
+    One timed section (monotonic clock). Opened by span()/start_span(), nested under the
+    span that was open in the same task when it started.
+    """
+
+    __slots__ = ("name", "span_id", "parent_id", "attrs", "track", "start_ns", "end_ns", "_tracer", "_token")
+
+    def __init__(self, tracer: RunTracer, name: str, attrs: Dict[str, Any]) -> None:
+        parent = _active_span.get()
+        self.name = name
+        self.span_id = next(_span_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.attrs = attrs
+        self.track = _track()
+        self._tracer = tracer
+        self.end_ns: Optional[int] = None
+        self._token = _active_span.set(self)
+        self.start_ns = time.perf_counter_ns()
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.perf_counter_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def finish(self) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.perf_counter_ns()
+        try:
+            _active_span.reset(self._token)
+        except ValueError:
+            # finished from another context than it was started in; nothing to restore
+            pass
+        self._tracer.record_span(self)
+
+
+def active_tracer() -> Optional[RunTracer]:
+    """
+    Tracer of the current turn (set by RunTracer.activate()), or None.
+    """
+    return _active_tracer.get()
+
+
+def start_span(name: str, **attrs: Any) -> Optional[Span]:
+    """
+    Open a span explicitly (call .finish() on it); None when no tracer is active.
+    """
+    tracer = _active_tracer.get()
+    if tracer is None:
+        return None
+    return Span(tracer, name, attrs)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Optional[Span]]:
+    """
+    with span("faiss.search", k=5) as s: ...   (s is None, and nothing is recorded,
+    when no tracer is active)
+    """
+    current = start_span(name, **attrs)
+    if current is None:
+        yield None
+        return
+    try:
+        yield current
+    except BaseException as exc:
+        current.attrs["error"] = type(exc).__name__
+        raise
+    finally:
+        current.finish()
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """
+    Decorator form of span() for sync and async functions.
+    """
+
+    def decorate(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+class LatencyHistograms:
+    """
+    Rolling per-name latency windows (last `window` samples) with percentile snapshots.
+    """
+
+    def __init__(self, window: int = 1024) -> None:
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value_ms: float) -> None:
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(value_ms)
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def percentile(self, name: str, q: float, min_samples: int = 1) -> Optional[float]:
+        """
+        q-quantile of the current window for `name`; None with fewer than min_samples.
+        """
+        with self._lock:
+            samples = self._samples.get(name)
+            values = sorted(samples) if samples else []
+        if len(values) < max(1, min_samples):
+            return None
+        return _percentile(values, q)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            items = {name: sorted(samples) for name, samples in self._samples.items()}
+            counts = dict(self._counts)
+        return {
+            name: {
+                "count": counts[name],
+                "p50_ms": round(_percentile(values, 0.50), 3),
+                "p95_ms": round(_percentile(values, 0.95), 3),
+                "max_ms": round(values[-1], 3),
+            }
+            for name, values in items.items()
+            if values
+        }
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    # nearest-rank on an already sorted list
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+# process-wide, so percentiles roll across turns (each turn has its own RunTracer)
+LATENCY = LatencyHistograms()
@@ -4,6 +4,8 @@ from __future__ import annotations
 Lightweight TUI wrapper using rich. Falls back to no-op if disabled or rich is missing.
 """
 
+import sys
+import time
 from collections import deque
 from contextlib import nullcontext
 from typing import Any, Dict, Iterable, Optional
@@ -16,15 +18,59 @@ try:
     from rich.table import Table
     from rich.text import Text
     from rich.markdown import Markdown
+    from rich.progress import BarColumn, MofNCompleteColumn, Progress, TextColumn, TimeElapsedColumn
 
     RICH_AVAILABLE = True
 except Exception:
     RICH_AVAILABLE = False
 
 
+class TextProgress:
+    """
+    Minimal single-line progress bar for plain consoles.
+    """
+
+    def __init__(self, total: int, description: str = "", width: int = 30) -> None:
+        self.total = max(total, 0)
+        self.description = description
+        self.width = width
+        self.completed = 0
+        self.info = ""
+
+    def __enter__(self) -> "TextProgress":
+        self._render()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+
+    def advance(self, step: int = 1, info: str = "") -> None:
+        self.completed += step
+        if info:
+            self.info = info
+        self._render()
+
+    def _render(self) -> None:
+        ratio = self.completed / self.total if self.total else 1.0
+        filled = int(self.width * min(ratio, 1.0))
+        bar = "#" * filled + "." * (self.width - filled)
+        line = f"\r{self.description} [{bar}] {self.completed}/{self.total}"
+        if self.info:
+            line += f"  {self.info}"
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+
 class BaseUI:
     enabled = False
 
+    def progress(self, total: int, description: str = "") -> Any:
+        """
+        Context manager exposing advance(step, info); plain text bar by default.
+        """
+        return TextProgress(total, description)
+
     def live(self):
         return nullcontext()
 
@@ -40,7 +86,19 @@ class BaseUI:
     def detail(self, title: str, content: Any) -> None:
         pass
 
-    def stats(self) -> None:
+    def stream_start(self, source: str) -> None:
+        """
+        Begin an incrementally rendered message (e.g. a streamed model reply).
+        """
+        pass
+
+    def stream_delta(self, text: str) -> None:
+        pass
+
+    def stream_end(self) -> None:
+        pass
+
+    def stats(self, usage: Optional[Dict[str, Any]] = None) -> None:
         pass
 
 
@@ -65,6 +123,10 @@ class RichUI(BaseUI):
         }
         self.layout = self._create_layout()
         self.live_obj: Optional[Live] = None
+        self._stream_source: Optional[str] = None
+        self._stream_parts: list = []
+        self._stream_rendered_at = 0.0
+        self.usage: Optional[Dict[str, Any]] = None
 
     def live(self):
         self._update_layout()
@@ -98,9 +160,48 @@ class RichUI(BaseUI):
         self.current_detail = content
         self._refresh()
 
-    def stats(self) -> None:
+    def stream_start(self, source: str) -> None:
+        self._stream_source = source
+        self._stream_parts = []
+        self._stream_rendered_at = 0.0
+        self.current_detail_title = "Agent Response" if source.lower() == "model" else source
+        self.current_detail = ""
         self._refresh()
 
+    def stream_delta(self, text: str) -> None:
+        self._stream_parts.append(text)
+        # re-rendering the layout per token is expensive; Live only repaints a few times a second anyway
+        now = time.monotonic()
+        if now - self._stream_rendered_at >= 0.05:
+            self._stream_rendered_at = now
+            self.current_detail = "".join(self._stream_parts)
+            self._refresh()
+
+    def stream_end(self) -> None:
+        content = "".join(self._stream_parts)
+        source = self._stream_source or "Model"
+        self._stream_source = None
+        self._stream_parts = []
+        if content:
+            self.current_detail = content
+            self.log(source, content)
+        else:
+            self._refresh()
+
+    def stats(self, usage: Optional[Dict[str, Any]] = None) -> None:
+        """
+        usage: {"turn": UsageMeter.summary(), "session": ...}, shown in the footer.
+        """
+        if usage is not None:
+            self.usage = usage
+        self._refresh()
+
+    def progress(self, total: int, description: str = "") -> Any:
+        # A rich Progress cannot run inside the full-screen Live layout; report via the detail panel instead.
+        if self.live_obj:
+            return _DetailProgress(self, total, description)
+        return _RichProgress(self.console, total, description)
+
     # Internal helpers
     def _create_layout(self) -> Layout:
         layout = Layout()
@@ -155,6 +256,18 @@ class RichUI(BaseUI):
 
     def _render_footer(self) -> Panel:
         stats = f"Messages: {len(self.messages)} | Tools: {len(self.tool_calls)}"
+        if self.usage:
+            turn = self.usage.get("turn") or {}
+            session = self.usage.get("session") or {}
+            stats += (
+                f" | Tokens: in {turn.get('prompt_tokens', 0)} (cached {turn.get('cached_tokens', 0)})"
+                f" out {turn.get('completion_tokens', 0)}"
+            )
+            if turn.get("cost_usd") is not None:
+                stats += f" ${turn['cost_usd']:.4f}"
+            stats += f" | Session: {session.get('prompt_tokens', 0) + session.get('completion_tokens', 0)} tokens"
+            if session.get("cost_usd") is not None:
+                stats += f" ${session['cost_usd']:.4f}"
         return Panel(Text(stats, justify="center", style="dim"))
 
     def _update_layout(self) -> None:
@@ -176,6 +289,44 @@ class RichUI(BaseUI):
         self.live_obj.update(self.layout)
 
 
+class _RichProgress:
+    def __init__(self, console: "Console", total: int, description: str) -> None:
+        self.progress = Progress(
+            TextColumn("[bold blue]{task.description}"),
+            BarColumn(),
+            MofNCompleteColumn(),
+            TimeElapsedColumn(),
+            TextColumn("{task.fields[info]}"),
+            console=console,
+        )
+        self.task_id = self.progress.add_task(description, total=total, info="")
+
+    def __enter__(self) -> "_RichProgress":
+        self.progress.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.progress.stop()
+
+    def advance(self, step: int = 1, info: str = "") -> None:
+        self.progress.update(self.task_id, advance=step, info=info)
+
+
+class _DetailProgress(TextProgress):
+    def __init__(self, ui: RichUI, total: int, description: str) -> None:
+        super().__init__(total, description)
+        self.ui = ui
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+    def _render(self) -> None:
+        text = f"{self.completed}/{self.total}"
+        if self.info:
+            text += f"\n{self.info}"
+        self.ui.detail(self.description or "Progress", text)
+
+
 def get_ui(enabled: bool) -> BaseUI:
     if enabled and RICH_AVAILABLE:
         try:
@@ -0,0 +1,158 @@
+"""
+Token usage and cost accounting for LLM calls.
+
+Every client records the `usage` block of its responses into the active UsageMeter, tagged
+with a stage ("agent", "router", "rewriter", ...). main.py opens one meter per turn, logs
+it to the trace, shows it in the UI and persists it with the session (SessionStore).
+
+Costs use USD per 1M tokens from `llm.pricing` in the user config, falling back to the
+list prices below; models without a price are counted but not costed.
+
+    "llm": { "pricing": { "gpt-5": { "input": 1.25, "cached_input": 0.125, "output": 10.0 } } }
+"""
+import threading
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_PRICES: Dict[str, Dict[str, float]] = {
+    "gpt-5": {"input": 1.25, "cached_input": 0.125, "output": 10.0},
+    "gpt-5-mini": {"input": 0.25, "cached_input": 0.025, "output": 2.0},
+    "gpt-5-nano": {"input": 0.05, "cached_input": 0.005, "output": 0.4},
+    "gpt-4.1": {"input": 2.0, "cached_input": 0.5, "output": 8.0},
+    "gpt-4.1-mini": {"input": 0.4, "cached_input": 0.1, "output": 1.6},
+    "gpt-4o": {"input": 2.5, "cached_input": 1.25, "output": 10.0},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.6},
+}
+
+_FIELDS = ("calls", "prompt_tokens", "completion_tokens", "cached_tokens", "estimated_calls")
+
+# meter of the current turn (asyncio tasks and threads started from the turn inherit it)
+_active_meter: ContextVar[Optional["UsageMeter"]] = ContextVar("usage_meter", default=None)
+
+
+def usage_from(usage: Any) -> Optional[Dict[str, int]]:
+    """
+    Normalize an OpenAI `CompletionUsage` (or a plain dict) to prompt/completion/cached counts.
+    """
+    if usage is None:
+        return None
+    get = usage.get if isinstance(usage, dict) else lambda key, default=None: getattr(usage, key, default)
+    details = get("prompt_tokens_details")
+    if isinstance(details, dict):
+        cached = details.get("cached_tokens")
+    else:
+        cached = getattr(details, "cached_tokens", None)
+    return {
+        "prompt_tokens": int(get("prompt_tokens", 0) or 0),
+        "completion_tokens": int(get("completion_tokens", 0) or 0),
+        "cached_tokens": int(cached or 0),
+    }
+
+
+def price_for(model: str, prices: Optional[Dict[str, Dict[str, float]]] = None) -> Optional[Dict[str, float]]:
+    table = {**DEFAULT_PRICES, **(prices or {})}
+    name = (model or "").lower().split("/")[-1]
+    matches = [prefix for prefix in table if name.startswith(prefix.lower())]
+    return table[max(matches, key=len)] if matches else None
+
+
+def cost_of(
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    cached_tokens: int = 0,
+    prices: Optional[Dict[str, Dict[str, float]]] = None,
+) -> Optional[float]:
+    price = price_for(model, prices)
+    if price is None:
+        return None
+    uncached = max(0, prompt_tokens - cached_tokens)
+    cached_price = price.get("cached_input", price.get("input", 0.0))
+    return (
+        uncached * price.get("input", 0.0) + cached_tokens * cached_price + completion_tokens * price.get("output", 0.0)
+    ) / 1e6
+
+
+class UsageMeter:
+    """
+    Usage aggregated per (stage, model).
+    """
+
+    def __init__(self, prices: Optional[Dict[str, Dict[str, float]]] = None) -> None:
+        self.prices = prices
+        self._rows: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def activate(self) -> None:
+        """
+        Make this the meter that record_usage() writes to for the current task.
+        """
+        _active_meter.set(self)
+
+    def record(self, stage: str, model: str, usage: Optional[Dict[str, int]], estimated: bool = False) -> None:
+        if not usage:
+            return
+        with self._lock:
+            row = self._rows.setdefault((stage, model), {field: 0 for field in _FIELDS})
+            row["calls"] += 1
+            row["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            row["completion_tokens"] += usage.get("completion_tokens", 0)
+            row["cached_tokens"] += usage.get("cached_tokens", 0)
+            row["estimated_calls"] += 1 if estimated else 0
+
+    def merge_rows(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Add rows as returned by rows() / SessionStore.load_usage().
+        """
+        with self._lock:
+            for item in rows:
+                row = self._rows.setdefault((item["stage"], item["model"]), {field: 0 for field in _FIELDS})
+                for field in _FIELDS:
+                    row[field] += int(item.get(field) or 0)
+
+    def rows(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = sorted(self._rows.items())
+        rows = []
+        for (stage, model), counts in items:
+            cost = cost_of(model, counts["prompt_tokens"], counts["completion_tokens"], counts["cached_tokens"], self.prices)
+            rows.append({"stage": stage, "model": model, **counts, "cost_usd": round(cost, 6) if cost is not None else None})
+        return rows
+
+    def summary(self) -> Dict[str, Any]:
+        rows = self.rows()
+        totals = {field: sum(row[field] for row in rows) for field in _FIELDS}
+        costs = [row["cost_usd"] for row in rows if row["cost_usd"] is not None]
+        by_stage: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            stage = by_stage.setdefault(row["stage"], {field: 0 for field in _FIELDS} | {"cost_usd": 0.0})
+            for field in _FIELDS:
+                stage[field] += row[field]
+            stage["cost_usd"] = round(stage["cost_usd"] + (row["cost_usd"] or 0.0), 6)
+        return {
+            **totals,
+            "cost_usd": round(sum(costs), 6) if costs else None,
+            "uncosted_models": sorted({row["model"] for row in rows if row["cost_usd"] is None}),
+            "by_stage": by_stage,
+        }
+
+
+def record_usage(stage: str, model: str, usage: Any, estimated: bool = False) -> Optional[Dict[str, int]]:
+    """
+    Record a response's usage into the active meter (no-op without one); returns the
+    normalized counts.
+    """
+    counts = usage if estimated else usage_from(usage)
+    meter = _active_meter.get()
+    if meter is not None:
+        meter.record(stage, model, counts, estimated=estimated)
+    return counts
+
+
+def format_usage(summary: Dict[str, Any]) -> str:
+    cost = summary.get("cost_usd")
+    cost_text = f" | ${cost:.4f}" if cost is not None else ""
+    return (
+        f"in {summary.get('prompt_tokens', 0)} (cached {summary.get('cached_tokens', 0)})"
+        f" / out {summary.get('completion_tokens', 0)} tokens, {summary.get('calls', 0)} calls{cost_text}"
+    )